@@ -0,0 +1,229 @@
+# app/astorage.py
+# ------------------------------------------------------------
+# API storage async untuk handler FastAPI (operasi sama dengan storage.py).
+# Query SQLite tidak lagi jalan di event loop:
+#  - baca  -> pool thread kecil (WAL: pembaca tidak saling blok)
+#  - tulis -> satu thread writer = antrian tulis berurutan
+#             (tidak ada writer yang saling tunggu busy_timeout)
+# Tiap thread memakai koneksi awet miliknya sendiri (storage._get_conn).
+#
+# ENV:
+#   DB_READ_THREADS  (default 2)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import storage
+
+READ_THREADS = max(1, int(os.getenv("DB_READ_THREADS", "2")))
+
+_READER: Optional[ThreadPoolExecutor] = None
+_WRITER: Optional[ThreadPoolExecutor] = None
+
+
+def _pools():
+    global _READER, _WRITER
+    if _READER is None:
+        _READER = ThreadPoolExecutor(READ_THREADS, thread_name_prefix="db-read")
+    if _WRITER is None:
+        _WRITER = ThreadPoolExecutor(1, thread_name_prefix="db-write")
+    return _READER, _WRITER
+
+
+async def _read(fn: Callable[..., Any], *args: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_pools()[0], fn, *args)
+
+
+async def _write(fn: Callable[..., Any], *args: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_pools()[1], fn, *args)
+
+
+def submit_write(fn: Callable[..., Any], *args: Any, on_error: Optional[Callable[[], None]] = None) -> None:
+    """Tulis fire-and-forget lewat antrian writer (untuk flush statistik dari event loop)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None:  # di luar event loop (mis. skrip) → langsung saja
+        try:
+            fn(*args)
+        except Exception as e:
+            print("[astorage] write failed:", e)
+            if on_error:
+                on_error()
+        return
+
+    def _done(fut):
+        if fut.exception() is not None:
+            print("[astorage] write failed:", fut.exception())
+            if on_error:
+                on_error()
+
+    loop.run_in_executor(_pools()[1], fn, *args).add_done_callback(_done)
+
+
+# ---------- invoices ----------
+async def create_invoice(user_id: int, groups: List[str], amount: int) -> Dict[str, Any]:
+    return await _write(storage.create_invoice, user_id, groups, amount)
+
+
+async def find_reusable_invoice(user_id: int, groups: List[str], amount: int, created_after: int) -> Optional[Dict[str, Any]]:
+    return await _read(storage.find_reusable_invoice, user_id, groups, amount, created_after)
+
+
+async def get_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
+    return await _read(storage.get_invoice, invoice_id)
+
+
+async def get_invoice_status(invoice_id: str) -> Optional[Dict[str, Any]]:
+    return await _read(storage.get_invoice_status, invoice_id)
+
+
+async def get_invoice_qr(invoice_id: str) -> Optional[Dict[str, Any]]:
+    return await _read(storage.get_invoice_qr, invoice_id)
+
+
+async def list_invoices(limit: int = 20) -> List[Dict[str, Any]]:
+    return await _read(storage.list_invoices, limit)
+
+
+async def update_invoice_status(invoice_id: str, status: str) -> Optional[Dict[str, Any]]:
+    return await _write(storage.update_invoice_status, invoice_id, status)
+
+
+async def mark_paid(invoice_id: str) -> Optional[Dict[str, Any]]:
+    return await _write(storage.mark_paid, invoice_id)
+
+
+async def set_invoice_qr(invoice_id: str, data: bytes, mime: str, text: Optional[str] = None) -> str:
+    return await _write(storage.set_invoice_qr, invoice_id, data, mime, text)
+
+
+async def get_qr_blob(blob_hash: str) -> Optional[Tuple[bytes, str]]:
+    return await _read(storage.get_qr_blob, blob_hash)
+
+
+async def ingest_paid_event(event_key: str, invoice_id: str) -> Optional[Dict[str, Any]]:
+    return await _write(storage.ingest_paid_event, event_key, invoice_id)
+
+
+async def ingest_paid_events(items: List[Tuple[str, str]]) -> List[Optional[Dict[str, Any]]]:
+    return await _write(storage.ingest_paid_events, items)
+
+
+async def list_open_invoices(created_after: int) -> Dict[str, int]:
+    return await _read(storage.list_open_invoices, created_after)
+
+
+# ---------- meta ----------
+async def get_meta(key: str) -> Optional[str]:
+    return await _read(storage.get_meta, key)
+
+
+async def set_meta(key: str, value: str) -> None:
+    await _write(storage.set_meta, key, value)
+
+
+# ---------- selector stats ----------
+async def load_selector_stats() -> List[Dict[str, Any]]:
+    return await _read(storage.load_selector_stats)
+
+
+# ---------- retention ----------
+async def expire_pending(created_before: int, limit: int) -> List[str]:
+    return await _write(storage.expire_pending, created_before, limit)
+
+
+async def drop_qr(before: int, limit: int) -> List[str]:
+    return await _write(storage.drop_qr, before, limit)
+
+
+async def delete_orphan_blobs(limit: int) -> int:
+    return await _write(storage.delete_orphan_blobs, limit)
+
+
+async def prune_webhook_events(before: int, limit: int) -> int:
+    return await _write(storage.prune_webhook_events, before, limit)
+
+
+async def select_archivable(created_before: int, limit: int) -> List[Dict[str, Any]]:
+    return await _read(storage.select_archivable, created_before, limit)
+
+
+async def delete_invoices(invoice_ids: List[str]) -> int:
+    return await _write(storage.delete_invoices, invoice_ids)
+
+
+async def auto_vacuum_mode() -> int:
+    return await _read(storage.auto_vacuum_mode)
+
+
+async def incremental_vacuum(pages: int) -> int:
+    return await _write(storage.incremental_vacuum, pages)
+
+
+# ---------- qr jobs ----------
+async def claim_qr_job(invoice_id: str, owner: str, stale_after: int = 120) -> bool:
+    return await _write(storage.claim_qr_job, invoice_id, owner, stale_after)
+
+
+async def release_qr_job(invoice_id: str, owner: str) -> None:
+    await _write(storage.release_qr_job, invoice_id, owner)
+
+
+async def get_qr_job(invoice_id: str) -> Optional[Dict[str, Any]]:
+    return await _read(storage.get_qr_job, invoice_id)
+
+
+# ---------- invite outbox ----------
+async def enqueue_invites(invoice_id: str, user_id: int, group_ids: List[str]) -> int:
+    return await _write(storage.enqueue_invites, invoice_id, user_id, group_ids)
+
+
+async def claim_invites(owner: str, lease_seconds: int, limit: int = 1) -> List[Dict[str, Any]]:
+    return await _write(storage.claim_invites, owner, lease_seconds, limit)
+
+
+async def complete_invite(job_id: int, owner: str, invoice_id: str, group_id: str, invite_link: Optional[str]) -> bool:
+    return await _write(storage.complete_invite, job_id, owner, invoice_id, group_id, invite_link)
+
+
+async def fail_invite(job_id: int, owner: str, invoice_id: str, group_id: str, error: str, retry_at: Optional[int]) -> None:
+    await _write(storage.fail_invite, job_id, owner, invoice_id, group_id, error, retry_at)
+
+
+async def requeue_failed_invites(invoice_id: str) -> int:
+    return await _write(storage.requeue_failed_invites, invoice_id)
+
+
+async def list_outbox(invoice_id: str) -> List[Dict[str, Any]]:
+    return await _read(storage.list_outbox, invoice_id)
+
+
+async def outbox_counts() -> Dict[str, int]:
+    return await _read(storage.outbox_counts)
+
+
+# ---------- invite logs ----------
+async def add_invite_log(invoice_id: str, group_id: str, invite_link: str | None, error: str | None):
+    await _write(storage.add_invite_log, invoice_id, group_id, invite_link, error)
+
+
+async def list_invite_logs(invoice_id: str):
+    return await _read(storage.list_invite_logs, invoice_id)
+
+
+# ---------- lifecycle ----------
+async def shutdown():
+    """Selesaikan antrian tulis, lalu tutup koneksi."""
+    global _READER, _WRITER
+    for pool in (_WRITER, _READER):
+        if pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown, True)
+    _READER = _WRITER = None
+    storage.close()
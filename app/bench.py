@@ -0,0 +1,146 @@
+# app/bench.py
+# ------------------------------------------------------------
+# Benchmark generate QR (jalur Playwright).
+#
+#   python -m app.bench --standin --jobs 20 --concurrency 6
+#   python -m app.bench --standin --standin-query "checkout=iframe&qr=canvas&latency=200"
+#   python -m app.bench --live --jobs 5            (saweria.co asli!)
+#
+# --standin menjalankan stand-in lokal (standin.py) di thread terpisah dan
+# mengarahkan PROFILE_URL ke sana, jadi tidak ada donasi sungguhan.
+# Tanpa --standin target = SAWERIA_PROFILE_URL / saweria.co dan wajib --live.
+#
+# Bandingkan konfigurasi lewat ENV, mis.:
+#   BROWSER_POOL_SIZE=1 | 3, SCRAPER_PROCESS_WORKERS=3, SCRAPER_WARM_POOL_SIZE=0
+#
+# Laporan: p50/p95/p99 latency, throughput, peak RSS Chromium, cabang fallback.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+def _pct(values, q: float) -> float:
+    vals = sorted(values)
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_standin(port: int):
+    """Stand-in di thread sendiri (loop sendiri) supaya RSS-nya tidak terhitung sebagai Chromium."""
+    import uvicorn
+    from .standin import app as standin_app
+
+    server = uvicorn.Server(uvicorn.Config(standin_app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="standin", daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise SystemExit("stand-in gagal start")
+        time.sleep(0.05)
+    return server
+
+
+async def _sample_rss(stop: asyncio.Event, peak: list):
+    from .browser import chromium_rss_bytes
+    while not stop.is_set():
+        peak[0] = max(peak[0], await asyncio.to_thread(chromium_rss_bytes))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def bench(jobs: int, concurrency: int, amount: int):
+    from . import scheduler, scraper, timings, workers
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            t0 = time.monotonic()
+            try:
+                png = await scraper.fetch_gopay_qr_hd_png(
+                    invoice_id=str(uuid.uuid4()), amount=amount, deadline=600,
+                )
+                ok = bool(png)
+            except Exception as e:
+                print("[bench] job error:", e)
+                ok = False
+            return ok, time.monotonic() - t0
+
+    # pemanasan: warm pool / Chromium pertama tidak ikut diukur
+    await scraper.warm_pool_start()
+    await one()
+    timings.reset()
+
+    stop, peak = asyncio.Event(), [0]
+    sampler = asyncio.create_task(_sample_rss(stop, peak))
+    t0 = time.monotonic()
+    results = await asyncio.gather(*(one() for _ in range(jobs)))
+    wall = time.monotonic() - t0
+    stop.set()
+    await sampler
+
+    lat = [dt for ok, dt in results if ok]
+    print("---- bench ----")
+    print(f"target   : {scraper.PROFILE_URL}")
+    print(f"config   : BROWSER_POOL_SIZE={os.getenv('BROWSER_POOL_SIZE', '1')} "
+          f"SCRAPER_PROCESS_WORKERS={workers.PROCESS_WORKERS} "
+          f"warm_pool={scraper.WARM_POOL_SIZE} max_concurrency={scheduler.MAX_CONCURRENCY}")
+    print(f"jobs     : {jobs} (ok={len(lat)}, fail={jobs - len(lat)}), client concurrency={concurrency}")
+    print(f"wall     : {wall:.1f}s  throughput={len(lat) / wall * 60:.1f} QR/min")
+    if lat:
+        print(f"latency  : p50={_pct(lat, 0.50):.2f}s p95={_pct(lat, 0.95):.2f}s "
+              f"p99={_pct(lat, 0.99):.2f}s max={max(lat):.2f}s")
+    print(f"rss peak : {peak[0] / 1024 / 1024:.0f} MiB (Chromium + driver)")
+    if workers.enabled():
+        print("branches : (tercatat di proses worker)")
+    else:
+        for kind, counts in sorted(timings.snapshot()["branches"].items()):
+            print(f"branches : {kind} {counts}")
+
+    await scraper.shutdown()
+    await scheduler.shutdown()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark QR scraper")
+    ap.add_argument("--jobs", type=int, default=10)
+    ap.add_argument("--concurrency", type=int, default=5)
+    ap.add_argument("--amount", type=int, default=25000)
+    ap.add_argument("--standin", action="store_true", help="jalankan stand-in lokal dan arahkan scraper ke sana")
+    ap.add_argument("--standin-query", default="", help="opsi stand-in, mis. 'checkout=iframe&qr=canvas'")
+    ap.add_argument("--live", action="store_true", help="wajib untuk target asli: job membuat donasi sungguhan")
+    args = ap.parse_args()
+
+    if args.standin:
+        port = _free_port()
+        _start_standin(port)
+        url = f"http://127.0.0.1:{port}/bench" + (f"?{args.standin_query}" if args.standin_query else "")
+        os.environ["SAWERIA_PROFILE_URL"] = url  # diwarisi proses worker (spawn)
+
+    from . import scraper
+    if args.standin:
+        scraper.PROFILE_URL = os.environ["SAWERIA_PROFILE_URL"]
+    if not scraper.PROFILE_URL:
+        raise SystemExit("SAWERIA_USERNAME / SAWERIA_PROFILE_URL belum di-set")
+    if not args.standin and not args.live:
+        raise SystemExit(f"target {scraper.PROFILE_URL} membuat donasi sungguhan; tambahkan --live atau pakai --standin")
+    asyncio.run(bench(args.jobs, args.concurrency, args.amount))
+
+
+if __name__ == "__main__":
+    main()
@@ -370,8 +370,13 @@ async def _create_link_with_retry(bot, chat_id, **kwargs):
         print("[invite] create_chat_invite_link failed:", last_err)
     return None
 
-async def send_invite_link(app: Application, user_id: int, target_group_id):
-    """Kirim 1 undangan untuk 1 grup (dipanggil dari main.py)."""
+async def send_invite_link(app: Application, user_id: int, target_group_id, notify_failure: bool = True) -> Optional[str]:
+    """
+    Kirim 1 undangan untuk 1 grup (dipanggil dari invites.py).
+    Return link yang terkirim, None kalau link tidak bisa dibuat
+    (user diberi tahu bila notify_failure). Gagal kirim DM -> exception
+    (supaya outbox bisa retry).
+    """
     group_id_norm = await _to_int_or_str(target_group_id)
     group_id_str  = str(target_group_id)
     group_name    = GROUP_NAME_BY_ID.get(group_id_str, group_id_str)
@@ -396,15 +401,16 @@ async def send_invite_link(app: Application, user_id: int, target_group_id):
             print(f"[invite] export_chat_invite_link failed for {group_id_str}:", e)
 
     if not invite_link_url:
-        try:
-            await app.bot.send_message(
-                chat_id=user_id,
-                text=f"⚠️ Gagal membuat undangan untuk grup: {group_name}\n"
-                     f"Pastikan bot adalah admin/diizinkan membuat link di grup tsb."
-            )
-        except Exception as e:
-            print("[invite] notify user failed:", e)
-        return
+        if notify_failure:
+            try:
+                await app.bot.send_message(
+                    chat_id=user_id,
+                    text=f"⚠️ Gagal membuat undangan untuk grup: {group_name}\n"
+                         f"Pastikan bot adalah admin/diizinkan membuat link di grup tsb."
+                )
+            except Exception as e:
+                print("[invite] notify user failed:", e)
+        return None
 
     try:
         await app.bot.send_message(
@@ -413,6 +419,8 @@ async def send_invite_link(app: Application, user_id: int, target_group_id):
         )
     except Exception as e:
         print("[invite] send DM failed:", e)
+        raise
+    return invite_link_url
 
 # ===================== REGISTER HANDLERS =====================
 
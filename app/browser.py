@@ -0,0 +1,312 @@
+# app/browser.py
+# ------------------------------------------------------------
+# Lifecycle Chromium untuk scraper:
+#  - launch lazy, health-check (is_connected) sebelum tiap context baru
+#  - relaunch otomatis setelah disconnect/crash
+#  - recycle setelah N context atau RSS Chromium > ambang:
+#       browser baru langsung dipakai untuk context baru,
+#       browser lama ditutup setelah semua context-nya selesai (drain)
+#  - close() bersih saat shutdown FastAPI
+#  - counter: launches, recycles, crashes
+#  - pool beberapa instance Chromium; context baru ke instance paling sepi
+#
+# ENV:
+#   BROWSER_POOL_SIZE     jumlah instance Chromium (default 1)
+#   BROWSER_MAX_CONTEXTS  recycle setelah sekian context per instance (default 200, 0=mati)
+#   BROWSER_MAX_RSS_MB    recycle instance kalau RSS Chromium-nya (proses utama +
+#                         renderer/GPU/utility) > MB (default 1500, 0=mati); batas
+#                         per instance, bukan total pool
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from playwright.async_api import async_playwright
+
+POOL_SIZE = max(1, int(os.getenv("BROWSER_POOL_SIZE", "1")))
+MAX_CONTEXTS = int(os.getenv("BROWSER_MAX_CONTEXTS", "200"))
+MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1500"))
+RSS_CHECK_INTERVAL = 10.0
+
+LAUNCH_ARGS = [
+    "--no-sandbox",
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-blink-features=AutomationControlled",
+]
+
+
+def _proc_parents() -> Dict[int, int]:
+    """pid -> ppid untuk semua proses (dari /proc). Linux only; lain = {}."""
+    parent: Dict[int, int] = {}
+    try:
+        names = os.listdir("/proc")
+    except Exception:
+        return parent
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                stat = f.read()
+            # field setelah "(comm)": state ppid ...
+            parent[int(name)] = int(stat.rsplit(")", 1)[1].split()[1])
+        except Exception:
+            continue
+    return parent
+
+
+def _descendants(root: int, parent: Dict[int, int]) -> List[int]:
+    out = []
+    for pid in parent:
+        p, seen = parent.get(pid), 0
+        while p and p != root and seen < 64:
+            p, seen = parent.get(p), seen + 1
+        if p == root:
+            out.append(pid)
+    return out
+
+
+def _rss(pids) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except Exception:
+            continue
+    return total
+
+
+def _is_chromium(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            comm = f.read().lower()
+        return "chrom" in comm or "headless" in comm
+    except Exception:
+        return False
+
+
+def chromium_rss_bytes(root: Optional[int] = None) -> int:
+    """
+    RSS pohon proses di bawah `root` (termasuk root). Default: semua turunan
+    proses ini (driver + semua Chromium). Linux only; lain = 0.
+    """
+    try:
+        parent = _proc_parents()
+        if root is None:
+            return _rss(_descendants(os.getpid(), parent))
+        if root not in parent:
+            return 0
+        return _rss([root, *_descendants(root, parent)])
+    except Exception:
+        return 0
+
+
+def _chromium_roots() -> set:
+    """pid proses utama Chromium (induknya bukan Chromium) di bawah proses ini."""
+    try:
+        parent = _proc_parents()
+        return {
+            pid for pid in _descendants(os.getpid(), parent)
+            if _is_chromium(pid) and not _is_chromium(parent.get(pid, 0))
+        }
+    except Exception:
+        return set()
+
+
+class _Slot:
+    """Satu instance Chromium + hitungan context yang sedang terbuka."""
+
+    def __init__(self, browser, generation: int, index: int):
+        self.browser = browser
+        self.index = index
+        self.generation = generation
+        self.inflight = 0
+        self.contexts = 0
+        self.launched_at = time.time()
+        self.retiring = False
+        self.closing = False
+        self.pid: Optional[int] = None  # proses utama Chromium (untuk RSS per instance)
+        self.rss = 0
+        self.rss_checked = 0.0
+
+
+class BrowserManager:
+    def __init__(self, pool_size: int = POOL_SIZE):
+        self._play = None
+        self.pool_size = max(1, pool_size)
+        self._active: List[Optional[_Slot]] = [None] * self.pool_size
+        self._retiring: List[_Slot] = []
+        self._ctx_slot: Dict[int, _Slot] = {}
+        self._lock = asyncio.Lock()
+        self._generation = 0
+        self._closed = False
+        self.counters = {"launches": 0, "recycles": 0, "crashes": 0, "contexts": 0}
+
+    # ---------- launch / health ----------
+    async def _launch(self, index: int) -> _Slot:
+        if self._play is None:
+            self._play = await async_playwright().start()
+        before = await asyncio.to_thread(_chromium_roots)
+        browser = await self._play.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        new_roots = await asyncio.to_thread(_chromium_roots) - before
+        self._generation += 1
+        slot = _Slot(browser, self._generation, index)
+        # launch diserialkan oleh _lock → tepat satu root baru = milik browser ini
+        slot.pid = new_roots.pop() if len(new_roots) == 1 else None
+        browser.on("disconnected", lambda _b, s=slot: self._on_disconnected(s))
+        self.counters["launches"] += 1
+        print(f"[browser] launched chromium #{index} gen={slot.generation}")
+        return slot
+
+    def _on_disconnected(self, slot: _Slot):
+        if slot.closing or self._closed:
+            return
+        self.counters["crashes"] += 1
+        print(f"[browser] chromium #{slot.index} gen={slot.generation} disconnected unexpectedly")
+        if self._active[slot.index] is slot:
+            self._active[slot.index] = None
+        if slot in self._retiring:
+            self._retiring.remove(slot)
+
+    def _healthy(self, slot: Optional[_Slot]) -> bool:
+        if slot is None:
+            return False
+        try:
+            return slot.browser.is_connected()
+        except Exception:
+            return False
+
+    async def _needs_recycle(self, slot: _Slot) -> bool:
+        if MAX_CONTEXTS and slot.contexts >= MAX_CONTEXTS:
+            return True
+        if MAX_RSS_MB:
+            now = time.monotonic()
+            if now - slot.rss_checked >= RSS_CHECK_INTERVAL:
+                slot.rss_checked = now
+                if slot.pid is not None:
+                    slot.rss = await asyncio.to_thread(chromium_rss_bytes, slot.pid)
+                else:
+                    # pid tidak terdeteksi (non-Linux / launch paralel): bagi rata total
+                    live = sum(1 for s in self._active if s is not None) + len(self._retiring)
+                    slot.rss = await asyncio.to_thread(chromium_rss_bytes) // max(1, live)
+            if slot.rss > MAX_RSS_MB * 1024 * 1024:
+                return True
+        return False
+
+    def _pick_index(self) -> int:
+        """Instance paling sepi (inflight terkecil); slot kosong dihitung 0."""
+        def load(i: int):
+            slot = self._active[i]
+            return (slot.inflight if slot is not None else 0, i)
+        return min(range(self.pool_size), key=load)
+
+    async def _active_slot(self) -> _Slot:
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError("browser manager sudah ditutup")
+            idx = self._pick_index()
+            slot = self._active[idx]
+            if slot is not None and not self._healthy(slot):
+                self._on_disconnected(slot)
+                slot = None
+            if slot is not None and await self._needs_recycle(slot):
+                print(f"[browser] recycling #{idx} gen={slot.generation} (contexts={slot.contexts})")
+                self.counters["recycles"] += 1
+                slot.retiring = True
+                self._retiring.append(slot)
+                self._active[idx] = slot = None
+                await self._reap()
+            if slot is None:
+                slot = self._active[idx] = await self._launch(idx)
+            # dihitung di dalam lock: pemanggil paralel berikutnya melihat beban ini
+            slot.inflight += 1
+            return slot
+
+    async def _close_slot(self, slot: _Slot):
+        slot.closing = True
+        try:
+            await slot.browser.close()
+        except Exception:
+            pass
+        print(f"[browser] closed chromium #{slot.index} gen={slot.generation}")
+
+    async def _reap(self):
+        """Tutup browser retiring yang sudah tidak punya context (drain selesai)."""
+        for slot in [s for s in self._retiring if s.inflight <= 0]:
+            self._retiring.remove(slot)
+            await self._close_slot(slot)
+
+    # ---------- API ----------
+    async def new_context(self, **options: Any):
+        """Context baru di browser aktif; relaunch sekali kalau browser mati di tengah jalan."""
+        for attempt in (1, 2):
+            slot = await self._active_slot()  # inflight slot sudah +1
+            try:
+                context = await slot.browser.new_context(**options)
+            except BaseException as e:  # termasuk CancelledError: slot tidak boleh "bocor"
+                slot.inflight -= 1
+                if slot.retiring and slot.inflight <= 0:
+                    async with self._lock:
+                        await self._reap()
+                if not isinstance(e, Exception) or attempt == 2 or self._healthy(slot):
+                    raise
+                self._on_disconnected(slot)
+                continue
+            slot.contexts += 1
+            self.counters["contexts"] += 1
+            self._ctx_slot[id(context)] = slot
+            return context
+        raise RuntimeError("unreachable")
+
+    async def context_closed(self, context):
+        slot = self._ctx_slot.pop(id(context), None)
+        if slot is None:
+            return
+        slot.inflight -= 1
+        if slot.retiring and slot.inflight <= 0:
+            async with self._lock:
+                await self._reap()
+
+    def is_current(self, context) -> bool:
+        """False kalau context milik browser yang sedang di-recycle / sudah mati."""
+        slot = self._ctx_slot.get(id(context))
+        return slot is not None and slot is self._active[slot.index] and not slot.retiring
+
+    async def close(self):
+        async with self._lock:
+            self._closed = True
+            slots = [s for s in self._active if s is not None] + self._retiring
+            self._active, self._retiring = [None] * self.pool_size, []
+            for slot in slots:
+                await self._close_slot(slot)
+            self._ctx_slot.clear()
+            if self._play is not None:
+                try:
+                    await self._play.stop()
+                except Exception:
+                    pass
+                self._play = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "pool_size": self.pool_size,
+            "instances": [
+                {"index": s.index, "generation": s.generation, "contexts": s.contexts,
+                 "inflight": s.inflight, "rss_mb": round(s.rss / 1024 / 1024, 1)}
+                for s in self._active if s is not None
+            ],
+            "inflight": sum(s.inflight for s in self._active if s is not None)
+                        + sum(s.inflight for s in self._retiring),
+            "retiring": len(self._retiring),
+            "rss_mb": round(chromium_rss_bytes() / 1024 / 1024, 1),
+        }
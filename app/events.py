@@ -0,0 +1,61 @@
+# app/events.py
+# ------------------------------------------------------------
+# Pub/sub in-process per invoice (untuk SSE /api/invoice/{id}/events):
+#   q = events.subscribe(invoice_id)  ...  events.unsubscribe(invoice_id, q)
+#   events.publish(invoice_id, "paid", {...})
+#
+# Event: "qr_ready", "paid", "expired".
+# Hanya dalam satu proses; perubahan dari proses lain ditangkap lewat
+# pengecekan status berkala di endpoint SSE (lihat main.py).
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, Optional, Set, Tuple
+
+QUEUE_MAX = 16  # event per subscriber; subscriber lambat → event lama dibuang
+
+_SUBS: Dict[str, Set[asyncio.Queue]] = {}
+_published = 0
+
+
+def subscribe(invoice_id: str) -> asyncio.Queue:
+    q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX)
+    _SUBS.setdefault(invoice_id, set()).add(q)
+    return q
+
+
+def unsubscribe(invoice_id: str, q: asyncio.Queue) -> None:
+    subs = _SUBS.get(invoice_id)
+    if subs is None:
+        return
+    subs.discard(q)
+    if not subs:
+        _SUBS.pop(invoice_id, None)
+
+
+def publish(invoice_id: str, event: str, data: Optional[Dict[str, Any]] = None) -> int:
+    """Kirim event ke semua subscriber invoice ini (non-blocking). Return jumlah penerima."""
+    global _published
+    subs = _SUBS.get(invoice_id)
+    if not subs:
+        return 0
+    item: Tuple[str, Dict[str, Any]] = (event, {"invoice_id": invoice_id, **(data or {})})
+    for q in list(subs):
+        if q.full():
+            try:
+                q.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        q.put_nowait(item)
+    _published += 1
+    return len(subs)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "invoices": len(_SUBS),
+        "subscribers": sum(len(s) for s in _SUBS.values()),
+        "published": _published,
+    }
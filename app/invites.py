@@ -0,0 +1,178 @@
+# app/invites.py
+# ------------------------------------------------------------
+# Pengiriman undangan lewat outbox (tabel invite_outbox, lihat storage.py):
+#  - webhook / fallback status cukup enqueue_for_invoice() → balas cepat
+#  - satu job per (invoice, grup) (UNIQUE) → enqueue berulang tidak dobel
+#  - worker async mengambil job dengan lease; lease kedaluwarsa (proses mati)
+#    diambil alih proses lain
+#  - gagal → retry dengan backoff eksponensial + jitter; Forbidden/BadRequest
+#    (user blokir bot, grup salah) tidak di-retry
+#
+# Catatan: crash tepat setelah DM terkirim tapi sebelum job ditandai sent
+# membuat job dikirim ulang setelah lease habis (at-least-once pada crash).
+#
+# ENV:
+#   INVITE_WORKERS           jumlah worker (default 2, 0=mati)
+#   INVITE_LEASE_SEC         (default 60)
+#   INVITE_MAX_ATTEMPTS      (default 5)
+#   INVITE_BACKOFF_BASE_SEC  (default 2)
+#   INVITE_BACKOFF_MAX_SEC   (default 300)
+#   INVITE_POLL_SEC          jeda cek outbox saat idle (default 2)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from . import astorage
+
+WORKERS = int(os.getenv("INVITE_WORKERS", "2"))
+LEASE_SEC = int(os.getenv("INVITE_LEASE_SEC", "60"))
+MAX_ATTEMPTS = max(1, int(os.getenv("INVITE_MAX_ATTEMPTS", "5")))
+BACKOFF_BASE_SEC = float(os.getenv("INVITE_BACKOFF_BASE_SEC", "2"))
+BACKOFF_MAX_SEC = float(os.getenv("INVITE_BACKOFF_MAX_SEC", "300"))
+POLL_SEC = float(os.getenv("INVITE_POLL_SEC", "2"))
+
+_OWNER = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_TASKS: List[asyncio.Task] = []
+_WAKE: Optional[asyncio.Event] = None
+_BOT_APP = None
+_STATS = {"sent": 0, "retried": 0, "failed": 0}
+
+
+def _wake() -> asyncio.Event:
+    global _WAKE
+    if _WAKE is None:
+        _WAKE = asyncio.Event()
+    return _WAKE
+
+
+def _groups_of(inv: Dict[str, Any]) -> List[str]:
+    groups = inv.get("groups")
+    if groups is None:
+        try:
+            groups = json.loads(inv.get("groups_json") or "[]")
+        except Exception:
+            groups = []
+    return [str(g) for g in groups or []]
+
+
+def wake() -> None:
+    """Bangunkan worker (job baru diantrikan di luar enqueue_for_invoice)."""
+    _wake().set()
+
+
+async def enqueue_for_invoice(inv: Dict[str, Any]) -> int:
+    """Antrikan undangan semua grup invoice (idempotent). Return jumlah job baru."""
+    groups = _groups_of(inv)
+    if not groups:
+        return 0
+    n = await astorage.enqueue_invites(inv["invoice_id"], int(inv["user_id"]), groups)
+    if n:
+        _wake().set()
+    return n
+
+
+async def requeue_failed(invoice_id: str) -> int:
+    n = await astorage.requeue_failed_invites(invoice_id)
+    if n:
+        _wake().set()
+    return n
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def _deliver(job: Dict[str, Any], owner: str) -> None:
+    from .bot import send_invite_link  # import lambat: bot.py butuh BOT_TOKEN
+
+    gid = job["group_id"]
+    try:
+        gid_norm: Any = int(gid)
+    except ValueError:
+        gid_norm = gid
+    last = job["attempts"] >= MAX_ATTEMPTS
+
+    retry_after: Optional[float] = None
+    try:
+        link = await send_invite_link(_BOT_APP, job["user_id"], gid_norm, notify_failure=last)
+        if link:
+            await astorage.complete_invite(job["id"], owner, job["invoice_id"], gid, link)
+            _STATS["sent"] += 1
+            return
+        error, permanent = "invite link could not be created", False
+    except (Forbidden, BadRequest) as e:
+        error, permanent = f"{type(e).__name__}: {e}", True
+    except RetryAfter as e:
+        error, permanent = f"RetryAfter: {e}", False
+        retry_after = float(getattr(e, "retry_after", 0) or 0)
+    except Exception as e:
+        error, permanent = f"{type(e).__name__}: {e}", False
+
+    if permanent or last:
+        await astorage.fail_invite(job["id"], owner, job["invoice_id"], gid, error, None)
+        _STATS["failed"] += 1
+        print(f"[invites] {job['invoice_id']}/{gid} gagal permanen: {error}")
+        return
+    delay = max(retry_after or 0, _backoff(job["attempts"]))
+    await astorage.fail_invite(job["id"], owner, job["invoice_id"], gid, error, int(time.time() + delay))
+    _STATS["retried"] += 1
+    print(f"[invites] {job['invoice_id']}/{gid} percobaan {job['attempts']} gagal ({error}); retry {delay:.0f}s")
+
+
+async def _worker(idx: int):
+    owner = f"{_OWNER}-{idx}"
+    wake = _wake()
+    while True:
+        try:
+            jobs = await astorage.claim_invites(owner, LEASE_SEC, 1)
+        except Exception as e:
+            print("[invites] claim failed:", e)
+            jobs = []
+        if not jobs:
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _deliver(jobs[0], owner)
+        except Exception as e:
+            # gagal tulis hasil; lease habis → job diambil ulang
+            print("[invites] deliver failed:", e)
+
+
+def start(bot_app) -> None:
+    """Dipanggil dari main.on_start setelah bot_app.initialize()."""
+    global _BOT_APP
+    _BOT_APP = bot_app
+    if WORKERS <= 0 or _TASKS:
+        return
+    loop = asyncio.get_running_loop()
+    _TASKS.extend(loop.create_task(_worker(i)) for i in range(WORKERS))
+
+
+async def stop() -> None:
+    for t in _TASKS:
+        t.cancel()
+    for t in _TASKS:
+        try:
+            await t
+        except (asyncio.CancelledError, Exception):
+            pass
+    _TASKS.clear()
+
+
+def stats() -> Dict[str, Any]:
+    return {"workers": len(_TASKS), **_STATS}
@@ -7,15 +7,15 @@ from typing import Optional, List
 from pydantic import BaseModel
 from fastapi import FastAPI, Request, HTTPException, Query
 app = FastAPI()
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
 from telegram import Update, Bot
 from telegram.ext import Application
 from telegram.error import Forbidden, BadRequest
 
-from .bot import build_app, register_handlers, send_invite_link
-from . import payments, storage
+from .bot import build_app, register_handlers
+from . import payments, storage, astorage, scheduler, selector_stats, saweria_http, qr, timings, retention, events, invites, reconcile
 from copy import deepcopy
 
 # === penting: import fungsi scraper (signature baru: invoice_id & amount)
@@ -24,6 +24,10 @@ from .scraper import (
     debug_fill_snapshot,
     fetch_gopay_checkout_png,
     fetch_gopay_qr_hd_png,
+    warm_pool_start,
+    net_stats as scraper_net_stats,
+    browser_stats,
+    shutdown as scraper_shutdown,
 )
 
 # ------------- ENV -------------
@@ -32,6 +36,10 @@ bot_check = Bot(BOT_TOKEN)
 BASE_URL = os.environ["BASE_URL"].strip()
 WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
 ENV = os.getenv("ENV", "dev")  # "prod" di Railway untuk mematikan debug endpoints
+# SSE /api/invoice/{id}/events: umur maks. stream (client reconnect otomatis) &
+# jeda cek status ke DB/cache (menangkap perubahan dari proses lain) + ping
+SSE_MAX_SECONDS = int(os.getenv("SSE_MAX_SECONDS", "600"))
+SSE_RECHECK_SECONDS = float(os.getenv("SSE_RECHECK_SECONDS", "15"))
 
 # was:
 # IMAGEKIT_PUBLIC_KEY = os.getenv("IMAGEKIT_PUBLIC_KEY", "").strip()
@@ -288,47 +296,6 @@ storage.init_db()
 bot_app: Application = build_app()
 register_handlers(bot_app)
 
-# >>> helper kirim undangan (idempotent-ish)
-async def _send_invites_for_invoice(inv: dict) -> None:
-    try:
-        groups = json.loads(inv.get("groups_json") or "[]")
-    except Exception:
-        groups = []
-    if not groups:
-        return
-
-    logs = storage.list_invite_logs(inv["invoice_id"])
-    already = { str(l.get("group_id")) for l in logs if l.get("group_id") }
-
-    for gid in groups:
-        gid_str = str(gid)
-        if gid_str in already:
-            continue
-
-        # normalisasi id telegram
-        try:
-            gid_norm = int(gid_str)
-        except Exception:
-            gid_norm = gid_str
-
-        # kirim link
-        try:
-            await send_invite_link(bot_app, inv["user_id"], gid_norm)
-            try:
-                storage.add_invite_log(inv["invoice_id"], gid_str, "(sent)", None)
-            except Exception as e:
-                print("[invite-log] failed to insert success log:", e)
-        except Exception as e:
-            # catat error tanpa menghentikan loop grup lainnya
-            try:
-                storage.add_invite_log(inv["invoice_id"], gid_str, None, str(e))
-            except Exception as e2:
-                print("[invite-log] failed to insert error log:", e2)
-
-        await asyncio.sleep(0.7)  # throttle ringan
-
-
-
 # Serve Mini App statics
 app.mount("/webapp", StaticFiles(directory="app/webapp", html=True), name="webapp")
 app.mount("/static", StaticFiles(directory="app/webapp"), name="static")
@@ -409,100 +376,172 @@ async def get_config():
 
 
 # ------------- API: STATUS & QR IMAGE -------------
-_DATA_URL_RE = re.compile(r"^data:(image/[^;]+);base64,(.+)$")
+
+def _busy_response(retry_after) -> Response:
+    """Scheduler Chromium penuh → 503 + Retry-After (client boleh ulang)."""
+    secs = max(1, int(retry_after or 1))
+    return Response(
+        content=b"Busy, retry later",
+        status_code=503,
+        headers={"Retry-After": str(secs), "Cache-Control": "no-store"},
+    )
 
 @app.get("/api/invoice/{invoice_id}/status")
 async def invoice_status(invoice_id: str):
-    st = payments.get_status(invoice_id)
+    st = await payments.get_status(invoice_id)
     if not st:
         raise HTTPException(404, "Invoice not found")
 
-    # Fallback auto-kirim undangan saat status sudah PAID
+    if (st.get("status") or "").upper() == "PAID":
+        await _invite_fallback(invoice_id)
+
+    return st
+
+
+async def _invite_fallback(invoice_id: str) -> None:
+    """
+    Fallback: invoice PAID tanpa job outbox DAN tanpa invite_logs (mis. PAID
+    sebelum ada outbox, undangan belum pernah dikirim) → antrikan undangan.
+    Jalur normal sudah mengantrikan lewat ingest; di sini cuma baca.
+    """
     try:
-        if (st.get("status") or "").upper() == "PAID":
-            logs = storage.list_invite_logs(invoice_id)
-            if not logs:
-                inv = payments.get_invoice(invoice_id)  # berisi user_id & groups_json
-                if inv:
-                    await _send_invites_for_invoice(inv)
+        if await astorage.list_outbox(invoice_id) or await astorage.list_invite_logs(invoice_id):
+            return
+        inv = await payments.get_invoice(invoice_id)  # berisi user_id & groups_json
+        if inv:
+            await invites.enqueue_for_invoice(inv)
     except Exception as e:
-        print("[invoice_status] auto-send invites failed:", e)
+        print("[invoice_status] enqueue invites failed:", e)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    return st
+
+@app.get("/api/invoice/{invoice_id}/events")
+async def invoice_events(invoice_id: str, request: Request):
+    """
+    Server-Sent Events: "status" (awal), "qr_ready", lalu "paid" / "expired"
+    (stream ditutup setelahnya). Webapp jatuh ke polling /status bila gagal.
+    """
+    q = events.subscribe(invoice_id)  # sebelum baca status: tidak ada event yang terlewat
+    st = await payments.get_status(invoice_id)
+    if not st:
+        events.unsubscribe(invoice_id, q)
+        raise HTTPException(404, "Invoice not found")
+
+    async def stream():
+        cur, qr_sent, from_event = st, False, False
+        deadline = asyncio.get_running_loop().time() + SSE_MAX_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            yield _sse("status", cur)
+            while True:
+                status = (cur.get("status") or "").upper()
+                if status == "PAID":
+                    yield _sse("paid", cur)
+                    # event "paid" = webhook di proses ini, yang juga mengirim undangan
+                    if not from_event:
+                        await _invite_fallback(invoice_id)
+                    return
+                if status == "EXPIRED":
+                    yield _sse("expired", cur)
+                    return
+                if cur.get("has_qr") and not qr_sent:
+                    qr_sent = True
+                    yield _sse("qr_ready", cur)
+
+                if asyncio.get_running_loop().time() > deadline or await request.is_disconnected():
+                    return
+                try:
+                    event, data = await asyncio.wait_for(q.get(), SSE_RECHECK_SECONDS)
+                    from_event = True
+                    if event == "qr_ready":
+                        cur = {**cur, "has_qr": True}
+                    else:
+                        cur = {**cur, **data}
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    cur, from_event = (await payments.get_status(invoice_id) or cur), False
+        finally:
+            events.unsubscribe(invoice_id, q)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
 
 
 # --- QR endpoint (disederhanakan; message dipaksa INV:<invoice_id> di scraper) ---
 @app.get("/api/qr/{raw_id}")
 async def qr_png(
     raw_id: str,
+    request: Request,
     amount: int | None = Query(None, description="Amount; jika None, ambil dari invoice"),
     wait: int = Query(0, description="Wait seconds for background cache (max 8)"),
     hd: bool = Query(True, description="(ignored; QR selalu HD bila tersedia)"),
+    size: int | None = Query(None, description="Lebar gambar (px); hanya untuk payload QRIS"),
+    fmt: str = Query("png", description="png | svg"),
 ):
-    # 1) Normalisasi ID: izinkan .../{invoice_id}.png atau .jpg
-    invoice_id = re.sub(r"\.(png|jpg|jpeg)$", "", raw_id, flags=re.I)
+    # 1) Normalisasi ID: izinkan .../{invoice_id}.png / .jpg / .svg
+    m = re.search(r"\.(png|jpg|jpeg|svg)$", raw_id, flags=re.I)
+    if m and m.group(1).lower() == "svg":
+        fmt = "svg"
+    invoice_id = raw_id[: m.start()] if m else raw_id
+
+    async def _image_response(ref: dict) -> Response:
+        etag = payments.qr_etag(ref, fmt, size)
+        headers = {"Cache-Control": "public, max-age=300"}
+        if etag:
+            headers["ETag"] = f'"{etag}"'
+            if f'"{etag}"' in (request.headers.get("if-none-match") or ""):
+                return Response(status_code=304, headers=headers)
+        img = await payments.qr_image(ref, fmt, size)
+        if not img:
+            raise HTTPException(400, "Bad image payload")
+        content, mime = img
+        # bytes blob dari SQLite dikirim langsung (tanpa base64 / salinan tambahan)
+        return Response(content=content, media_type=mime, headers=headers)
 
-    # 2) Ambil invoice dari DB
-    inv = payments.get_invoice(invoice_id)
-    if not inv:
+    # 2) Ambil referensi QR invoice dari DB (kolom sempit, tanpa bytes gambar)
+    ref = await payments.get_qr_ref(invoice_id)
+    if not ref:
         raise HTTPException(404, "Invoice not found")
 
     # 3) Amount
-    amt = inv.get("amount") or amount
+    amt = ref.get("amount") or amount
     if not isinstance(amt, int) or amt <= 0:
         raise HTTPException(400, "Invalid amount")
 
-    # 4) Jika sudah ada payload di DB → langsung kirim
-    payload = inv.get("qris_payload")
-    if payload:
-        m = _DATA_URL_RE.match(payload)
-        if not m:
-            raise HTTPException(400, "Bad image payload")
-        mime, b64 = m.groups()
-        return Response(
-            content=base64.b64decode(b64),
-            media_type=mime,
-            headers={"Cache-Control": "public, max-age=300"},
-        )
+    # 4) Jika sudah ada QR di DB → langsung kirim
+    if ref.get("qr_hash") or ref.get("qris_payload"):
+        return await _image_response(ref)
 
     # 5) Tunggu sebentar background (opsional)
     if wait and isinstance(wait, int) and wait > 0:
         for _ in range(min(wait, 8)):
             await asyncio.sleep(1)
-            inv2 = payments.get_invoice(invoice_id)
-            payload2 = inv2.get("qris_payload") if inv2 else None
-            if payload2:
-                m = _DATA_URL_RE.match(payload2)
-                if not m:
-                    break
-                mime, b64 = m.groups()
-                return Response(
-                    content=base64.b64decode(b64),
-                    media_type=mime,
-                    headers={"Cache-Control": "public, max-age=300"},
-                )
-
-    # 6) Generate on-demand (HD) + cache ke DB
-    try:
-        png = await fetch_gopay_qr_hd_png(invoice_id=invoice_id, amount=amt)
-        if not png:
-            return Response(content=b"QR not found", status_code=502)
+            ref2 = await payments.get_qr_ref(invoice_id)
+            if ref2 and (ref2.get("qr_hash") or ref2.get("qris_payload")):
+                return await _image_response(ref2)
 
-        try:
-            b64 = base64.b64encode(png).decode()
-            storage.update_qris_payload(invoice_id, f"data:image/png;base64,{b64}")
-        except Exception:
-            pass
-
-        return Response(
-            content=png,
-            media_type="image/png",
-            headers={"Cache-Control": "public, max-age=300"},
-        )
+    # 6) Generate on-demand (HD) + cache ke DB (single-flight per invoice)
+    try:
+        ref = await payments.get_or_generate_qr(invoice_id, amt)
+    except scheduler.SchedulerBusy as e:
+        return _busy_response(e.retry_after)
+    except scheduler.JobExpired:
+        return _busy_response(scheduler.stats()["avg_run_s"])
     except Exception as e:
         print("[qr_png] error:", e)
         return Response(content=b"Error", status_code=500)
 
+    if not ref:
+        return Response(content=b"QR not found", status_code=502)
+
+    return await _image_response(ref)
+
 
 # ------------- SAWERIA WEBHOOK -------------
 class SaweriaWebhookIn(BaseModel):
@@ -522,7 +561,17 @@ def _verify_saweria_signature(req: Request, raw_body: bytes) -> bool:
     calc = hmac.new(SAWERIA_WEBHOOK_SECRET.encode(), raw_body, hashlib.sha256).hexdigest()
     return hmac.compare_digest(calc, sig_hdr)
 
-INV_RE = re.compile(r"(?:^|\b)INV[:\s]*([0-9a-fA-F-]{36})\b")
+INV_RE = payments.INV_RE
+
+
+def _webhook_event_key(data: dict, raw: bytes) -> str:
+    """Kunci event stabil: id donasi/event dari Saweria, kalau tidak ada hash payload."""
+    for k in ("id", "donation_id", "event_id"):
+        v = data.get(k)
+        if v:
+            return f"{k}:{v}"
+    canon = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return "sha256:" + hashlib.sha256(canon.encode()).hexdigest()
 
 @app.post("/api/saweria/webhook")
 async def saweria_webhook(request: Request):
@@ -564,24 +613,17 @@ async def saweria_webhook(request: Request):
     if not invoice_id:
         raise HTTPException(400, "Cannot resolve invoice_id from payload")
 
-    # 4) Tandai PAID dan kirim undangan
-    inv = payments.mark_paid(invoice_id)
-    if not inv:
+    # 4) Idempotent: event yang sama (retry Saweria) cukup satu lookup.
+    #    Event baru → PAID + antrian undangan dalam satu transaksi;
+    #    undangan dikirim worker invites.py, bukan di sini.
+    res = await payments.ingest_paid_event(_webhook_event_key(data, raw), invoice_id)
+    if res is None:
         raise HTTPException(404, "Invoice not found")
-
-    try:
-        groups = json.loads(inv.get("groups_json") or "[]")
-    except Exception:
-        groups = []
-
-    for gid in groups:
-        try:
-            await send_invite_link(bot_app, inv["user_id"], gid)
-            storage.add_invite_log(inv["invoice_id"], gid, "(sent-via-webhook)", None)
-        except Exception as e:
-            storage.add_invite_log(inv["invoice_id"], gid, None, str(e))
-
-    return {"ok": True}
+    if res["duplicate"]:
+        return {"ok": True, "duplicate": True}
+    if res["queued"]:
+        invites.wake()
+    return {"ok": True, "queued": res["queued"]}
 
 
 # >>> endpoint manual trigger kirim undangan (debug)
@@ -589,11 +631,17 @@ async def saweria_webhook(request: Request):
 async def manual_send_invites(invoice_id: str, secret: Optional[str] = Query(None)):
     if WEBHOOK_SECRET and secret != WEBHOOK_SECRET:
         raise HTTPException(403, "Forbidden")
-    inv = payments.get_invoice(invoice_id)
+    inv = await payments.get_invoice(invoice_id)
     if not inv:
         raise HTTPException(404, "Invoice not found")
-    await _send_invites_for_invoice(inv)
-    return {"ok": True, "invoice_id": invoice_id, "logs": storage.list_invite_logs(invoice_id)}
+    # job gagal diulang; grup yang belum pernah diantrikan ditambahkan
+    requeued = await invites.requeue_failed(invoice_id)
+    queued = await invites.enqueue_for_invoice(inv)
+    return {
+        "ok": True, "invoice_id": invoice_id, "queued": queued, "requeued": requeued,
+        "outbox": await astorage.list_outbox(invoice_id),
+        "logs": await astorage.list_invite_logs(invoice_id),
+    }
 
 
 # ------------- HEALTH / DEBUG -------------
@@ -603,12 +651,39 @@ def health():
 
 if ENV != "prod":
     @app.get("/debug/invoices")
-    def debug_invoices(limit: int = 20):
-        return {"items": payments.list_invoices(limit)}
+    async def debug_invoices(limit: int = 20):
+        return {"items": await payments.list_invoices(limit)}
 
     @app.get("/debug/invite-logs/{invoice_id}")
-    def debug_invite_logs(invoice_id: str):
-        return {"invoice_id": invoice_id, "logs": storage.list_invite_logs(invoice_id)}
+    async def debug_invite_logs(invoice_id: str):
+        return {
+            "invoice_id": invoice_id,
+            "outbox": await astorage.list_outbox(invoice_id),
+            "logs": await astorage.list_invite_logs(invoice_id),
+        }
+
+    @app.get("/debug/scheduler")
+    def debug_scheduler():
+        return {
+            "scheduler": scheduler.stats(), "net": scraper_net_stats(),
+            "browser": browser_stats(), "qr_render_cache": qr.cache_info(),
+            "invoice_cache": payments.cache_stats(), "retention": retention.stats(),
+            "events": events.stats(), "invites": invites.stats(), "reconcile": reconcile.stats(),
+        }
+
+    @app.get("/debug/timings")
+    def debug_timings():
+        return timings.snapshot()
+
+    @app.post("/debug/timings/reset")
+    def debug_timings_reset():
+        snap = timings.snapshot()
+        timings.reset()
+        return snap
+
+    @app.get("/debug/selectors")
+    def debug_selectors():
+        return selector_stats.snapshot()
 
 # ---- DEBUG: tes HTTP fetch langsung (tanpa Chromium) ----
 @app.get("/debug/fetch-saweria")
@@ -625,30 +700,41 @@ async def debug_fetch_saweria():
     return {"url": url, "status": r.status_code, "len": len(r.text), "snippet": r.text[:300]}
 
 # ---- DEBUG: ambil PNG dari Chromium (Playwright) ----
+async def _run_debug_scrape(fn, **kwargs):
+    """Job debug prioritas paling rendah; antrian penuh → 503 + Retry-After."""
+    try:
+        return await fn(**kwargs)
+    except scheduler.SchedulerBusy as e:
+        raise HTTPException(503, "Scraper busy", headers={"Retry-After": str(e.retry_after)})
+    except scheduler.JobExpired:
+        raise HTTPException(503, "Scraper busy (job expired)", headers={"Retry-After": "5"})
+
 @app.get("/debug/saweria-snap")
 async def debug_saweria_snap():
-    png = await debug_snapshot()
+    png = await _run_debug_scrape(debug_snapshot)
     if not png:
         raise HTTPException(500, "Gagal snapshot (lihat logs)")
     return Response(content=png, media_type="image/png")
 
 @app.get("/debug/saweria-fill")
 async def debug_saweria_fill(invoice_id: str, amount: int = 25000, method: str = "gopay"):
-    png = await debug_fill_snapshot(invoice_id=invoice_id, amount=amount, method=method)
+    png = await _run_debug_scrape(debug_fill_snapshot, invoice_id=invoice_id, amount=amount, method=method)
     if not png:
         raise HTTPException(500, "Gagal snapshot setelah pengisian form (lihat logs)")
     return Response(content=png, media_type="image/png")
 
 @app.get("/debug/saweria-pay")
 async def debug_saweria_pay(invoice_id: str, amount: int = 25000):
-    png = await fetch_gopay_checkout_png(invoice_id=invoice_id, amount=amount)
+    png = await _run_debug_scrape(fetch_gopay_checkout_png, invoice_id=invoice_id, amount=amount)
     if not png:
         raise HTTPException(500, "Gagal menuju halaman pembayaran")
     return Response(content=png, media_type="image/png")
 
 @app.get("/debug/saweria-qr-hd")
 async def debug_saweria_qr_hd(invoice_id: str, amount: int = 25000):
-    png = await fetch_gopay_qr_hd_png(invoice_id=invoice_id, amount=amount)
+    png = await _run_debug_scrape(
+        fetch_gopay_qr_hd_png, invoice_id=invoice_id, amount=amount, priority=scheduler.PRIO_DEBUG
+    )
     if not png:
         raise HTTPException(500, "Gagal ambil QR HD")
     return Response(content=png, media_type="image/png")
@@ -680,10 +766,36 @@ async def on_start():
     except Exception as e:
         print("[startup] prewarm image folders failed:", e)
 
+    await selector_stats.load()  # urutan/timeout selector adaptif siap sebelum scrape pertama
+
+    # --- prewarm page profil Saweria (background; QR pertama tak perlu cold goto) ---
+    try:
+        await warm_pool_start()
+    except Exception as e:
+        print("[startup] warm pool start failed:", e)
+
+    retention.start()
+    invites.start(bot_app)
+    reconcile.start()
+
     await bot_app.start()
 
 
 @app.on_event("shutdown")
 async def on_stop():
+    await retention.stop()
+    await reconcile.stop()
+    await scheduler.shutdown()
+    try:
+        await scraper_shutdown()
+    except Exception as e:
+        print("[shutdown] scraper/browser close failed:", e)
+    await saweria_http.aclose()
+    try:
+        selector_stats.flush()
+    except Exception as e:
+        print("[shutdown] selector stats flush failed:", e)
+    await invites.stop()
     await bot_app.stop()
     await bot_app.shutdown()
+    await astorage.shutdown()
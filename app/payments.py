@@ -1,67 +1,159 @@
 # app/payments.py
 # ------------------------------------------------------------
-# Lapisan kecil di atas storage untuk:
+# Lapisan kecil di atas storage (versi async, lihat astorage.py) untuk:
 # - membuat invoice
 # - membaca status
 # - menandai PAID
 # - (opsional) generate QR HD di background dan cache ke DB
+# - single-flight generate QR per invoice (dalam proses + lintas proses via SQLite)
+# - payload QR disimpan sebagai teks QRIS (hasil decode) + PNG ukuran default
+#   di tabel qr_blobs (bytes mentah, dirujuk invoices.qr_hash); ukuran/format
+#   lain di-render ulang dari teks (lihat qr.py)
+# - cache baca invoice (LRU + TTL) untuk record, proyeksi status & referensi QR;
+#   di-invalidate saat status / QR berubah lewat modul ini
+# - event "qr_ready" / "paid" ke subscriber SSE (events.py)
+#
+# ENV:
+#   INVOICE_CACHE_SIZE   jumlah entri (default 2048, 0=mati)
+#   INVOICE_CACHE_TTL    detik (default 30). Perubahan dari proses lain baru
+#                        terlihat setelah TTL; turunkan kalau jalan multi-proses.
+#   INVOICE_REUSE_SEC    umur maks. invoice PENDING yang dipakai ulang untuk
+#                        user + grup + amount yang sama (default 600, 0=mati);
+#                        jaga di bawah masa berlaku QR Saweria
 # ------------------------------------------------------------
 
 from __future__ import annotations
 
 import asyncio
-import base64
-import json, time, uuid
-from typing import Any, Dict, List, Optional
+import hashlib
+import json, os, re, time, uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
-from . import storage
-from .scraper import fetch_gopay_qr_hd_png
+from . import astorage, events, qr
+from .scheduler import PRIO_BACKGROUND, PRIO_INTERACTIVE
+from .scraper import fetch_gopay_qr
+
+
+INVOICE_CACHE_SIZE = int(os.getenv("INVOICE_CACHE_SIZE", "2048"))
+INVOICE_CACHE_TTL = float(os.getenv("INVOICE_CACHE_TTL", "30"))
+INVOICE_REUSE_SEC = int(os.getenv("INVOICE_REUSE_SEC", "600"))
+
+
+# ---------- cache baca invoice ----------
+class _InvoiceCache:
+    """
+    LRU + TTL: (jenis, invoice_id) -> dict. Jenis: "inv" (record), "status", "qr".
+    Hanya dipakai dari event loop (tanpa lock). Hasil None tidak di-cache.
+
+    Generasi per invoice: ambil gen() SEBELUM baca DB, berikan ke put(); kalau
+    invalidate() terjadi selama baca masih menunggu, hasil (lama) tidak disimpan.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size, self.ttl = size, ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = self.misses = self.invalidations = 0
+        self._counter = 0
+        self._gens: "OrderedDict[str, int]" = OrderedDict()
+        self._gen_floor = 0  # generasi invoice yang sudah terbuang dari _gens
+
+    def gen(self, invoice_id: str) -> int:
+        return self._gens.get(invoice_id, self._gen_floor)
+
+    def get(self, kind: str, invoice_id: str) -> Optional[Dict[str, Any]]:
+        key = (kind, invoice_id)
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return dict(item[1])
+
+    def put(self, kind: str, invoice_id: str, value: Optional[Dict[str, Any]], gen: Optional[int] = None) -> None:
+        if value is None or self.size <= 0:
+            return
+        if gen is not None and gen != self.gen(invoice_id):
+            return  # di-invalidate selama baca berjalan → data bisa sudah basi
+        self._data[(kind, invoice_id)] = (time.monotonic() + self.ttl, dict(value))
+        self._data.move_to_end((kind, invoice_id))
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, invoice_id: str) -> None:
+        for kind in ("inv", "status", "qr"):
+            self._data.pop((kind, invoice_id), None)
+        self.invalidations += 1
+        self._counter += 1
+        self._gens[invoice_id] = self._counter
+        self._gens.move_to_end(invoice_id)
+        while len(self._gens) > max(1, self.size) * 4:
+            # generasi yang dibuang dianggap "baru berubah": put lama ikut ditolak
+            self._gen_floor = max(self._gen_floor, self._gens.popitem(last=False)[1])
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data), "max_size": self.size, "ttl_s": self.ttl,
+            "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+
+_CACHE = _InvoiceCache(INVOICE_CACHE_SIZE, INVOICE_CACHE_TTL)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return _CACHE.stats()
+
+
+def invalidate_cached(invoice_ids: List[str]) -> None:
+    """Untuk penulis di luar modul ini (mis. retention.py)."""
+    for invoice_id in invoice_ids:
+        _CACHE.invalidate(invoice_id)
 
 
 # ---------- util: panggil fungsi storage yang mungkin beda nama ----------
-def _storage_create_invoice(user_id: int, groups: List[str], amount: int) -> Dict[str, Any]:
+async def _storage_create_invoice(user_id: int, groups: List[str], amount: int) -> Dict[str, Any]:
     """
     Coba beberapa kemungkinan nama fungsi di storage agar fleksibel.
     Return: dict invoice (harus mengandung invoice_id / amount / groups_json / status, dsb.)
     """
-    if hasattr(storage, "create_invoice"):
-        return storage.create_invoice(user_id, groups, amount)  # type: ignore[attr-defined]
-    if hasattr(storage, "add_invoice"):
-        return storage.add_invoice(user_id, groups, amount)  # type: ignore[attr-defined]
+    if hasattr(astorage, "create_invoice"):
+        return await astorage.create_invoice(user_id, groups, amount)  # type: ignore[attr-defined]
+    if hasattr(astorage, "add_invoice"):
+        return await astorage.add_invoice(user_id, groups, amount)  # type: ignore[attr-defined]
     # fallback terakhir: bikin lewat API yang umum kalau ada
     raise RuntimeError("storage.create_invoice / add_invoice tidak ditemukan")
 
 
-def _storage_get_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
-    if hasattr(storage, "get_invoice"):
-        return storage.get_invoice(invoice_id)  # type: ignore[attr-defined]
-    if hasattr(storage, "find_invoice"):
-        return storage.find_invoice(invoice_id)  # type: ignore[attr-defined]
+async def _storage_get_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
+    if hasattr(astorage, "get_invoice"):
+        return await astorage.get_invoice(invoice_id)  # type: ignore[attr-defined]
+    if hasattr(astorage, "find_invoice"):
+        return await astorage.find_invoice(invoice_id)  # type: ignore[attr-defined]
     return None
 
 
-def _storage_update_status(invoice_id: str, status: str) -> Optional[Dict[str, Any]]:
-    if hasattr(storage, "update_invoice_status"):
-        return storage.update_invoice_status(invoice_id, status)  # type: ignore[attr-defined]
-    if hasattr(storage, "mark_paid") and status.upper() == "PAID":
-        return storage.mark_paid(invoice_id)  # type: ignore[attr-defined]
-    # kalau tidak ada API khusus, biarkan caller yang handle None
-    return None
-
-
-def _storage_update_qr_payload(invoice_id: str, data_url: str) -> None:
-    if hasattr(storage, "update_qris_payload"):
-        storage.update_qris_payload(invoice_id, data_url)  # type: ignore[attr-defined]
-        return
-    if hasattr(storage, "save_qr_payload"):
-        storage.save_qr_payload(invoice_id, data_url)  # type: ignore[attr-defined]
-        return
-    # jika tidak ada, diamkan saja.
+async def _storage_update_status(invoice_id: str, status: str) -> Optional[Dict[str, Any]]:
+    # invalidate SETELAH tulis: baca paralel selama update tidak meninggalkan data lama
+    try:
+        if hasattr(astorage, "update_invoice_status"):
+            return await astorage.update_invoice_status(invoice_id, status)  # type: ignore[attr-defined]
+        if hasattr(astorage, "mark_paid") and status.upper() == "PAID":
+            return await astorage.mark_paid(invoice_id)  # type: ignore[attr-defined]
+        # kalau tidak ada API khusus, biarkan caller yang handle None
+        return None
+    finally:
+        _CACHE.invalidate(invoice_id)
 
 
-def _storage_list_invoices(limit: int = 20) -> List[Dict[str, Any]]:
-    if hasattr(storage, "list_invoices"):
-        return storage.list_invoices(limit)  # type: ignore[attr-defined]
+async def _storage_list_invoices(limit: int = 20) -> List[Dict[str, Any]]:
+    if hasattr(astorage, "list_invoices"):
+        return await astorage.list_invoices(limit)  # type: ignore[attr-defined]
     return []
 
 
@@ -78,7 +170,16 @@ async def create_invoice(user_id: int, groups: list[str], amount: int) -> dict:
     grp = [str(g) for g in (groups or [])]
     amt = int(amount)
 
-    inv = storage.create_invoice(uid, grp, amt)  # <<-- PERBAIKAN UTAMA
+    # buka-tutup modal berulang → pakai lagi invoice PENDING yang sama (+ QR-nya)
+    # selama masih di jendela validitas QR, bukan invoice + checkout Chromium baru
+    if INVOICE_REUSE_SEC > 0:
+        inv = await astorage.find_reusable_invoice(uid, grp, amt, int(time.time() - INVOICE_REUSE_SEC))
+        if inv:
+            inv["reused"] = True
+            inv["has_qr"] = _has_qr(inv)
+            return inv  # tidak di-cache: id baru diketahui setelah baca (tanpa generasi)
+
+    inv = await astorage.create_invoice(uid, grp, amt)  # <<-- PERBAIKAN UTAMA
 
     # Pastikan ada fallback field yang dipakai layer lain
     # (main.py membaca inv.get("groups") ATAU groups_json)
@@ -88,56 +189,258 @@ async def create_invoice(user_id: int, groups: list[str], amount: int) -> dict:
         inv["amount"] = amt
     if "status" not in inv:
         inv["status"] = "PENDING"
+    inv["reused"] = False
 
+    _CACHE.put("inv", inv["invoice_id"], inv)
     return inv
 
 
 
 
-def get_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
-    return _storage_get_invoice(invoice_id)
+async def get_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
+    inv = _CACHE.get("inv", invoice_id)
+    if inv is None:
+        gen = _CACHE.gen(invoice_id)
+        inv = await _storage_get_invoice(invoice_id)
+        _CACHE.put("inv", invoice_id, inv, gen)
+    return inv
 
 
-def get_status(invoice_id: str) -> Optional[Dict[str, Any]]:
-    inv = _storage_get_invoice(invoice_id)
+async def get_status(invoice_id: str) -> Optional[Dict[str, Any]]:
+    st = _CACHE.get("status", invoice_id)
+    if st is not None:
+        return st
+    # kolom sempit saja (dipoll tiap 2 detik oleh mini app)
+    gen = _CACHE.gen(invoice_id)
+    inv = await astorage.get_invoice_status(invoice_id)
     if not inv:
         return None
 
     # Normalisasi field agar stabil untuk API /api/invoice/{id}/status
     status = (inv.get("status") or "PENDING").upper()
-    payload = inv.get("qris_payload") or inv.get("qr_payload")
 
-    return {
+    st = {
         "invoice_id": inv.get("invoice_id") or invoice_id,
         "status": status,
         "paid_at": inv.get("paid_at"),
-        "has_qr": bool(payload),
+        "has_qr": bool(inv.get("has_qr")),
     }
+    _CACHE.put("status", invoice_id, st, gen)
+    return st
 
 
-def mark_paid(invoice_id: str) -> Optional[Dict[str, Any]]:
-    updated = _storage_update_status(invoice_id, "PAID")
+async def mark_paid(invoice_id: str) -> Optional[Dict[str, Any]]:
+    updated = await _storage_update_status(invoice_id, "PAID")
     # kalau storage tidak mengembalikan row terbaru, coba ambil lagi
-    return updated or _storage_get_invoice(invoice_id)
+    inv = updated or await _storage_get_invoice(invoice_id)
+    if inv:
+        events.publish(invoice_id, "paid", {"status": "PAID", "paid_at": inv.get("paid_at")})
+    return inv
+
+
+# ---------- webhook pembayaran (idempotent) ----------
+# pesan donasi berisi "INV:<invoice_id>" (diisi scraper saat checkout)
+INV_RE = re.compile(r"(?:^|\b)INV[:\s]*([0-9a-fA-F-]{36})\b")
+# event_key yang sudah diproses di proses ini: retry Saweria berhenti di lookup dict
+SEEN_EVENTS_MAX = 4096
+_SEEN_EVENTS: "OrderedDict[str, None]" = OrderedDict()
 
 
-def list_invoices(limit: int = 20) -> List[Dict[str, Any]]:
-    return _storage_list_invoices(limit)
+def _remember_event(event_key: str) -> None:
+    _SEEN_EVENTS[event_key] = None
+    _SEEN_EVENTS.move_to_end(event_key)
+    while len(_SEEN_EVENTS) > SEEN_EVENTS_MAX:
+        _SEEN_EVENTS.popitem(last=False)
+
+
+async def ingest_paid_event(event_key: str, invoice_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Event "sudah bayar" dari webhook: dedupe per event_key, transisi PAID dan
+    antrian undangan dalam satu transaksi (storage.ingest_paid_event).
+    None = invoice tidak ditemukan.
+    """
+    if event_key in _SEEN_EVENTS:
+        return {"duplicate": True, "transitioned": False, "queued": 0, "invoice": None}
+    res = await astorage.ingest_paid_event(event_key, invoice_id)
+    _after_ingest(event_key, invoice_id, res)
+    return res
+
+
+async def ingest_paid_events(items: List[Tuple[str, str]]) -> List[Optional[Dict[str, Any]]]:
+    """Batch (event_key, invoice_id) dalam satu transaksi (reconcile.py)."""
+    todo = [(k, i) for k, i in items if k not in _SEEN_EVENTS]
+    if not todo:
+        return []
+    results = await astorage.ingest_paid_events(todo)
+    for (key, invoice_id), res in zip(todo, results):
+        _after_ingest(key, invoice_id, res)
+    return results
+
+
+def _after_ingest(event_key: str, invoice_id: str, res: Optional[Dict[str, Any]]) -> None:
+    if res is None:
+        return
+    _remember_event(event_key)
+    if res["transitioned"]:
+        _CACHE.invalidate(invoice_id)
+        inv = res["invoice"]
+        events.publish(invoice_id, "paid", {"status": "PAID", "paid_at": inv.get("paid_at")})
+
+
+async def list_invoices(limit: int = 20) -> List[Dict[str, Any]]:
+    return await _storage_list_invoices(limit)
+
+
+# ---------- single-flight generate QR ----------
+# Satu invoice = maksimal satu checkout Chromium (tiap checkout = 1 donasi di Saweria).
+# - dalam proses: caller ke-2 dst. menunggu Task yang sama
+# - lintas proses: klaim di tabel qr_jobs; proses lain menunggu payload muncul di DB
+QR_JOB_STALE_SECONDS = int(os.getenv("QR_JOB_STALE_SECONDS", "120"))
+QR_FOREIGN_WAIT_SECONDS = float(os.getenv("QR_FOREIGN_WAIT_SECONDS", "90"))
+
+_WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_QR_INFLIGHT: Dict[str, asyncio.Task] = {}
+def qr_etag(ref: Dict[str, Any], fmt: str = "png", size: Optional[int] = None) -> Optional[str]:
+    """
+    ETag gambar QR tanpa membaca bytes-nya.
+    Ukuran default PNG = blob tersimpan → hash blob; render lain → hash teks + opsi.
+    """
+    text = ref.get("qris_payload")
+    if ref.get("qr_hash") and not (qr.is_qris_text(text) and (size or fmt == "svg")):
+        return ref["qr_hash"]
+    if qr.is_qris_text(text):
+        digest = hashlib.sha256(text.encode()).hexdigest()[:32]
+        return f"{digest}-{fmt}-{size or qr.DEFAULT_SIZE}"
+    return None
+
+
+async def qr_image(ref: Optional[Dict[str, Any]], fmt: str = "png", size: Optional[int] = None) -> Optional[Tuple[bytes, str]]:
+    """
+    Referensi QR invoice (storage.get_invoice_qr) -> (bytes, mime).
+    - PNG ukuran default: blob dari qr_blobs apa adanya (tanpa render/decode)
+    - ukuran/format lain: render ulang teks QRIS (di-cache LRU)
+    - capture tanpa teks QRIS (zxing tidak ada): blob apa adanya (fmt & size diabaikan)
+    """
+    if not ref:
+        return None
+    text = ref.get("qris_payload")
+    if qr.is_qris_text(text) and (size or fmt == "svg" or not ref.get("qr_hash")):
+        return await qr.render_async(text, fmt, size)
+    if ref.get("qr_hash"):
+        return await astorage.get_qr_blob(ref["qr_hash"])
+    return None
+
+
+def _has_qr(ref: Optional[Dict[str, Any]]) -> bool:
+    return bool(ref) and bool(ref.get("qr_hash") or qr.is_qris_text(ref.get("qris_payload")))
+
+
+async def get_qr_ref(invoice_id: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    invoice_id, amount, qris_payload, qr_hash (kolom sempit, tanpa bytes gambar).
+    Hanya referensi yang sudah punya QR yang di-cache (yang belum bisa berubah
+    dari proses lain). fresh=True selalu baca DB.
+    """
+    ref = None if fresh else _CACHE.get("qr", invoice_id)
+    if ref is None:
+        gen = _CACHE.gen(invoice_id)
+        ref = await astorage.get_invoice_qr(invoice_id)
+        if _has_qr(ref):
+            _CACHE.put("qr", invoice_id, ref, gen)
+    return ref
+
+
+async def _cached_qr_ref(invoice_id: str) -> Optional[Dict[str, Any]]:
+    ref = await get_qr_ref(invoice_id, fresh=True)
+    return ref if _has_qr(ref) else None
+
+
+async def _wait_foreign_qr(invoice_id: str) -> Optional[Dict[str, Any]]:
+    """Proses lain sedang scrape invoice ini → tunggu hasilnya masuk DB."""
+    deadline = time.monotonic() + QR_FOREIGN_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+        ref = await _cached_qr_ref(invoice_id)
+        if ref:
+            return ref
+        if not await astorage.get_qr_job(invoice_id):
+            # pemilik selesai tanpa hasil (gagal) / klaim dilepas
+            return None
+    return None
+
+
+async def _store_qr(invoice_id: str, payload) -> None:
+    """Teks QRIS → simpan teks + PNG default sebagai blob; bytes (tanpa zxing) → blob saja."""
+    if isinstance(payload, str):
+        png, mime = await qr.render_async(payload)
+        await astorage.set_invoice_qr(invoice_id, png, mime, payload)
+    else:
+        await astorage.set_invoice_qr(invoice_id, payload, "image/png")
+    _CACHE.invalidate(invoice_id)  # setelah tulis (lihat _storage_update_status)
+    events.publish(invoice_id, "qr_ready")
+
+
+async def _generate_qr_once(invoice_id: str, amount: int, priority: int) -> Optional[Dict[str, Any]]:
+    if not await astorage.claim_qr_job(invoice_id, _WORKER_ID, QR_JOB_STALE_SECONDS):
+        print(f"[payments] QR {invoice_id} sedang dibuat proses lain; menunggu")
+        return await _wait_foreign_qr(invoice_id)
+    try:
+        # bisa jadi sudah selesai duluan di proses lain sebelum klaim kita
+        ref = await _cached_qr_ref(invoice_id)
+        if ref:
+            return ref
+        res = await fetch_gopay_qr(invoice_id=invoice_id, amount=amount, priority=priority)
+        if not res:
+            return None
+        if isinstance(res, str):
+            # teks QRIS langsung dari API: cukup cek CRC/amount, tanpa render + decode
+            reason = qr.verify(res, amount)
+            payload = None if reason else res
+            if reason:
+                print(f"[qr] rejected qr_string: {reason}")
+        else:
+            # decode + cek CRC/amount di thread pool; capture yang salah tidak di-cache
+            payload = await qr.postprocess(res, amount)
+        if not payload:
+            print(f"[payments] QR {invoice_id} ditolak verifikasi; tidak disimpan")
+            return None
+        await _store_qr(invoice_id, payload)
+        return await get_qr_ref(invoice_id, fresh=True)
+    finally:
+        try:
+            await astorage.release_qr_job(invoice_id, _WORKER_ID)
+        except Exception as e:
+            print("[payments] release_qr_job failed:", e)
+
+
+async def get_or_generate_qr(invoice_id: str, amount: int, priority: int = PRIO_INTERACTIVE) -> Optional[Dict[str, Any]]:
+    """
+    Kembalikan referensi QR invoice (lihat get_qr_ref; bytes via qr_image).
+    Pemanggil paralel untuk invoice yang sama menunggu satu proses generate
+    yang sama dan menerima referensi yang sama.
+    """
+    task = _QR_INFLIGHT.get(invoice_id)
+    if task is None or task.done():
+        task = asyncio.get_running_loop().create_task(_generate_qr_once(invoice_id, amount, priority))
+        _QR_INFLIGHT[invoice_id] = task
+
+        def _forget(t: asyncio.Task, key: str = invoice_id) -> None:
+            if _QR_INFLIGHT.get(key) is t:
+                _QR_INFLIGHT.pop(key, None)
+
+        task.add_done_callback(_forget)
+    # shield: client yang disconnect tidak membatalkan generate untuk caller lain
+    return await asyncio.shield(task)
 
 
 # ---------- background QR prewarm ----------
 async def _bg_generate_qr(invoice_id: str, amount: int) -> None:
     """
-    Ambil QR HD via scraper dan simpan sebagai data URL ke DB.
+    Ambil QR HD via scraper dan simpan ke DB (teks QRIS + blob PNG).
     Supaya /api/qr/{id} bisa cepat melayani request berikutnya.
     """
     try:
-        message = f"INV:{invoice_id}"
-        png = await fetch_gopay_qr_hd_png(amount, message)
-        if not png:
-            return
-        b64 = base64.b64encode(png).decode()
-        _storage_update_qr_payload(invoice_id, f"data:image/png;base64,{b64}")
+        await get_or_generate_qr(invoice_id, amount, priority=PRIO_BACKGROUND)
     except Exception:
         # diamkan; logging sudah cukup dari layer scraper
         return
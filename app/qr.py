@@ -0,0 +1,201 @@
+# app/qr.py
+# ------------------------------------------------------------
+# QR util:
+#  - decode PNG hasil scrape (img/screenshot) -> teks EMV/QRIS ("000201...")
+#  - render teks QRIS -> PNG/SVG di ukuran yang diminta (qrcode), di-memo LRU
+#  - post-process hasil scrape di thread pool: decode, cek CRC + amount (tag 54),
+#    hasil yang tidak lolos ditolak (tidak di-cache)
+#
+# Yang disimpan di DB: teks QRIS (~200 byte) + PNG ukuran default sebagai
+# blob bytes mentah (storage.qr_blobs), bukan data URL base64.
+#
+# Decode butuh `zxing-cpp` (opsional). Tanpa itu decode() selalu None
+# dan payments menyimpan PNG hasil scrape apa adanya (tanpa verifikasi).
+#
+# ENV:
+#   QR_RENDER_CACHE_SIZE  jumlah gambar ter-render yang diingat (default 256)
+#   QR_DEFAULT_SIZE       lebar default gambar dalam px (default 600)
+#   QR_POSTPROCESS_WORKERS  thread untuk decode/verifikasi (default 2)
+#   QR_MAX_FEE_PCT        toleransi amount QR di atas nominal (biaya), persen (default 5)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+import qrcode
+import qrcode.image.svg
+
+try:
+    import zxingcpp  # type: ignore
+except Exception:  # pragma: no cover - opsional
+    zxingcpp = None
+
+RENDER_CACHE_SIZE = int(os.getenv("QR_RENDER_CACHE_SIZE", "256"))
+POSTPROCESS_WORKERS = max(1, int(os.getenv("QR_POSTPROCESS_WORKERS", "2")))
+MAX_FEE_PCT = float(os.getenv("QR_MAX_FEE_PCT", "5"))
+DEFAULT_SIZE = int(os.getenv("QR_DEFAULT_SIZE", "600"))
+MIN_SIZE, MAX_SIZE = 128, 2048
+BORDER = 4
+
+PAYLOAD_PREFIX = "000201"  # header EMV (Payload Format Indicator "01")
+
+
+def is_qris_text(payload: Optional[str]) -> bool:
+    return bool(payload) and payload.startswith(PAYLOAD_PREFIX)
+
+
+def decode_all(png: bytes) -> list:
+    """Semua teks QRIS yang terbaca di gambar (screenshot halaman bisa memuat >1 QR)."""
+    if zxingcpp is None or not png:
+        return []
+    try:
+        from PIL import Image
+        img = Image.open(io.BytesIO(png))
+        img.load()
+        return [r.text for r in zxingcpp.read_barcodes(img.convert("L")) if is_qris_text(r.text)]
+    except Exception as e:
+        print("[qr] decode failed:", e)
+    return []
+
+
+def decode(png: bytes) -> Optional[str]:
+    """Decode QR pertama di gambar. Return teks QRIS atau None."""
+    texts = decode_all(png)
+    return texts[0] if texts else None
+
+
+# ---------- verifikasi payload EMV/QRIS ----------
+def parse_tlv(text: str) -> Dict[str, str]:
+    """Tag level atas EMV (ID 2 digit + panjang 2 digit + nilai)."""
+    out: Dict[str, str] = {}
+    i = 0
+    while i + 4 <= len(text):
+        tag, ln = text[i:i + 2], text[i + 2:i + 4]
+        if not ln.isdigit():
+            break
+        n = int(ln)
+        out[tag] = text[i + 4:i + 4 + n]
+        i += 4 + n
+    return out
+
+
+def crc16(data: str) -> str:
+    crc = 0xFFFF
+    for b in data.encode():
+        crc ^= b << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return f"{crc:04X}"
+
+
+def crc_ok(text: str) -> bool:
+    """Tag 63 = CRC16/CCITT atas seluruh payload sampai '6304'."""
+    i = text.rfind("6304")
+    return i >= 0 and len(text) == i + 8 and crc16(text[:i + 4]) == text[i + 4:].upper()
+
+
+def amount_of(text: str) -> Optional[int]:
+    raw = parse_tlv(text).get("54")
+    try:
+        return int(float(raw)) if raw else None
+    except ValueError:
+        return None
+
+
+def verify(text: str, amount: int) -> Optional[str]:
+    """None kalau payload valid untuk nominal ini; selain itu alasan penolakan."""
+    if not crc_ok(text):
+        return "crc mismatch"
+    got = amount_of(text)
+    if got is None:
+        return "no amount (tag 54) in payload"
+    if not (amount <= got <= amount * (1 + MAX_FEE_PCT / 100)):
+        return f"amount {got} != expected {amount}"
+    return None
+
+
+def _postprocess(png: bytes, amount: int) -> Optional[Union[str, bytes]]:
+    if zxingcpp is None:
+        # tidak bisa decode/verifikasi → perilaku lama: simpan PNG apa adanya
+        print("[qr] WARN: zxing-cpp tidak terpasang; QR disimpan tanpa verifikasi")
+        return png
+    texts = decode_all(png)
+    reasons = []
+    for text in texts:
+        reason = verify(text, amount)
+        if reason is None:
+            return text
+        reasons.append(reason)
+    print(f"[qr] rejected capture ({len(png)} bytes): {reasons or 'no QR decoded'}")
+    return None
+
+
+_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadPoolExecutor(POSTPROCESS_WORKERS, thread_name_prefix="qr-post")
+    return _POOL
+
+
+async def postprocess(png: bytes, amount: int) -> Optional[Union[str, bytes]]:
+    """
+    Hasil scrape -> payload siap simpan, di thread pool:
+    teks QRIS terverifikasi, atau PNG asli (bytes) kalau zxing-cpp tidak ada.
+    None = ditolak (tidak ter-decode / CRC salah / amount tidak cocok).
+    """
+    return await asyncio.get_running_loop().run_in_executor(_pool(), _postprocess, png, amount)
+
+
+async def render_async(text: str, fmt: str = "png", size: Optional[int] = None) -> Tuple[bytes, str]:
+    """render() di thread pool yang sama (untuk render pertama yang belum ada di cache)."""
+    return await asyncio.get_running_loop().run_in_executor(_pool(), render, text, fmt, size)
+
+
+def _matrix(text: str) -> qrcode.QRCode:
+    q = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=BORDER)
+    q.add_data(text)
+    q.make(fit=True)
+    return q
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(text: str, fmt: str, box: int) -> bytes:
+    q = _matrix(text)
+    q.box_size = box
+    buf = io.BytesIO()
+    if fmt == "svg":
+        q.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buf)
+    else:
+        q.make_image().save(buf, format="PNG", optimize=True)  # 1-bit, palet 2 warna
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _modules(text: str) -> int:
+    return _matrix(text).modules_count + 2 * BORDER
+
+
+def render(text: str, fmt: str = "png", size: Optional[int] = None) -> Tuple[bytes, str]:
+    """
+    Render teks QRIS. size = lebar kira-kira dalam px (dibulatkan ke kelipatan
+    modul supaya tajam). Return (bytes, mime).
+    """
+    fmt = "svg" if fmt == "svg" else "png"
+    size = max(MIN_SIZE, min(MAX_SIZE, int(size or DEFAULT_SIZE)))
+    box = max(1, size // _modules(text))
+    data = _render(text, fmt, box)
+    return data, ("image/svg+xml" if fmt == "svg" else "image/png")
+
+
+def cache_info():
+    return _render.cache_info()._asdict()
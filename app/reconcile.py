@@ -0,0 +1,213 @@
+# app/reconcile.py
+# ------------------------------------------------------------
+# Rekonsiliasi pembayaran yang webhook-nya hilang:
+#  - index in-memory invoice terbuka (PENDING/EXPIRED, RECONCILE_LOOKBACK_HOURS)
+#  - baca riwayat donasi Saweria per halaman (saweria_http.fetch_donations),
+#    terbaru dulu, berhenti di cursor (created_at donasi terbaru yang sudah
+#    dilihat; disimpan di tabel meta → awet restart) dikurangi jendela lag,
+#    supaya donasi yang baru muncul di riwayat belakangan tetap terbaca
+#  - cursor hanya maju kalau scan benar-benar sampai ke cursor lama / akhir
+#    riwayat; kalau MAX_PAGES habis duluan, halaman berikutnya disimpan
+#    (meta "reconcile.resume") dan putaran berikutnya melanjutkan dari sana
+#  - pesan donasi dicocokkan dengan INV_RE → invoice terbuka
+#  - semua yang cocok ditandai PAID dalam SATU transaksi, dengan event key
+#    yang sama seperti webhook ("id:<donation_id>") → tidak dobel dengan
+#    webhook yang datang terlambat; undangan masuk outbox
+#
+# Uji lokal: python -m app.standin, SAWERIA_API_BASE=http://127.0.0.1:8099,
+# lalu python -m app.reconcile --once
+#
+# ENV:
+#   RECONCILE_INTERVAL_SEC    (default 60 bila SAWERIA_STREAMER_TOKEN diisi,
+#                              selain itu 0=mati; isi eksplisit untuk memaksa)
+#   RECONCILE_PAGE_SIZE       (default 50)
+#   RECONCILE_MAX_PAGES       halaman maks. per putaran (default 5)
+#   RECONCILE_LOOKBACK_HOURS  umur invoice yang masih dicocokkan (default 48)
+#   RECONCILE_LAG_MIN         jendela mundur dari cursor tiap putaran (default 10)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import astorage, saweria_http
+
+# tanpa token riwayat donasi biasanya ditolak → jangan polling tiap menit
+INTERVAL_SEC = float(os.getenv("RECONCILE_INTERVAL_SEC", "60" if saweria_http.STREAMER_TOKEN else "0"))
+PAGE_SIZE = max(1, int(os.getenv("RECONCILE_PAGE_SIZE", "50")))
+MAX_PAGES = max(1, int(os.getenv("RECONCILE_MAX_PAGES", "5")))
+LOOKBACK_HOURS = float(os.getenv("RECONCILE_LOOKBACK_HOURS", "48"))
+LAG_SEC = max(0, int(float(os.getenv("RECONCILE_LAG_MIN", "10")) * 60))
+
+CURSOR_KEY = "reconcile.cursor"
+RESUME_KEY = "reconcile.resume"  # "<halaman berikut> <created_at terbaru>" selama backlog belum habis
+
+_TASK: Optional[asyncio.Task] = None
+_LAST: Dict[str, Any] = {}
+_TOTAL = {"runs": 0, "matched": 0, "marked_paid": 0, "errors": 0}
+
+
+async def _load_cursor() -> int:
+    raw = await astorage.get_meta(CURSOR_KEY)
+    try:
+        return int(raw or 0)
+    except ValueError:
+        return 0
+
+
+async def _load_resume() -> Tuple[int, int]:
+    """(halaman awal, created_at terbaru dari scan yang belum selesai); (1, 0) = mulai dari atas."""
+    raw = await astorage.get_meta(RESUME_KEY)
+    try:
+        page, newest = (raw or "").split()
+        return max(1, int(page)), int(newest)
+    except ValueError:
+        return 1, 0
+
+
+def _match(donations: List[Dict[str, Any]], open_invoices: Dict[str, int]) -> List[Tuple[str, str]]:
+    from .payments import INV_RE
+
+    items = []
+    for d in donations:
+        m = INV_RE.search(d["message"])
+        if not m:
+            continue
+        invoice_id = m.group(1).lower()
+        amount = open_invoices.get(invoice_id)
+        if amount is None:
+            continue  # bukan invoice terbuka (sudah PAID / terlalu lama / bukan milik kita)
+        if d["amount"] < amount:
+            print(f"[reconcile] donasi {d['id']} untuk {invoice_id} kurang: {d['amount']} < {amount}")
+            continue
+        items.append((f"id:{d['id']}", invoice_id))
+    return items
+
+
+async def run_once() -> Dict[str, Any]:
+    """Satu putaran rekonsiliasi. Return ringkasan (juga di stats())."""
+    from . import invites, payments  # import lambat: payments menarik scraper
+
+    t0 = time.monotonic()
+    open_invoices = await astorage.list_open_invoices(int(time.time() - LOOKBACK_HOURS * 3600))
+    out: Dict[str, Any] = {"open": len(open_invoices), "pages": 0, "seen": 0, "matched": 0, "marked_paid": 0}
+    if not open_invoices:
+        # tidak ada yang perlu dicocokkan; cursor dibiarkan (donasi baru tetap di depan)
+        out["took_s"] = round(time.monotonic() - t0, 2)
+        _LAST.clear()
+        _LAST.update(out)
+        return out
+
+    cursor = await _load_cursor()
+    since = max(0, cursor - LAG_SEC) if cursor else 0
+    start, resumed_newest = await _load_resume()
+    newest = max(cursor, resumed_newest)
+    items: List[Tuple[str, str]] = []
+    reached = False
+    # melanjutkan backlog: donasi baru menggeser isi halaman ke belakang, jadi
+    # mulai dari halaman berikutnya paling-paling membaca ulang, tidak melompati
+    for page in range(start, start + MAX_PAGES):
+        donations = await saweria_http.fetch_donations(page, PAGE_SIZE)
+        out["pages"] += 1
+        # jendela [cursor - lag, ...] diperiksa lagi: donasi bisa muncul di riwayat
+        # terlambat / created_at-nya mundur; yang sudah diproses tersaring oleh event key
+        fresh = [d for d in donations if d["created_at"] >= since]
+        out["seen"] += len(fresh)
+        newest = max([newest] + [d["created_at"] for d in fresh])
+        items += _match(fresh, open_invoices)
+        if len(fresh) < len(donations) or len(donations) < PAGE_SIZE:
+            reached = True  # sampai di jendela cursor / halaman terakhir
+            break
+
+    out["matched"] = len(items)
+    if items:
+        results = await payments.ingest_paid_events(items)
+        paid = [r for r in results if r and r["transitioned"]]
+        out["marked_paid"] = len(paid)
+        if any(r and r["queued"] for r in results):
+            invites.wake()
+        for r in paid:
+            print(f"[reconcile] {r['invoice']['invoice_id']} ditandai PAID (webhook tidak diterima)")
+    if reached:
+        if newest > cursor:
+            await astorage.set_meta(CURSOR_KEY, str(newest))
+        if start > 1:
+            await astorage.set_meta(RESUME_KEY, "")
+        cursor = newest
+    else:
+        # MAX_PAGES habis sebelum sampai cursor: cursor tetap, lanjutkan backlog nanti
+        await astorage.set_meta(RESUME_KEY, f"{page + 1} {newest}")
+        out["resume_page"] = page + 1
+    out["cursor"] = cursor
+    out["took_s"] = round(time.monotonic() - t0, 2)
+
+    _TOTAL["runs"] += 1
+    _TOTAL["matched"] += out["matched"]
+    _TOTAL["marked_paid"] += out["marked_paid"]
+    _LAST.clear()
+    _LAST.update(out)
+    return out
+
+
+async def _loop():
+    while True:
+        try:
+            await run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _TOTAL["errors"] += 1
+            print("[reconcile] run failed:", e)
+        await asyncio.sleep(INTERVAL_SEC)
+
+
+def start():
+    """Dipanggil dari main.on_start."""
+    global _TASK
+    if INTERVAL_SEC <= 0:
+        return
+    if _TASK is None or _TASK.done():
+        _TASK = asyncio.get_running_loop().create_task(_loop())
+
+
+async def stop():
+    global _TASK
+    if _TASK and not _TASK.done():
+        _TASK.cancel()
+        try:
+            await _TASK
+        except (asyncio.CancelledError, Exception):
+            pass
+    _TASK = None
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "interval_s": INTERVAL_SEC, "running": bool(_TASK and not _TASK.done()),
+        **_TOTAL, "last": dict(_LAST),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rekonsiliasi pembayaran dari riwayat donasi Saweria")
+    ap.add_argument("--once", action="store_true", help="jalankan satu putaran lalu keluar")
+    args = ap.parse_args()
+    if not args.once:
+        ap.error("pakai --once (loop berjalan dari aplikasi utama)")
+    from . import storage
+    storage.init_db()
+
+    async def _once():
+        print(await run_once())
+        await saweria_http.aclose()
+        await astorage.shutdown()
+
+    asyncio.run(_once())
+
+
+if __name__ == "__main__":
+    main()
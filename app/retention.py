@@ -0,0 +1,217 @@
+# app/retention.py
+# ------------------------------------------------------------
+# Job retensi di background (dimulai dari main.on_start):
+#  1) PENDING lebih tua dari N menit -> EXPIRED
+#  2) QR (teks + blob) invoice PAID/EXPIRED dilepas setelah M menit,
+#     blob yang tidak dirujuk lagi dihapus
+#  3) invoice PAID/EXPIRED lebih tua dari X hari (+ invite_logs & invite_outbox-nya)
+#     ditulis ke NDJSON gzip di RETENTION_ARCHIVE_DIR lalu dihapus dari DB
+#  4) webhook_events (dedupe webhook) lebih tua dari E hari dihapus
+#  5) PRAGMA incremental_vacuum supaya file DB ikut mengecil
+#
+# Semua langkah jalan per batch kecil lewat antrian writer astorage, dengan
+# jeda antar batch, jadi tidak pernah memegang kunci tulis lama.
+# Kebijakan bernilai 0 = langkah itu dimatikan.
+#
+# Manual:  python -m app.retention --once
+#          python -m app.retention --convert-vacuum   (DB lama -> auto_vacuum
+#          INCREMENTAL; VACUUM penuh, jalankan saat sepi)
+#
+# ENV:
+#   RETENTION_INTERVAL_SEC        jeda antar sweep (default 600, 0=mati)
+#   RETENTION_PENDING_EXPIRE_MIN  (default 60)
+#   RETENTION_QR_KEEP_MIN         umur QR setelah PAID/EXPIRED (default 60)
+#   RETENTION_ARCHIVE_DAYS        (default 90)
+#   RETENTION_ARCHIVE_DIR         (default /data/archive)
+#   RETENTION_EVENTS_DAYS         (default 30)
+#   RETENTION_BATCH               baris per batch (default 200)
+#   RETENTION_PAUSE_MS            jeda antar batch (default 50)
+#   RETENTION_VACUUM_PAGES        halaman per incremental_vacuum (default 512)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from . import astorage, events, storage
+
+INTERVAL_SEC = float(os.getenv("RETENTION_INTERVAL_SEC", "600"))
+PENDING_EXPIRE_MIN = float(os.getenv("RETENTION_PENDING_EXPIRE_MIN", "60"))
+QR_KEEP_MIN = float(os.getenv("RETENTION_QR_KEEP_MIN", "60"))
+ARCHIVE_DAYS = float(os.getenv("RETENTION_ARCHIVE_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "/data/archive")
+EVENTS_DAYS = float(os.getenv("RETENTION_EVENTS_DAYS", "30"))
+BATCH = max(1, int(os.getenv("RETENTION_BATCH", "200")))
+PAUSE_MS = float(os.getenv("RETENTION_PAUSE_MS", "50"))
+VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "512"))
+
+_TASK: Optional[asyncio.Task] = None
+_LAST: Dict[str, Any] = {}
+_VACUUM_HINTED = False
+
+
+def _invalidate(invoice_ids: List[str]) -> None:
+    if not invoice_ids:
+        return
+    try:
+        from . import payments  # import lambat: payments menarik scraper
+        payments.invalidate_cached(invoice_ids)
+    except Exception as e:
+        print("[retention] cache invalidate failed:", e)
+
+
+async def _pause():
+    await asyncio.sleep(PAUSE_MS / 1000)
+
+
+async def _batched(step, *args, event: Optional[str] = None) -> int:
+    """
+    Ulangi step(*args, BATCH) sampai batch tidak penuh. step -> list id / jumlah.
+    event: dikirim ke subscriber SSE tiap invoice yang berubah.
+    """
+    total = 0
+    while True:
+        res = await step(*args, BATCH)
+        n = res if isinstance(res, int) else len(res)
+        if not isinstance(res, int):
+            _invalidate(res)
+            if event:
+                for invoice_id in res:
+                    events.publish(invoice_id, event, {"status": "EXPIRED"})
+        total += n
+        if n < BATCH:
+            return total
+        await _pause()
+
+
+def _write_archive(rows: List[Dict[str, Any]]) -> str:
+    """Tambah batch ke arsip harian (gzip multi-member; zcat membaca semuanya)."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, time.strftime("invoices-%Y%m%d.ndjson.gz", time.gmtime()))
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for r in rows:
+                gz.write(json.dumps(r, ensure_ascii=False).encode() + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())  # arsip harus sudah di disk sebelum baris dihapus
+    return path
+
+
+async def _archive(created_before: int) -> int:
+    total = 0
+    while True:
+        rows = await astorage.select_archivable(created_before, BATCH)
+        if not rows:
+            return total
+        await asyncio.to_thread(_write_archive, rows)
+        ids = [r["invoice_id"] for r in rows]
+        await astorage.delete_invoices(ids)
+        _invalidate(ids)
+        total += len(rows)
+        if len(rows) < BATCH:
+            return total
+        await _pause()
+
+
+async def _vacuum() -> Optional[int]:
+    global _VACUUM_HINTED
+    if VACUUM_PAGES <= 0:
+        return None
+    if await astorage.auto_vacuum_mode() != 2:
+        if not _VACUUM_HINTED:
+            _VACUUM_HINTED = True
+            print("[retention] auto_vacuum bukan INCREMENTAL; jalankan `python -m app.retention --convert-vacuum`")
+        return None
+    pages = 0
+    while True:
+        left = await astorage.incremental_vacuum(VACUUM_PAGES)
+        pages += 1
+        if left <= 0 or pages >= 20:  # sisanya di sweep berikutnya
+            return left
+        await _pause()
+
+
+async def sweep() -> Dict[str, Any]:
+    """Satu putaran retensi. Return ringkasan (juga di stats())."""
+    t0 = time.monotonic()
+    now = int(time.time())
+    out: Dict[str, Any] = {"at": now}
+    if PENDING_EXPIRE_MIN > 0:
+        out["expired"] = await _batched(
+            astorage.expire_pending, now - int(PENDING_EXPIRE_MIN * 60), event="expired"
+        )
+    if QR_KEEP_MIN > 0:
+        out["qr_dropped"] = await _batched(astorage.drop_qr, now - int(QR_KEEP_MIN * 60))
+        out["blobs_deleted"] = await _batched(astorage.delete_orphan_blobs)
+    if ARCHIVE_DAYS > 0:
+        out["archived"] = await _archive(now - int(ARCHIVE_DAYS * 86400))
+    if EVENTS_DAYS > 0:
+        out["events_pruned"] = await _batched(astorage.prune_webhook_events, now - int(EVENTS_DAYS * 86400))
+    out["freelist_left"] = await _vacuum()
+    out["took_s"] = round(time.monotonic() - t0, 2)
+    _LAST.clear()
+    _LAST.update(out)
+    if any(out.get(k) for k in ("expired", "qr_dropped", "blobs_deleted", "archived", "events_pruned")):
+        print("[retention] sweep:", out)
+    return out
+
+
+async def _loop():
+    while True:
+        try:
+            await sweep()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[retention] sweep failed:", e)
+        await asyncio.sleep(INTERVAL_SEC)
+
+
+def start():
+    """Dipanggil dari main.on_start."""
+    global _TASK
+    if INTERVAL_SEC <= 0:
+        return
+    if _TASK is None or _TASK.done():
+        _TASK = asyncio.get_running_loop().create_task(_loop())
+
+
+async def stop():
+    global _TASK
+    if _TASK and not _TASK.done():
+        _TASK.cancel()
+        try:
+            await _TASK
+        except (asyncio.CancelledError, Exception):
+            pass
+    _TASK = None
+
+
+def stats() -> Dict[str, Any]:
+    return {"interval_s": INTERVAL_SEC, "running": bool(_TASK and not _TASK.done()), "last": dict(_LAST)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Retensi invoice / arsip / vacuum")
+    ap.add_argument("--once", action="store_true", help="jalankan satu sweep lalu keluar")
+    ap.add_argument("--convert-vacuum", action="store_true", help="ubah DB lama ke auto_vacuum=INCREMENTAL (VACUUM penuh)")
+    args = ap.parse_args()
+    storage.init_db()
+    if args.convert_vacuum:
+        storage.convert_incremental_vacuum()
+        print("[retention] auto_vacuum =", storage.auto_vacuum_mode())
+    if args.once:
+        async def _once():
+            print(await sweep())
+            await astorage.shutdown()
+        asyncio.run(_once())
+
+
+if __name__ == "__main__":
+    main()
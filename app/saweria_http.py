@@ -0,0 +1,208 @@
+# app/saweria_http.py
+# ------------------------------------------------------------
+# Backend QR tanpa Chromium: kirim donasi langsung ke API Saweria
+# pakai httpx (koneksi di-pool), lalu ambil QR dari respons checkout.
+#   1) GET  {API}/users/{username}        -> id streamer (di-cache)
+#   2) POST {API}/donations/{streamer_id} -> data checkout (qr_string / url QR)
+#   3) qr_string -> dikembalikan apa adanya (teks QRIS; payments tidak perlu
+#      render + decode ulang) | url QR -> unduh bytes
+# Riwayat donasi (reconcile.py):
+#   GET {API}{SAWERIA_DONATIONS_PATH}?page=N&page_size=M  (terbaru dulu, butuh token kreator)
+#
+# ENV:
+#   SAWERIA_USERNAME
+#   SAWERIA_API_BASE   (default https://backend.saweria.co; bisa diarahkan ke stand-in lokal)
+#   SAWERIA_HTTP_TIMEOUT  detik (default 15)
+#   SAWERIA_DONATIONS_PATH  (default /donations)
+#   SAWERIA_STREAMER_TOKEN  isi header Authorization untuk riwayat donasi
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+import httpx
+
+from . import timings
+
+SAWERIA_USERNAME = os.getenv("SAWERIA_USERNAME", "").strip()
+API_BASE = (os.getenv("SAWERIA_API_BASE", "https://backend.saweria.co") or "").rstrip("/")
+HTTP_TIMEOUT = float(os.getenv("SAWERIA_HTTP_TIMEOUT", "15"))
+DONATIONS_PATH = os.getenv("SAWERIA_DONATIONS_PATH", "/donations")
+STREAMER_TOKEN = os.getenv("SAWERIA_STREAMER_TOKEN", "").strip()
+
+_UA = ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+       "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+_CLIENT: Optional[httpx.AsyncClient] = None
+_STREAMER_ID: Optional[str] = None
+
+
+def _client() -> httpx.AsyncClient:
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            headers={
+                "User-Agent": _UA,
+                "Accept": "application/json",
+                "Origin": "https://saweria.co",
+                "Referer": f"https://saweria.co/{SAWERIA_USERNAME}",
+            },
+        )
+    return _CLIENT
+
+
+async def aclose():
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+def _data(payload: Any) -> Dict[str, Any]:
+    """API Saweria membungkus hasil di {"data": {...}}; terima juga tanpa bungkus."""
+    if isinstance(payload, dict) and isinstance(payload.get("data"), dict):
+        return payload["data"]
+    return payload if isinstance(payload, dict) else {}
+
+
+def parse_checkout_response(payload: Any) -> Dict[str, Optional[str]]:
+    """
+    Ambil info QR dari respons POST donasi.
+    Return {"donation_id", "qr_string", "qr_url"} (field yang tak ada = None).
+    Dukung beberapa bentuk: qr_string / qris / qr_code langsung, atau
+    gaya Midtrans: actions[] dengan name "generate-qr-code".
+    """
+    d = _data(payload)
+    out: Dict[str, Optional[str]] = {
+        "donation_id": str(d.get("id") or d.get("donation_id") or "") or None,
+        "qr_string": None,
+        "qr_url": None,
+    }
+    for key in ("qr_string", "qris", "qris_string", "qr_code"):
+        val = d.get(key)
+        if isinstance(val, str) and val.startswith("000201"):  # payload EMV/QRIS
+            out["qr_string"] = val
+            break
+    for key in ("qr_url", "qr_code_url", "qr_image_url"):
+        val = d.get(key)
+        if isinstance(val, str) and val.startswith("http"):
+            out["qr_url"] = val
+            break
+    if not out["qr_url"]:
+        for act in d.get("actions") or []:
+            if isinstance(act, dict) and "qr" in str(act.get("name", "")).lower() and act.get("url"):
+                out["qr_url"] = str(act["url"])
+                break
+    return out
+
+
+async def _streamer_id() -> str:
+    global _STREAMER_ID
+    if _STREAMER_ID:
+        return _STREAMER_ID
+    r = await _client().get(f"{API_BASE}/users/{SAWERIA_USERNAME}")
+    r.raise_for_status()
+    sid = _data(r.json()).get("id")
+    if not sid:
+        raise RuntimeError("streamer id tidak ada di respons /users")
+    _STREAMER_ID = str(sid)
+    return _STREAMER_ID
+
+
+async def create_gopay_checkout(*, invoice_id: str, amount: int) -> Dict[str, Optional[str]]:
+    """POST donasi (message=INV:<invoice_id>, metode GoPay) lalu parse respons checkout."""
+    sid = await _streamer_id()
+    body = {
+        "agree": True,
+        "notUnderage": True,
+        "message": f"INV:{invoice_id}" if invoice_id else "INV:UNKNOWN",
+        "amount": int(amount),
+        "payment_type": "gopay",
+        "vote": "",
+        "currency": "IDR",
+        "customer_info": {
+            "first_name": "Budi",
+            "email": f"donor+{uuid.uuid4().hex[:8]}@example.com",
+            "phone": "",
+        },
+    }
+    r = await _client().post(f"{API_BASE}/donations/{sid}", json=body)
+    r.raise_for_status()
+    return parse_checkout_response(r.json())
+
+
+@timings.flow("qr_http")
+async def fetch_gopay_qr_http(*, invoice_id: str, amount: int) -> Optional[Union[str, bytes]]:
+    """
+    Jalur HTTP penuh. Return teks QRIS (str, kalau checkout memberi qr_string),
+    bytes gambar QR (kalau hanya ada url), atau None kalau flow gagal
+    (caller boleh fallback ke Playwright).
+    """
+    if not SAWERIA_USERNAME:
+        print("[saweria_http] ERROR: SAWERIA_USERNAME belum di-set")
+        return None
+    try:
+        with timings.span("checkout_api"):
+            info = await create_gopay_checkout(invoice_id=invoice_id, amount=amount)
+        if info["qr_string"]:
+            print("[saweria_http] got qr_string, donation:", info["donation_id"])
+            return info["qr_string"]
+        if info["qr_url"]:
+            r = await _client().get(info["qr_url"], headers={"Accept": "image/*,*/*;q=0.8"})
+            if r.status_code == 200 and r.content:
+                print("[saweria_http] downloaded QR bytes:", len(r.content))
+                return r.content
+            print("[saweria_http] WARN: QR url status", r.status_code)
+        print("[saweria_http] WARN: no QR in checkout response")
+    except Exception as e:
+        print("[saweria_http] error:", e)
+    return None
+
+
+# ---------- riwayat donasi (rekonsiliasi) ----------
+def _epoch(val: Any) -> int:
+    if isinstance(val, (int, float)):
+        return int(val)
+    try:
+        return int(datetime.fromisoformat(str(val).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return 0
+
+
+def parse_donations(payload: Any) -> List[Dict[str, Any]]:
+    """
+    Halaman riwayat donasi -> [{"id", "amount", "message", "created_at"(epoch)}].
+    Terima {"data": {"donations": [...]}} / {"data": [...]} / list langsung.
+    """
+    d = payload.get("data") if isinstance(payload, dict) else payload
+    if isinstance(d, dict):
+        d = d.get("donations") or d.get("transactions") or d.get("items") or []
+    out = []
+    for item in d if isinstance(d, list) else []:
+        if not isinstance(item, dict) or not item.get("id"):
+            continue
+        out.append({
+            "id": str(item["id"]),
+            "amount": int(item.get("amount") or 0),
+            "message": str(item.get("message") or ""),
+            "created_at": _epoch(item.get("created_at") or 0),
+        })
+    return out
+
+
+async def fetch_donations(page: int = 1, page_size: int = 50) -> List[Dict[str, Any]]:
+    """Satu halaman donasi sukses terbaru (terbaru dulu)."""
+    headers = {"Authorization": STREAMER_TOKEN} if STREAMER_TOKEN else {}
+    r = await _client().get(
+        f"{API_BASE}{DONATIONS_PATH}",
+        params={"page": page, "page_size": page_size},
+        headers=headers,
+    )
+    r.raise_for_status()
+    return parse_donations(r.json())
@@ -0,0 +1,165 @@
+# app/scheduler.py
+# ------------------------------------------------------------
+# Antrian job Chromium:
+#  - batas job paralel (SCRAPER_MAX_CONCURRENCY)
+#  - prioritas: request interaktif (/api/qr) > background > prewarm > debug
+#  - deadline per job: job yang sudah kedaluwarsa dibuang sebelum jalan
+#  - antrian penuh -> SchedulerBusy(retry_after) agar API bisa balas 503
+#
+# ENV:
+#   SCRAPER_MAX_CONCURRENCY  (default: SCRAPER_PROCESS_WORKERS kalau di-set,
+#                             kalau tidak 3 x BROWSER_POOL_SIZE)
+#   SCRAPER_MAX_QUEUE        (default 20)
+#   SCRAPER_JOB_DEADLINE     detik (default 60)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+PRIO_INTERACTIVE = 0
+PRIO_BACKGROUND = 10
+PRIO_PREWARM = 20
+PRIO_DEBUG = 30
+
+def _default_concurrency() -> int:
+    procs = int(os.getenv("SCRAPER_PROCESS_WORKERS", "0") or 0)
+    if procs > 0:
+        return procs  # satu job per proses worker
+    return 3 * max(1, int(os.getenv("BROWSER_POOL_SIZE", "1") or 1))
+
+
+MAX_CONCURRENCY = max(1, int(os.getenv("SCRAPER_MAX_CONCURRENCY", "0") or 0) or _default_concurrency())
+MAX_QUEUE = max(0, int(os.getenv("SCRAPER_MAX_QUEUE", "20")))
+DEFAULT_DEADLINE = float(os.getenv("SCRAPER_JOB_DEADLINE", "60"))
+
+
+class SchedulerBusy(RuntimeError):
+    """Antrian penuh. retry_after = perkiraan detik sampai ada slot."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"scraper busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobExpired(RuntimeError):
+    """Deadline job lewat sebelum sempat dijalankan."""
+
+
+_QUEUE: Optional[asyncio.PriorityQueue] = None
+_WORKERS: list[asyncio.Task] = []
+_SEQ = itertools.count()
+_RUNNING = 0
+_AVG_RUN_S = 8.0  # EMA durasi job, dipakai untuk estimasi retry_after
+_STATS: Dict[str, int] = {"submitted": 0, "completed": 0, "failed": 0, "expired": 0, "rejected": 0}
+
+
+def _ensure_workers() -> asyncio.PriorityQueue:
+    global _QUEUE
+    if _QUEUE is None:
+        _QUEUE = asyncio.PriorityQueue()
+    alive = [w for w in _WORKERS if not w.done()]
+    _WORKERS[:] = alive
+    loop = asyncio.get_running_loop()
+    while len(_WORKERS) < MAX_CONCURRENCY:
+        _WORKERS.append(loop.create_task(_worker()))
+    return _QUEUE
+
+
+def _retry_after() -> int:
+    waiting = _QUEUE.qsize() if _QUEUE else 0
+    est = (waiting + _RUNNING) / MAX_CONCURRENCY * _AVG_RUN_S
+    return max(1, int(math.ceil(est)))
+
+
+async def _worker():
+    global _RUNNING, _AVG_RUN_S
+    assert _QUEUE is not None
+    while True:
+        _prio, _seq, job = await _QUEUE.get()
+        fut: asyncio.Future = job["future"]
+        try:
+            if fut.done():  # caller sudah batal
+                continue
+            if time.monotonic() > job["deadline"]:
+                _STATS["expired"] += 1
+                fut.set_exception(JobExpired(f"job {job['name']} expired in queue"))
+                print(f"[scheduler] dropped expired job {job['name']} (prio={_prio})")
+                continue
+            _RUNNING += 1
+            t0 = time.monotonic()
+            try:
+                result = await job["fn"](*job["args"], **job["kwargs"])
+            except Exception as e:
+                _STATS["failed"] += 1
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                _STATS["completed"] += 1
+                if not fut.done():
+                    fut.set_result(result)
+            finally:
+                _RUNNING -= 1
+                _AVG_RUN_S = 0.8 * _AVG_RUN_S + 0.2 * (time.monotonic() - t0)
+        finally:
+            _QUEUE.task_done()
+
+
+async def run(
+    fn: Callable[..., Awaitable[Any]],
+    *args: Any,
+    priority: int = PRIO_INTERACTIVE,
+    deadline: Optional[float] = None,
+    **kwargs: Any,
+) -> Any:
+    """
+    Jalankan `fn(*args, **kwargs)` lewat antrian.
+    deadline = detik dari sekarang; lewat dari itu job dibuang (JobExpired).
+    Raise SchedulerBusy kalau antrian penuh.
+    """
+    queue = _ensure_workers()
+    idle = MAX_CONCURRENCY - _RUNNING
+    if queue.qsize() - idle >= MAX_QUEUE:
+        _STATS["rejected"] += 1
+        raise SchedulerBusy(_retry_after())
+
+    fut = asyncio.get_running_loop().create_future()
+    job = {
+        "fn": fn,
+        "args": args,
+        "kwargs": kwargs,
+        "name": getattr(fn, "__name__", "job"),
+        "future": fut,
+        "deadline": time.monotonic() + (deadline if deadline is not None else DEFAULT_DEADLINE),
+    }
+    _STATS["submitted"] += 1
+    queue.put_nowait((priority, next(_SEQ), job))
+    try:
+        return await fut
+    except asyncio.CancelledError:
+        # tandai batal supaya worker melewati job ini
+        if not fut.done():
+            fut.cancel()
+        raise
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        **_STATS,
+        "running": _RUNNING,
+        "queued": _QUEUE.qsize() if _QUEUE else 0,
+        "max_concurrency": MAX_CONCURRENCY,
+        "max_queue": MAX_QUEUE,
+        "avg_run_s": round(_AVG_RUN_S, 2),
+    }
+
+
+async def shutdown():
+    for w in _WORKERS:
+        w.cancel()
+    _WORKERS.clear()
@@ -10,94 +10,533 @@
 #       * jika elemen QR tak ketemu → screenshot panel/halaman
 #
 # ENV:
-#   SAWERIA_USERNAME  (contoh: "payments")
+#   SAWERIA_USERNAME        (contoh: "payments")
+#   SAWERIA_PROFILE_URL     override URL profil (default https://saweria.co/<username>)
+#   SCRAPER_WARM_POOL_SIZE  jumlah page profil yang disiapkan di muka (default 2, 0=mati)
+#   SCRAPER_WARM_MAX_AGE    umur maksimum page hangat dalam detik (default 300)
+#   SCRAPER_LEAN_RENDER     1 = render DPR 1 (HiDPI hanya saat fallback screenshot), default 1
+#   SCRAPER_BLOCK_TYPES     resource type yang diblok (default "image,media,font")
+#   SCRAPER_BLOCK_DOMAINS   domain yang diblok (analytics/widget pihak ketiga), comma-separated
+#   SCRAPER_ALLOW_PATTERNS  substring URL yang SELALU lolos (QR/checkout), comma-separated
+#   QR_BACKEND              "playwright" (default) | "http" (API langsung, fallback Playwright)
+#   BROWSER_POOL_SIZE       jumlah instance Chromium in-process (lihat browser.py)
+#   SCRAPER_PROCESS_WORKERS jumlah proses worker untuk job QR (lihat workers.py, default 0)
 # ------------------------------------------------------------
 
 from __future__ import annotations
-import os, re, uuid, base64, asyncio
-from typing import Optional
-from urllib.parse import urljoin
-from playwright.async_api import async_playwright, Page, Frame, Error as PWError
+import os, re, uuid, base64, asyncio, time
+from typing import Optional, Union
+from urllib.parse import urljoin, urlparse
+from playwright.async_api import Page, Frame
+
+from . import qr, scheduler, selector_stats, saweria_http, workers, timings
+from .browser import BrowserManager
+from .scheduler import PRIO_INTERACTIVE, PRIO_PREWARM, PRIO_DEBUG
 
 SAWERIA_USERNAME = os.getenv("SAWERIA_USERNAME", "").strip()
-PROFILE_URL = f"https://saweria.co/{SAWERIA_USERNAME}" if SAWERIA_USERNAME else None
+# SAWERIA_PROFILE_URL menimpa URL profil (mis. stand-in lokal, lihat standin.py)
+PROFILE_URL = (os.getenv("SAWERIA_PROFILE_URL", "").strip()
+               or (f"https://saweria.co/{SAWERIA_USERNAME}" if SAWERIA_USERNAME else None))
 INV_RE = re.compile(r"^[0-9a-fA-F-]{36}$")
 
+# Backend QR: "playwright" atau "http" (lihat saweria_http.py)
+QR_BACKEND = (os.getenv("QR_BACKEND", "playwright") or "playwright").strip().lower()
+
 # Paksa event input/change supaya binding reaktif di halaman terpicu
 FORCE_DISPATCH = True
 
-# --- Reuse browser instance untuk menekan latency ---
-_PLAY = None
-_BROWSER = None
-
-
-async def _get_browser():
-    """Start playwright+browser sekali, reuse di panggilan berikutnya."""
-    global _PLAY, _BROWSER
-    if _PLAY is None:
-        _PLAY = await async_playwright().start()
-    if _BROWSER is None:
-        _BROWSER = await _PLAY.chromium.launch(
-            headless=True,
-            args=[
-                "--no-sandbox",
-                "--disable-gpu",
-                "--disable-dev-shm-usage",
-                "--disable-blink-features=AutomationControlled",
-            ],
-        )
-    return _BROWSER
+# Batas tunggu sinyal checkout (tab baru / navigasi / iframe) setelah klik donate
+CHECKOUT_SIGNAL_TIMEOUT_MS = 10000
 
+# --- Chromium dikelola BrowserManager (relaunch, recycle, shutdown) ---
+BROWSER = BrowserManager()
 
-async def _new_context():
-    browser = await _get_browser()
-    return await browser.new_context(
-        user_agent=("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"),
-        viewport={"width": 1366, "height": 960},
-        device_scale_factor=2,
-        locale="id-ID",
-        timezone_id="Asia/Jakarta",
-    )
 
+def _split_env(name: str, default: str = "") -> list[str]:
+    v = os.getenv(name, default) or ""
+    return [x.strip().lower() for x in v.split(",") if x.strip()]
 
-# ---------- util umum ----------
-async def _find_payment_root(node: Page | Frame):
-    candidates = [
-        '[data-testid*="donate" i]',
-        '[data-testid*="payment" i]',
-        '[class*="donate" i]',
-        '[class*="payment" i]',
-        'form',
-        'section:has(button)',
-        'div:has(button)',
-    ]
-    for sel in candidates:
+
+# ---------- render profile + filter jaringan ----------
+LEAN_RENDER = os.getenv("SCRAPER_LEAN_RENDER", "1") != "0"
+VIEWPORT = {"width": 1280, "height": 900} if LEAN_RENDER else {"width": 1366, "height": 960}
+HIDPI_SCALE = 2
+
+BLOCK_RESOURCE_TYPES = set(_split_env("SCRAPER_BLOCK_TYPES", "image,media,font"))
+BLOCK_DOMAINS = _split_env(
+    "SCRAPER_BLOCK_DOMAINS",
+    "google-analytics.com,googletagmanager.com,doubleclick.net,googlesyndication.com,"
+    "facebook.net,facebook.com,connect.facebook.net,hotjar.com,clarity.ms,sentry.io,"
+    "segment.io,mixpanel.com,amplitude.com,tiktok.com,analytics.tiktok.com,"
+    "youtube.com,ytimg.com,twitter.com,twimg.com,cloudflareinsights.com",
+)
+# QR & checkout tidak boleh ikut terblok (mis. <img> QR dari midtrans/xendit)
+ALLOW_PATTERNS = _split_env("SCRAPER_ALLOW_PATTERNS", "qr,qris,gopay,midtrans,xendit,snap,checkout")
+
+# counter jaringan: per context (dilog saat context ditutup) + total sejak start
+_CTX_NET: dict[int, dict] = {}
+NET_TOTALS = {"allowed": 0, "blocked": 0, "allowed_bytes": 0, "blocked_by_type": {}}
+
+
+def _net_decision(url: str, resource_type: str) -> bool:
+    """True = izinkan request."""
+    u = url.lower()
+    if any(p in u for p in ALLOW_PATTERNS):
+        return True
+    host = urlparse(u).hostname or ""
+    if any(host == d or host.endswith("." + d) for d in BLOCK_DOMAINS):
+        return False
+    return resource_type not in BLOCK_RESOURCE_TYPES
+
+
+async def _install_net_filter(context) -> dict:
+    """
+    Pasang routing di level context: berlaku untuk semua page, tab baru,
+    dan iframe checkout di dalam context tsb.
+    """
+    stats = {"allowed": 0, "blocked": 0, "allowed_bytes": 0, "blocked_by_type": {}}
+
+    async def _route(route, request):
+        rtype = request.resource_type
+        if _net_decision(request.url, rtype):
+            stats["allowed"] += 1
+            await route.continue_()
+        else:
+            stats["blocked"] += 1
+            stats["blocked_by_type"][rtype] = stats["blocked_by_type"].get(rtype, 0) + 1
+            await route.abort("blockedbyclient")
+
+    def _on_response(resp):
         try:
-            el = await node.wait_for_selector(sel, timeout=1800)
-            return el
+            stats["allowed_bytes"] += int(resp.headers.get("content-length") or 0)
         except Exception:
             pass
-    return None
 
+    await context.route("**/*", _route)
+    context.on("response", _on_response)
+    return stats
+
+
+# ---------- readiness probe (MutationObserver di halaman) ----------
+# Disuntik ke setiap dokumen lewat add_init_script. Probe memantau mutasi DOM dan
+# hanya memeriksa subtree yang berubah (bukan querySelectorAll('*') tiap tick).
+# Python menunggu sinyal lewat window.__swr.until(kondisi, arg, timeoutMs) → Promise<bool>.
+#   "form"   : input amount sudah ada
+#   "amount" : teks "Jumlah Dukungan: Rp<arg>" sudah tampil
+#   "total"  : nilai "Total: Rp" > 0
+#   "donate" : tombol "Kirim Dukungan" ada & tidak disabled
+_READY_PROBE_JS = r"""
+(() => {
+  if (window.__swr) return;
+  const TOTAL_RE = /Total:\s*Rp\s*([\d.]+)/i;
+  const JUMLAH_RE = /Jumlah Dukungan:\s*Rp\s*([\d.]+)/i;
+  const AMOUNT_SEL = 'input[placeholder*="Ketik jumlah" i], input[aria-label*="Nominal" i], input[name="amount"], input[type="number"]';
+  const DONATE_SEL = 'button[data-testid="donate-button"]';
+  const st = { total: 0, jumlah: 0, donate: false, form: false };
+  const cache = { total: null, jumlah: null };
+  let waiters = [];
+
+  const num = (s) => { const n = parseInt(String(s || '').replace(/\./g, ''), 10); return Number.isFinite(n) ? n : 0; };
+
+  // naik dari text node sampai elemen yang textContent-nya memuat pola lengkap
+  function owner(textNode, re) {
+    let el = textNode.parentElement;
+    for (let i = 0; el && i < 4; i++, el = el.parentElement) {
+      if (re.test(el.textContent || '')) return el;
+    }
+    return null;
+  }
+  function scan(root) {
+    if (!root) return;
+    if (root.nodeType === 3) root = root.parentElement;
+    if (!root || root.nodeType !== 1) return;
+    const w = document.createTreeWalker(root, NodeFilter.SHOW_TEXT);
+    for (let t = w.nextNode(); t; t = w.nextNode()) {
+      const d = t.data || '';
+      if (!cache.total && /Total:/i.test(d)) cache.total = owner(t, TOTAL_RE);
+      if (!cache.jumlah && /Jumlah Dukungan/i.test(d)) cache.jumlah = owner(t, JUMLAH_RE);
+    }
+  }
+  function donateButton() {
+    const b = document.querySelector(DONATE_SEL);
+    if (b) return b;
+    return [...document.querySelectorAll('button')].find(x => /Kirim\s+Dukungan/i.test(x.textContent || '')) || null;
+  }
+  function refresh() {
+    for (const k of ['total', 'jumlah']) {
+      if (cache[k] && !cache[k].isConnected) cache[k] = null;
+    }
+    if (cache.total) { const m = (cache.total.textContent || '').match(TOTAL_RE); st.total = m ? num(m[1]) : 0; }
+    if (cache.jumlah) { const m = (cache.jumlah.textContent || '').match(JUMLAH_RE); st.jumlah = m ? num(m[1]) : 0; }
+    st.form = !!document.querySelector(AMOUNT_SEL);
+    const b = donateButton();
+    st.donate = !!b && !b.disabled && b.getAttribute('aria-disabled') !== 'true';
+  }
+  function check(c, a) {
+    if (c === 'form') return st.form;
+    if (c === 'amount') return st.jumlah === a;
+    if (c === 'total') return st.total > 0;
+    if (c === 'donate') return st.donate;
+    return false;
+  }
+  function flush() {
+    waiters = waiters.filter(w => {
+      if (!check(w.c, w.a)) return true;
+      clearTimeout(w.timer); w.resolve(true); return false;
+    });
+  }
+  const obs = new MutationObserver((records) => {
+    for (const r of records) {
+      if (r.type === 'characterData') scan(r.target);
+      else r.addedNodes.forEach(scan);
+    }
+    refresh(); flush();
+  });
+  obs.observe(document, { subtree: true, childList: true, characterData: true, attributes: true, attributeFilter: ['disabled', 'aria-disabled'] });
+  if (document.documentElement) scan(document.documentElement);
+
+  window.__swr = {
+    state: st,
+    until(c, a, timeoutMs) {
+      if (document.documentElement && !cache.total) scan(document.documentElement);
+      refresh();
+      if (check(c, a)) return Promise.resolve(true);
+      return new Promise(resolve => {
+        const w = { c, a, resolve };
+        w.timer = setTimeout(() => { waiters = waiters.filter(x => x !== w); resolve(false); }, timeoutMs);
+        waiters.push(w);
+      });
+    },
+  };
+})();
+"""
+
+
+async def _until(page: Page, cond: str, arg=None, timeout_ms: int = 4000) -> bool:
+    """Tunggu sinyal readiness dari probe. False kalau timeout / probe gagal."""
+    expr = "([c, a, t]) => window.__swr ? window.__swr.until(c, a, t) : null"
+    try:
+        ok = await page.evaluate(expr, [cond, arg, timeout_ms])
+        if ok is None:  # dokumen dibuka sebelum init script terpasang
+            await page.evaluate(_READY_PROBE_JS)
+            ok = await page.evaluate(expr, [cond, arg, timeout_ms])
+        return bool(ok)
+    except Exception as e:
+        print(f"[scraper] WARN: readiness '{cond}' failed:", e)
+        return False
 
-async def _scan_all_frames_for_visual(page: Page):
-    el = await _find_payment_root(page)
-    if el:
-        return el
-    for fr in page.frames:
+
+async def _new_context():
+    with timings.span("context"):
+        context = await BROWSER.new_context(
+            user_agent=("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+                        "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"),
+            viewport=VIEWPORT,
+            device_scale_factor=1 if LEAN_RENDER else HIDPI_SCALE,
+            locale="id-ID",
+            timezone_id="Asia/Jakarta",
+        )
+        _CTX_NET[id(context)] = await _install_net_filter(context)
+        await context.add_init_script(_READY_PROBE_JS)
+    return context
+
+
+async def _close_context(context):
+    """Tutup context + gabungkan counter jaringannya ke NET_TOTALS."""
+    stats = _CTX_NET.pop(id(context), None)
+    if stats:
+        for k in ("allowed", "blocked", "allowed_bytes"):
+            NET_TOTALS[k] += stats[k]
+        for t, n in stats["blocked_by_type"].items():
+            NET_TOTALS["blocked_by_type"][t] = NET_TOTALS["blocked_by_type"].get(t, 0) + n
+        print(
+            f"[scraper] net: allowed={stats['allowed']} ({stats['allowed_bytes'] // 1024} KiB) "
+            f"blocked={stats['blocked']} {stats['blocked_by_type']}"
+        )
+    try:
+        await context.close()
+    except Exception:
+        pass
+    await BROWSER.context_closed(context)
+
+
+async def _enable_hidpi(page: Optional[Page]):
+    """
+    Profil lean render di DPR 1. Sebelum fallback screenshot QR, naikkan DPR
+    lewat CDP supaya hasil tetap tajam (tanpa membuat context baru).
+    """
+    if not LEAN_RENDER or page is None:
+        return
+    try:
+        vp = page.viewport_size or VIEWPORT
+        cdp = await page.context.new_cdp_session(page)
+        await cdp.send("Emulation.setDeviceMetricsOverride", {
+            "width": vp["width"], "height": vp["height"],
+            "deviceScaleFactor": HIDPI_SCALE, "mobile": False,
+        })
+    except Exception as e:
+        print("[scraper] WARN: enable HiDPI failed:", e)
+
+
+def net_stats() -> dict:
+    return {**NET_TOTALS, "blocked_by_type": dict(NET_TOTALS["blocked_by_type"])}
+
+
+# ---------- warm pool: page profil yang sudah siap diisi ----------
+WARM_POOL_SIZE = int(os.getenv("SCRAPER_WARM_POOL_SIZE", "2"))
+WARM_PAGE_MAX_AGE = float(os.getenv("SCRAPER_WARM_MAX_AGE", "300"))
+WARM_SWEEP_INTERVAL = 30.0
+
+# tiap entri: {"context": BrowserContext, "page": Page, "ts": monotonic saat siap}
+_WARM: list[dict] = []
+_WARM_REFILL_TASK: Optional[asyncio.Task] = None
+_WARM_SWEEP_TASK: Optional[asyncio.Task] = None
+
+
+async def _open_profile_page():
+    """Context baru -> buka PROFILE_URL -> scroll ke form. Return (context, page)."""
+    context = await _new_context()
+    try:
+        page = await context.new_page()
+        with timings.span("goto"):
+            await page.goto(PROFILE_URL, wait_until="domcontentloaded")
+            if not await _until(page, "form", timeout_ms=8000):
+                print("[scraper] WARN: form not ready after goto")
+        await page.mouse.wheel(0, 500)
+    except BaseException:  # termasuk CancelledError (timeout scheduler)
+        await _close_context(context)
+        raise
+    return context, page
+
+
+async def _discard_warm(ent: dict):
+    await _close_context(ent["context"])
+
+
+def _warm_is_fresh(ent: dict) -> bool:
+    if time.monotonic() - ent["ts"] > WARM_PAGE_MAX_AGE:
+        return False
+    if not BROWSER.is_current(ent["context"]):  # browser lama sedang di-recycle
+        return False
+    try:
+        return not ent["page"].is_closed()
+    except Exception:
+        return False
+
+
+@timings.flow("warm")
+async def _open_warm_page():
+    return await _open_profile_page()
+
+
+async def _warm_refill():
+    """Isi pool sampai WARM_POOL_SIZE (dijalankan sebagai background task)."""
+    while len(_WARM) < WARM_POOL_SIZE:
         try:
-            url = (fr.url or "").lower()
-        except Exception:
-            url = ""
-        if any(k in url for k in ["gopay", "qris", "payment", "pay", "xendit", "midtrans", "snap", "checkout", "iframe"]):
-            print("[scraper] scanning frame:", url[:140])
-        el = await _find_payment_root(fr)
-        if el:
+            # prioritas rendah: tidak boleh menyerobot slot request interaktif
+            context, page = await scheduler.run(_open_warm_page, priority=PRIO_PREWARM)
+        except scheduler.SchedulerBusy:
+            print("[scraper] warm pool refill skipped: scheduler busy")
+            return
+        except Exception as e:
+            print("[scraper] warm pool refill failed:", e)
+            return
+        _WARM.append({"context": context, "page": page, "ts": time.monotonic()})
+        print(f"[scraper] warm pool: {len(_WARM)}/{WARM_POOL_SIZE}")
+
+
+def _kick_warm_refill():
+    global _WARM_REFILL_TASK
+    if WARM_POOL_SIZE <= 0 or not PROFILE_URL:
+        return
+    if _WARM_REFILL_TASK and not _WARM_REFILL_TASK.done():
+        return
+    _WARM_REFILL_TASK = asyncio.get_running_loop().create_task(_warm_refill())
+
+
+async def _warm_sweeper():
+    """Buang page yang sudah basi secara berkala lalu isi ulang."""
+    while True:
+        await asyncio.sleep(WARM_SWEEP_INTERVAL)
+        for ent in [e for e in _WARM if not _warm_is_fresh(e)]:
+            if ent in _WARM:
+                _WARM.remove(ent)
+                await _discard_warm(ent)
+                print("[scraper] warm pool: recycled stale page")
+        _kick_warm_refill()
+
+
+async def _acquire_profile_page():
+    """
+    Ambil page profil dari warm pool (kalau ada & masih segar),
+    kalau tidak buka secara cold. Pool di-refill di background.
+    Page yang sudah dipakai TIDAK dikembalikan ke pool (state form kotor).
+    """
+    while _WARM:
+        ent = _WARM.pop(0)
+        if _warm_is_fresh(ent):
+            _kick_warm_refill()
+            timings.branch("profile", "warm")
+            print(f"[scraper] using warm page (age {time.monotonic() - ent['ts']:.1f}s)")
+            return ent["context"], ent["page"]
+        await _discard_warm(ent)
+    _kick_warm_refill()
+    timings.branch("profile", "cold")
+    return await _open_profile_page()
+
+
+async def warm_pool_start():
+    """Dipanggil dari main.on_start: mulai isi pool + sweeper (tidak memblok startup)."""
+    global _WARM_SWEEP_TASK
+    if WARM_POOL_SIZE <= 0 or not PROFILE_URL:
+        return
+    if workers.enabled():
+        return  # job QR jalan di proses worker; warm pool diisi di sana (workers._child_loop)
+    _kick_warm_refill()
+    if _WARM_SWEEP_TASK is None or _WARM_SWEEP_TASK.done():
+        _WARM_SWEEP_TASK = asyncio.get_running_loop().create_task(_warm_sweeper())
+
+
+async def warm_pool_close():
+    for task in (_WARM_SWEEP_TASK, _WARM_REFILL_TASK):
+        if task and not task.done():
+            task.cancel()
+    while _WARM:
+        await _discard_warm(_WARM.pop())
+
+
+async def shutdown():
+    """Dipanggil dari main.on_stop: kosongkan warm pool lalu tutup Chromium."""
+    await warm_pool_close()
+    await BROWSER.close()
+    workers.shutdown()
+
+
+def browser_stats() -> dict:
+    return {**BROWSER.stats(), **workers.stats()}
+
+
+# ---------- util umum ----------
+async def _visible_now(node: Page | Frame, sel: str):
+    try:
+        el = await node.query_selector(sel)
+        if el and await el.is_visible():
             return el
+    except Exception:
+        pass
     return None
 
 
+async def _race_selectors(pairs: list[tuple], timeout_ms: int):
+    """
+    Tunggu semua (node, selector) sekaligus; selesai di match pertama, sisanya dibatalkan.
+    Kalau beberapa selesai bersamaan, menang yang urutannya paling depan di `pairs`.
+    Return (index, handle) atau (None, None).
+    """
+    tasks = [
+        asyncio.ensure_future(node.wait_for_selector(sel, timeout=timeout_ms))
+        for node, sel in pairs
+    ]
+    index_of = {t: i for i, t in enumerate(tasks)}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            hits = [t for t in done if not t.cancelled() and t.exception() is None and t.result()]
+            if hits:
+                best = min(hits, key=lambda t: index_of[t])
+                return index_of[best], best.result()
+        return None, None
+    finally:
+        for t in pending:
+            t.cancel()
+        # ambil exception task yang dibatalkan/timeout supaya tidak jadi warning "never retrieved"
+        for t in tasks:
+            if t.done() and not t.cancelled():
+                t.exception()
+
+
+async def _wait_first(nodes, group: str, candidates: list[str], default_ms: int,
+                      generic: Optional[list[str]] = None):
+    """
+    Cari elemen pertama yang cocok dari daftar kandidat selector, di satu node
+    (Page/Frame) atau beberapa node sekaligus.
+    1) cek instan: elemen yang SUDAH tampil → ambil sesuai urutan prioritas
+    2) kalau belum ada: race semua kandidat × semua node paralel
+    3) baru kalau kandidat spesifik tidak ketemu: coba `generic` (canvas,
+       div:has(button), form, ...) — selector generik hampir selalu cocok duluan
+       selama halaman masih hydrate, jadi tidak boleh ikut race pertama
+    Urutan & timeout adaptif dari selector_stats; `generic` tetap di urutan aslinya.
+    Return (handle, selector) atau (None, None).
+    """
+    if not isinstance(nodes, (list, tuple)):
+        nodes = [nodes]
+    order = selector_stats.ordered(group, candidates)
+    el, sel = await _wait_ordered(nodes, group, order, selector_stats.timeout_ms(group, default_ms), default_ms)
+    if el is None and generic:
+        # halaman sudah diberi satu jatah penuh; generik cukup cek instan + tunggu sebentar
+        el, sel = await _wait_ordered(nodes, group, list(generic), default_ms // 4, default_ms // 4)
+    return el, sel
+
+
+async def _wait_ordered(nodes: list, group: str, order: list[str], tmo: int, default_ms: int):
+    pairs = [(node, sel) for sel in order for node in nodes]
+
+    for node, sel in pairs:
+        el = await _visible_now(node, sel)
+        if el:
+            selector_stats.record_hit(group, sel, 0.0)
+            return el, sel
+
+    t0 = time.monotonic()
+    idx, el = await _race_selectors(pairs, tmo)
+    if el is None and tmo < default_ms:
+        # timeout adaptif bisa terlalu ketat saat halaman lambat: pakai sisa jatah default
+        idx, el = await _race_selectors(pairs, default_ms - tmo)
+    if el is None:
+        for sel in order:
+            selector_stats.record_miss(group, sel)
+        return None, None
+    sel = pairs[idx][1]
+    selector_stats.record_hit(group, sel, (time.monotonic() - t0) * 1000)
+    return el, sel
+
+
+def _payment_frames(page: Page) -> list[Frame]:
+    out = []
+    for fr in page.frames:
+        if fr is page.main_frame:
+            continue
+        url = (fr.url or "").lower()
+        if any(k in url for k in ["gopay", "qris", "payment", "pay", "xendit", "midtrans", "snap", "checkout"]):
+            out.append(fr)
+    return out
+
+
+_PAYMENT_ROOT_SELECTORS = [
+    '[data-testid*="donate" i]',
+    '[data-testid*="payment" i]',
+    '[class*="donate" i]',
+    '[class*="payment" i]',
+]
+# generik: hanya dicoba kalau yang spesifik tidak ketemu (lihat _wait_first)
+_PAYMENT_ROOT_GENERIC = [
+    'form',
+    'section:has(button)',
+    'div:has(button)',
+]
+
+
+async def _scan_all_frames_for_visual(page: Page):
+    frames = _payment_frames(page)
+    for fr in frames:
+        print("[scraper] scanning frame:", (fr.url or "")[:140])
+    el, _ = await _wait_first(
+        [page, *frames], "payment_root", _PAYMENT_ROOT_SELECTORS, 1800, generic=_PAYMENT_ROOT_GENERIC,
+    )
+    return el
+
+
 async def _maybe_dispatch(page: Page, handle):
     """Opsional: paksa event input/change bila FORCE_DISPATCH=True."""
     if not FORCE_DISPATCH or handle is None:
@@ -126,16 +565,15 @@ async def _select_gopay_and_wait_total(page: Page, amount: int):
         '[data-testid*="gopay"]',
     ]
     clicked = False
-    for sel in gopay_selectors:
+    el, sel = await _wait_first(page, "gopay", gopay_selectors, 2500)
+    if el:
         try:
-            el = await page.wait_for_selector(sel, timeout=2500)
             await el.scroll_into_view_if_needed()
             await el.click(force=True)
             print("[scraper] clicked GoPay via", sel)
             clicked = True
-            break
-        except Exception:
-            pass
+        except Exception as e:
+            print("[scraper] WARN: click GoPay failed:", e)
 
     if not clicked:
         print("[scraper] WARN: GoPay button not found")
@@ -145,34 +583,17 @@ async def _select_gopay_and_wait_total(page: Page, amount: int):
         await page.keyboard.press("Tab")
     except Exception:
         pass
-    await page.wait_for_timeout(200)
 
-    # cek "Jumlah Dukungan: Rp{amount}"
-    try:
-        rupiah = f"{amount:,}".replace(",", ".")
-        await page.get_by_text(re.compile(rf"Jumlah Dukungan:\s*Rp{rupiah}\b")).wait_for(timeout=4000)
+    # cek "Jumlah Dukungan: Rp{amount}" (sinyal dari probe, tanpa polling)
+    if await _until(page, "amount", int(amount), 4000):
         print("[scraper] amount reflected in UI")
-    except Exception:
+    else:
         print("[scraper] WARN: amount not reflected in 'Jumlah Dukungan'")
 
     # tunggu Total > 0
-    try:
-        await page.wait_for_function(
-            """
-            () => {
-              const el = [...document.querySelectorAll('*')]
-                .find(n => /Total:\s*Rp/i.test(n.textContent||''));
-              if (!el) return false;
-              const m = (el.textContent||'').match(/Total:\s*Rp\s*([\d.]+)/i);
-              if (!m) return false;
-              const num = parseInt(m[1].replace(/\./g,''));
-              return Number.isFinite(num) && num > 0;
-            }
-            """,
-            timeout=6000,
-        )
+    if await _until(page, "total", None, 6000):
         print("[scraper] Total > 0 (OK)")
-    except Exception:
+    else:
         print("[scraper] WARN: Total still 0 after selecting GoPay")
 
 
@@ -190,131 +611,147 @@ def _build_inv_message(invoice_id: str) -> str:
 # ---------- isi form TANPA submit ----------
 async def _fill_without_submit(page: Page, amount: int, invoice_id: str, method: str):
     # ===== amount =====
-    amount_ok = False
-    amount_handle = None
-    for sel in [
-        'input[placeholder*="Ketik jumlah" i]',
-        'input[aria-label*="Nominal" i]',
-        'input[name="amount"]',
-        'input[type="number"]',
-    ]:
-        try:
-            el = await page.wait_for_selector(sel, timeout=3000)
-            await el.scroll_into_view_if_needed()
-            await el.click()
-            # clear
+    with timings.span("fill.amount"):
+        amount_ok = False
+        amount_handle = None
+        el, sel = await _wait_first(page, "amount", [
+            'input[placeholder*="Ketik jumlah" i]',
+            'input[aria-label*="Nominal" i]',
+            'input[name="amount"]',
+            'input[type="number"]',
+        ], 3000)
+        if el:
             try:
-                await page.keyboard.press("Control+A")
-            except Exception:
-                await page.keyboard.press("Meta+A")
-            await page.keyboard.press("Backspace")
-            # ketik
-            await el.type(str(amount))
-            amount_handle = el
-            amount_ok = True
-            print("[scraper] filled amount via", sel)
-            break
-        except Exception:
-            pass
-    if not amount_ok:
-        print("[scraper] WARN: amount field not found")
-    await _maybe_dispatch(page, amount_handle)
-    await page.wait_for_timeout(200)
+                await el.scroll_into_view_if_needed()
+                await el.click()
+                # clear
+                try:
+                    await page.keyboard.press("Control+A")
+                except Exception:
+                    await page.keyboard.press("Meta+A")
+                await page.keyboard.press("Backspace")
+                # ketik
+                await el.type(str(amount))
+                amount_handle = el
+                amount_ok = True
+                print("[scraper] filled amount via", sel)
+            except Exception as e:
+                print("[scraper] WARN: fill amount failed:", e)
+        if not amount_ok:
+            print("[scraper] WARN: amount field not found")
+        await _maybe_dispatch(page, amount_handle)
 
     # ===== name (Dari) =====
-    name_ok = False
-    for sel in [
-        'input[name="name"]',
-        'input[placeholder*="Dari" i]',
-        'input[aria-label*="Dari" i]',
-        'label:has-text("Dari") ~ input',
-        'input[required][type="text"]',
-        'input[type="text"]',
-    ]:
-        try:
-            el = await page.wait_for_selector(sel, timeout=2000)
-            await el.scroll_into_view_if_needed()
-            await el.fill("Budi")
-            await _maybe_dispatch(page, el)
-            name_ok = True
-            print("[scraper] filled name via", sel)
-            break
-        except Exception:
-            pass
-    if not name_ok:
-        print("[scraper] WARN: name field not found")
-    await page.wait_for_timeout(150)
+    with timings.span("fill.name"):
+        name_ok = False
+        el, sel = await _wait_first(page, "name", [
+            'input[name="name"]',
+            'input[placeholder*="Dari" i]',
+            'input[aria-label*="Dari" i]',
+            'label:has-text("Dari") ~ input',
+            'input[required][type="text"]',
+            'input[type="text"]',
+        ], 2000)
+        if el:
+            try:
+                await el.scroll_into_view_if_needed()
+                await el.fill("Budi")
+                await _maybe_dispatch(page, el)
+                name_ok = True
+                print("[scraper] filled name via", sel)
+            except Exception as e:
+                print("[scraper] WARN: fill name failed:", e)
+        if not name_ok:
+            print("[scraper] WARN: name field not found")
 
     # ===== email =====
-    email_val = f"donor+{uuid.uuid4().hex[:8]}@example.com"
-    for sel in ['input[type="email"]', 'input[name="email"]', 'input[placeholder*="email" i]']:
-        try:
-            el = await page.wait_for_selector(sel, timeout=2000)
-            await el.scroll_into_view_if_needed()
-            await el.fill(email_val)
-            await _maybe_dispatch(page, el)
-            print("[scraper] filled email via", sel)
-            break
-        except Exception:
-            pass
-    await page.wait_for_timeout(150)
+    with timings.span("fill.email"):
+        email_val = f"donor+{uuid.uuid4().hex[:8]}@example.com"
+        el, sel = await _wait_first(
+            page, "email", ['input[type="email"]', 'input[name="email"]', 'input[placeholder*="email" i]'], 2000
+        )
+        if el:
+            try:
+                await el.scroll_into_view_if_needed()
+                await el.fill(email_val)
+                await _maybe_dispatch(page, el)
+                print("[scraper] filled email via", sel)
+            except Exception as e:
+                print("[scraper] WARN: fill email failed:", e)
 
     # ===== message (Pesan) — selalu INV:<invoice_id> =====
-    message = _build_inv_message(invoice_id)
-    msg_ok = False
-    for sel in [
-        'input[name="message"]',
-        'input[data-testid="message-input"]',
-        '#message',
-        'input[placeholder*="Selamat pagi" i]',
-        'input[placeholder*="pesan" i]',
-        'textarea[name="message"]',
-        'textarea',
-    ]:
-        try:
-            el = await page.wait_for_selector(sel, timeout=1800)
-            await el.scroll_into_view_if_needed()
-            await el.fill(message)
-            await _maybe_dispatch(page, el)
-            msg_ok = True
-            print("[scraper] filled message via", sel, "→", message)
-            break
-        except Exception:
-            pass
-    if not msg_ok:
-        print("[scraper] WARN: message field not found at all")
-    await page.wait_for_timeout(200)
+    with timings.span("fill.message"):
+        message = _build_inv_message(invoice_id)
+        msg_ok = False
+        el, sel = await _wait_first(page, "message", [
+            'input[name="message"]',
+            'input[data-testid="message-input"]',
+            '#message',
+            'input[placeholder*="Selamat pagi" i]',
+            'input[placeholder*="pesan" i]',
+            'textarea[name="message"]',
+            'textarea',
+        ], 1800)
+        if el:
+            try:
+                await el.scroll_into_view_if_needed()
+                await el.fill(message)
+                await _maybe_dispatch(page, el)
+                msg_ok = True
+                print("[scraper] filled message via", sel, "→", message)
+            except Exception as e:
+                print("[scraper] WARN: fill message failed:", e)
+        if not msg_ok:
+            print("[scraper] WARN: message field not found at all")
 
     # ===== centang checkbox wajib (kalau ada) =====
-    for text in ["17 tahun", "menyetujui", "kebijakan privasi", "ketentuan"]:
-        try:
-            node = page.get_by_text(re.compile(text, re.I))
-            await node.scroll_into_view_if_needed()
-            await node.click()
-            print("[scraper] checked:", text)
-        except Exception:
-            pass
-    await page.wait_for_timeout(150)
+    # (cek count dulu: locator yang tidak ada akan menunggu default timeout 30 dtk)
+    with timings.span("fill.checkbox"):
+        for text in ["17 tahun", "menyetujui", "kebijakan privasi", "ketentuan"]:
+            try:
+                node = page.get_by_text(re.compile(text, re.I)).first
+                if not await node.count():
+                    continue
+                await node.scroll_into_view_if_needed(timeout=1500)
+                await node.click(timeout=1500)
+                print("[scraper] checked:", text)
+            except Exception:
+                pass
 
     # ===== pilih metode (GoPay) =====
     if (method or "gopay").lower() == "gopay":
-        # scroll ke area metode (biar visible)
-        try:
-            area = await page.get_by_text(
-                re.compile("Moda pembayaran|Metode pembayaran|GoPay|QRIS", re.I)
-            ).element_handle()
-            if area:
-                await area.scroll_into_view_if_needed()
-        except Exception:
-            await page.mouse.wheel(0, 600)
+        with timings.span("gopay"):
+            # scroll ke area metode (biar visible)
+            try:
+                area = await page.get_by_text(
+                    re.compile("Moda pembayaran|Metode pembayaran|GoPay|QRIS", re.I)
+                ).element_handle()
+                if area:
+                    await area.scroll_into_view_if_needed()
+            except Exception:
+                await page.mouse.wheel(0, 600)
 
-        await _select_gopay_and_wait_total(page, amount)
+            await _select_gopay_and_wait_total(page, amount)
 
-    # selesai; TIDAK submit
-    await page.wait_for_timeout(350)
+    # selesai; TIDAK submit — tunggu tombol donate aktif (validasi form lolos)
+    with timings.span("fill.donate_ready"):
+        if not await _until(page, "donate", None, 3000):
+            print("[scraper] WARN: donate button not enabled yet")
 
 
 # ====== Klik DONATE + ambil target checkout ======
+_CHECKOUT_URL_KEYS = ["gopay", "qris", "xendit", "midtrans", "snap", "checkout", "pay"]
+
+
+def _is_checkout_url(url: str) -> bool:
+    u = (url or "").lower()
+    return any(k in u for k in _CHECKOUT_URL_KEYS)
+
+
+def _signal_ok(task: asyncio.Future) -> bool:
+    return task.done() and not task.cancelled() and task.exception() is None
+
+
 async def _click_donate_and_get_checkout_page(page: Page, context):
     """
     Klik "Kirim Dukungan" dan kembalikan object 'target' berisi:
@@ -327,52 +764,90 @@ async def _click_donate_and_get_checkout_page(page: Page, context):
         'text=/\\bKirim\\s+Dukungan\\b/i',
     ]
 
-    # siapkan listener tab baru (kalau ada)
-    new_page_task = context.wait_for_event("page")
-
-    clicked = False
-    for sel in donate_selectors:
-        try:
-            el = await page.wait_for_selector(sel, timeout=3000)
-            await el.scroll_into_view_if_needed()
-            await el.click()
-            print("[scraper] clicked DONATE via", sel)
-            clicked = True
-            break
-        except Exception:
-            pass
-    if not clicked:
-        raise RuntimeError("Tombol 'Kirim Dukungan' tidak ditemukan")
-
-    # 1) tab baru?
-    target_page = None
-    try:
-        target_page = await new_page_task
-    except Exception:
-        pass
-    if target_page:
-        await target_page.wait_for_load_state("domcontentloaded")
-        await target_page.wait_for_load_state("networkidle")
-        print("[scraper] checkout opened in NEW TAB:", target_page.url)
-        return {"page": target_page, "frame": None}
+    # siapkan listener: tab baru / navigasi page ini / iframe pembayaran — mana duluan
+    # (dulu menunggu event "page" sampai timeout default 30 dtk kalau checkout bukan tab baru).
+    # iframe dihitung saat NAVIGASI ke URL penyedia pembayaran, bukan saat attach:
+    # iframe analytics/captcha (about:blank) juga attach dan dulu memenangkan race.
+    wait_ms = CHECKOUT_SIGNAL_TIMEOUT_MS
+    new_page_task = asyncio.ensure_future(context.wait_for_event("page", timeout=wait_ms))
+    nav_task = asyncio.ensure_future(page.wait_for_event(
+        "framenavigated", predicate=lambda f: f == page.main_frame, timeout=wait_ms))
+    frame_task = asyncio.ensure_future(page.wait_for_event(
+        "framenavigated", predicate=lambda f: f != page.main_frame and _is_checkout_url(f.url),
+        timeout=wait_ms))
+    signal_tasks = [new_page_task, nav_task, frame_task]
 
-    # 2) same-page navigation?
     try:
-        await page.wait_for_load_state("networkidle", timeout=7000)
-        print("[scraper] checkout likely SAME PAGE:", page.url)
-        return {"page": page, "frame": None}
-    except Exception:
-        pass
-
-    # 3) iframe?
-    for fr in page.frames:
-        u = (fr.url or "").lower()
-        if any(k in u for k in ["gopay", "qris", "xendit", "midtrans", "snap", "checkout", "pay"]):
-            print("[scraper] checkout appears in IFRAME:", u[:120])
-            return {"page": None, "frame": fr}
+        with timings.span("donate_click"):
+            clicked = False
+            el, sel = await _wait_first(page, "donate", donate_selectors, 3000)
+            if el:
+                try:
+                    await el.scroll_into_view_if_needed()
+                    await el.click()
+                    print("[scraper] clicked DONATE via", sel)
+                    clicked = True
+                except Exception as e:
+                    print("[scraper] WARN: click DONATE failed:", e)
+            if not clicked:
+                raise RuntimeError("Tombol 'Kirim Dukungan' tidak ditemukan")
+
+        with timings.span("checkout_detect"):
+            # sinyal yang timeout/gagal tidak dihitung: tunggu sisanya sampai ada yang berhasil
+            pending = set(signal_tasks)
+            while pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(_signal_ok(t) for t in signal_tasks):
+                    break
 
-    print("[scraper] WARN: fallback to current page for checkout")
-    return {"page": page, "frame": None}
+            # 1) iframe pembayaran
+            if _signal_ok(frame_task) and not _signal_ok(new_page_task):
+                fr = frame_task.result()
+                print("[scraper] checkout appears in IFRAME:", (fr.url or "")[:120])
+                timings.branch("checkout", "iframe")
+                return {"page": None, "frame": fr}
+
+            # 2) same-page navigation? listener tab baru tetap jalan selama menunggu networkidle
+            if not _signal_ok(new_page_task):
+                idle_task = asyncio.ensure_future(page.wait_for_load_state("networkidle", timeout=7000))
+                await asyncio.wait({idle_task, new_page_task}, return_when=asyncio.FIRST_COMPLETED)
+                if not _signal_ok(new_page_task):
+                    try:
+                        await idle_task
+                        print("[scraper] checkout likely SAME PAGE:", page.url)
+                        timings.branch("checkout", "same_page")
+                        return {"page": page, "frame": None}
+                    except Exception:
+                        pass
+                else:
+                    idle_task.cancel()
+
+            # 3) tab baru?
+            if _signal_ok(new_page_task):
+                target_page = new_page_task.result()
+                await target_page.wait_for_load_state("domcontentloaded")
+                await target_page.wait_for_load_state("networkidle")
+                print("[scraper] checkout opened in NEW TAB:", target_page.url)
+                timings.branch("checkout", "new_tab")
+                return {"page": target_page, "frame": None}
+
+            # 4) iframe yang sudah ada sejak awal?
+            for fr in page.frames:
+                if fr is not page.main_frame and _is_checkout_url(fr.url):
+                    print("[scraper] checkout appears in IFRAME:", (fr.url or "")[:120])
+                    timings.branch("checkout", "iframe_scan")
+                    return {"page": None, "frame": fr}
+
+            print("[scraper] WARN: fallback to current page for checkout")
+            timings.branch("checkout", "fallback_current")
+            return {"page": page, "frame": None}
+    finally:
+        for t in signal_tasks:
+            if not t.done():
+                t.cancel()
+        for t in signal_tasks:
+            if t.done() and not t.cancelled():
+                t.exception()  # timeout → diabaikan
 
 
 async def _find_qr_or_checkout_panel(node: Page | Frame):
@@ -386,24 +861,19 @@ async def _find_qr_or_checkout_panel(node: Page | Frame):
         '[data-testid="qrcode"] img',
         '[class*="qrcode" i] img',
         'img[alt*="QRIS" i]',
-        "canvas",
         # panel pembayaran
         '[data-testid*="checkout" i]',
         '[class*="checkout" i]',
         'div:has-text("Cek status")',
         'div:has-text("Download QRIS")',
     ]
-    for sel in selectors:
-        try:
-            el = await node.wait_for_selector(sel, timeout=5000)
-            return el
-        except Exception:
-            pass
-    return None
+    el, _ = await _wait_first(node, "panel", selectors, 5000, generic=["canvas"])
+    return el
 
 
 # ---------- entrypoint: QR HD ----------
-async def fetch_gopay_qr_hd_png(*, invoice_id: str, amount: int) -> Optional[bytes]:
+@timings.flow("qr_hd")
+async def _fetch_gopay_qr_hd_png(*, invoice_id: str, amount: int) -> Optional[bytes]:
     """
     Isi form -> klik 'Kirim Dukungan' -> tunggu checkout GoPay/Midtrans
     -> ambil sumber <img> QR (HD). Fallback: screenshot elemen / panel.
@@ -414,8 +884,11 @@ async def fetch_gopay_qr_hd_png(*, invoice_id: str, amount: int) -> Optional[byt
         print("[scraper] ERROR: SAWERIA_USERNAME belum di-set")
         return None
 
-    context = await _new_context()
-    page = await context.new_page()
+    try:
+        context, page = await _acquire_profile_page()
+    except Exception as e:
+        print("[scraper] error(fetch_gopay_qr_hd_png): open profile failed:", e)
+        return None
 
     def _selectors():
         return [
@@ -426,126 +899,111 @@ async def fetch_gopay_qr_hd_png(*, invoice_id: str, amount: int) -> Optional[byt
             '[data-testid="qrcode"] img',
             '[class*="qrcode" i] img',
             'img[alt*="QRIS" i]',
-            "canvas",  # fallback terakhir
         ]
 
     try:
-        # 1) profil + isi form (message=INV:<invoice_id>) + pilih GoPay
-        await page.goto(PROFILE_URL, wait_until="domcontentloaded")
-        await page.wait_for_timeout(600)
-        await page.mouse.wheel(0, 500)
+        # 1) profil (sudah dibuka oleh warm pool) + isi form (message=INV:<invoice_id>) + pilih GoPay
         await _fill_without_submit(page, amount, invoice_id, "gopay")
 
         # 2) klik "Kirim Dukungan" -> checkout target
         target = await _click_donate_and_get_checkout_page(page, context)
         node: Page | Frame = target["frame"] if target["frame"] else (target["page"] or page)
-
-        # 3) cari elemen QR (img/canvas)
-        qr_handle = None
-        for sel in _selectors():
-            try:
-                qr_handle = await node.wait_for_selector(sel, timeout=3500)
-                if qr_handle:
-                    print("[scraper] QR handle via", sel)
-                    break
-            except PWError:
-                pass
-
-        # jika belum ketemu, scan semua frame yang “nyerempet” pembayaran
-        if not qr_handle:
-            frames = node.page.frames if hasattr(node, "page") and node.page else page.frames
-            for fr in frames:
-                url = (fr.url or "").lower()
-                if any(k in url for k in ["gopay", "qris", "midtrans", "snap", "checkout", "pay"]):
-                    for sel in _selectors():
-                        try:
-                            qr_handle = await fr.wait_for_selector(sel, timeout=2500)
-                            if qr_handle:
-                                print("[scraper] QR handle via", sel, "in frame", url[:100])
-                                break
-                        except PWError:
-                            pass
-                if qr_handle:
-                    break
-
-        if not qr_handle:
-            print("[scraper] WARN: QR handle not found; fallback to panel shot")
-            panel = await _find_qr_or_checkout_panel(node) or node
-            png = await (panel.screenshot() if hasattr(panel, "screenshot") else node.screenshot(full_page=True))
-            await context.close()
-            return png
-
-        # 4) ambil data bytes:
-        tag_name = await qr_handle.evaluate("(el)=>el.tagName.toLowerCase()")
-        if tag_name == "img":
-            src = await qr_handle.evaluate("(img)=>img.currentSrc || img.src || ''")
-            if not src:
-                print("[scraper] WARN: img src empty; fallback to screenshot")
-                await qr_handle.scroll_into_view_if_needed()
-                png = await qr_handle.screenshot()
-                await context.close()
+        shot_page: Page = node.page if isinstance(node, Frame) else node
+
+        # 3) cari elemen QR (img/canvas): node checkout + semua frame yang “nyerempet”
+        #    pembayaran di-race paralel (worst case = satu timeout, bukan jumlah semuanya)
+        with timings.span("qr_lookup"):
+            qr_nodes = [node] + [fr for fr in _payment_frames(shot_page) if fr is not node]
+            qr_handle, sel = await _wait_first(qr_nodes, "qr", _selectors(), 3500, generic=["canvas"])
+            if qr_handle:
+                print("[scraper] QR handle via", sel)
+
+        with timings.span("capture"):
+            if not qr_handle:
+                print("[scraper] WARN: QR handle not found; fallback to panel shot")
+                timings.branch("capture", "panel_shot")
+                panel = await _find_qr_or_checkout_panel(node) or node
+                await _enable_hidpi(shot_page)
+                png = await (panel.screenshot() if hasattr(panel, "screenshot") else node.screenshot(full_page=True))
                 return png
 
-            # data URL?
-            if src.startswith("data:image/"):
-                header, b64 = src.split(",", 1)
+            # 4) ambil data bytes:
+            tag_name = await qr_handle.evaluate("(el)=>el.tagName.toLowerCase()")
+            if tag_name == "img":
+                src = await qr_handle.evaluate("(img)=>img.currentSrc || img.src || ''")
+                if not src:
+                    print("[scraper] WARN: img src empty; fallback to screenshot")
+                    timings.branch("capture", "img_screenshot")
+                    await _enable_hidpi(shot_page)
+                    await qr_handle.scroll_into_view_if_needed()
+                    png = await qr_handle.screenshot()
+                    return png
+
+                # data URL?
+                if src.startswith("data:image/"):
+                    header, b64 = src.split(",", 1)
+                    try:
+                        data = base64.b64decode(b64)
+                        timings.branch("capture", "data_url")
+                        return data
+                    except Exception as e:
+                        print("[scraper] WARN: decode data URL failed:", e)
+
+                # absolute-kan jika relatif terhadap halaman/iframe
+                base_url = node.url if hasattr(node, "url") else page.url
+                abs_url = urljoin(base_url, src)
+
+                # download pakai context.request → dapat bytes murni
                 try:
-                    data = base64.b64decode(b64)
-                    await context.close()
-                    return data
+                    r = await context.request.get(
+                        abs_url,
+                        headers={
+                            "Referer": base_url,
+                            "User-Agent": await page.evaluate("() => navigator.userAgent"),
+                            "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+                        },
+                        timeout=15000,
+                    )
+                    if r.ok:
+                        data = await r.body()
+                        print("[scraper] downloaded QR img bytes:", len(data))
+                        timings.branch("capture", "img_download")
+                        return data
+                    else:
+                        print("[scraper] WARN: request img failed", r.status)
                 except Exception as e:
-                    print("[scraper] WARN: decode data URL failed:", e)
+                    print("[scraper] WARN: fetch img error:", e)
 
-            # absolute-kan jika relatif terhadap halaman/iframe
-            base_url = node.url if hasattr(node, "url") else page.url
-            abs_url = urljoin(base_url, src)
-
-            # download pakai context.request → dapat bytes murni
-            try:
-                r = await context.request.get(
-                    abs_url,
-                    headers={
-                        "Referer": base_url,
-                        "User-Agent": await page.evaluate("() => navigator.userAgent"),
-                        "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
-                    },
-                    timeout=15000,
-                )
-                if r.ok:
-                    data = await r.body()
-                    print("[scraper] downloaded QR img bytes:", len(data))
-                    await context.close()
-                    return data
-                else:
-                    print("[scraper] WARN: request img failed", r.status)
-            except Exception as e:
-                print("[scraper] WARN: fetch img error:", e)
+                # fallback: screenshot elemen
+                timings.branch("capture", "img_screenshot")
+                await _enable_hidpi(shot_page)
+                await qr_handle.scroll_into_view_if_needed()
+                png = await qr_handle.screenshot()
+                return png
 
-            # fallback: screenshot elemen
+            # tag bukan IMG (mis. canvas) → screenshot
+            timings.branch("capture", f"{tag_name}_screenshot")
+            await _enable_hidpi(shot_page)
             await qr_handle.scroll_into_view_if_needed()
             png = await qr_handle.screenshot()
-            await context.close()
             return png
 
-        # tag bukan IMG (mis. canvas) → screenshot
-        await qr_handle.scroll_into_view_if_needed()
-        png = await qr_handle.screenshot()
-        await context.close()
-        return png
-
     except Exception as e:
         print("[scraper] error(fetch_gopay_qr_hd_png):", e)
+        timings.branch("capture", "error")
         try:
             snap = await page.screenshot(full_page=True)
             print("[scraper] debug page screenshot bytes:", len(snap))
         except Exception:
             pass
-        await context.close()
         return None
+    finally:
+        await _close_context(context)
 
 
 # ---------- entrypoints tambahan (opsional / debugging) ----------
-async def fetch_qr_png(*, invoice_id: str, amount: int, method: Optional[str] = "gopay") -> Optional[bytes]:
+@timings.flow("fill_panel")
+async def _fetch_qr_png(*, invoice_id: str, amount: int, method: Optional[str] = "gopay") -> Optional[bytes]:
     """
     TANPA submit: isi form (message=INV:<invoice_id>) + pilih GoPay → screenshot panel/halaman (untuk debugging).
     """
@@ -554,14 +1012,15 @@ async def fetch_qr_png(*, invoice_id: str, amount: int, method: Optional[str] =
         return None
 
     context = await _new_context()
-    page = await context.new_page()
+    page = None
     try:
-        await page.goto(PROFILE_URL, wait_until="domcontentloaded")
-        await page.wait_for_timeout(700)
+        page = await context.new_page()
+        with timings.span("goto"):
+            await page.goto(PROFILE_URL, wait_until="domcontentloaded")
+            await _until(page, "form", timeout_ms=8000)
         await page.mouse.wheel(0, 480)
 
         await _fill_without_submit(page, amount, invoice_id, method or "gopay")
-        await page.wait_for_timeout(700)
 
         target = page
         el = await _scan_all_frames_for_visual(target)
@@ -577,7 +1036,6 @@ async def fetch_qr_png(*, invoice_id: str, amount: int, method: Optional[str] =
             png = await target.screenshot(full_page=False)
             print("[scraper] WARN: no panel; page screenshot:", len(png))
 
-        await context.close()
         return png
 
     except Exception as e:
@@ -587,11 +1045,13 @@ async def fetch_qr_png(*, invoice_id: str, amount: int, method: Optional[str] =
             print("[scraper] debug page screenshot bytes:", len(snap))
         except Exception:
             pass
-        await context.close()
         return None
+    finally:
+        await _close_context(context)
 
 
-async def fetch_gopay_checkout_png(*, invoice_id: str, amount: int) -> Optional[bytes]:
+@timings.flow("checkout")
+async def _fetch_gopay_checkout_png(*, invoice_id: str, amount: int) -> Optional[bytes]:
     """
     Klik 'Kirim Dukungan' dan screenshot panel checkout (jika butuh tampilan penuh).
     Pesan di field selalu INV:<invoice_id>.
@@ -600,19 +1060,19 @@ async def fetch_gopay_checkout_png(*, invoice_id: str, amount: int) -> Optional[
         print("[scraper] ERROR: SAWERIA_USERNAME belum di-set")
         return None
 
-    context = await _new_context()
-    page = await context.new_page()
     try:
-        await page.goto(PROFILE_URL, wait_until="domcontentloaded")
-        await page.wait_for_timeout(700)
-        await page.mouse.wheel(0, 480)
-
+        context, page = await _acquire_profile_page()
+    except Exception as e:
+        print("[scraper] error(fetch_gopay_checkout_png): open profile failed:", e)
+        return None
+    try:
         await _fill_without_submit(page, amount, invoice_id, "gopay")
         target = await _click_donate_and_get_checkout_page(page, context)
         node = target["frame"] if target["frame"] else (target["page"] or page)
 
         el = await _find_qr_or_checkout_panel(node)
         if el:
+            await _enable_hidpi(node.page if isinstance(node, Frame) else node)
             await el.scroll_into_view_if_needed()
             png = await el.screenshot()
             print("[scraper] captured CHECKOUT panel PNG:", len(png))
@@ -623,7 +1083,6 @@ async def fetch_gopay_checkout_png(*, invoice_id: str, amount: int) -> Optional[
             else:
                 png = await page.screenshot(full_page=True)
             print("[scraper] WARN: no specific QR element; page screenshot:", len(png))
-        await context.close()
         return png
 
     except Exception as e:
@@ -633,49 +1092,113 @@ async def fetch_gopay_checkout_png(*, invoice_id: str, amount: int) -> Optional[
             print("[scraper] debug page screenshot bytes:", len(snap))
         except Exception:
             pass
-        await context.close()
         return None
+    finally:
+        await _close_context(context)
 
 
 # ---------- debug helpers ----------
-async def debug_snapshot() -> Optional[bytes]:
+@timings.flow("debug_snapshot")
+async def _debug_snapshot() -> Optional[bytes]:
     if not PROFILE_URL:
         print("[debug_snapshot] ERROR: SAWERIA_USERNAME belum di-set")
         return None
     context = await _new_context()
-    page = await context.new_page()
-    await page.goto(PROFILE_URL, wait_until="domcontentloaded")
-    await page.wait_for_timeout(1000)
-    await page.mouse.wheel(0, 600)
-    png = await page.screenshot(full_page=True)
-    await context.close()
-    return png
-
-
-async def debug_fill_snapshot(*, invoice_id: str, amount: int, method: str = "gopay") -> Optional[bytes]:
+    try:
+        page = await context.new_page()
+        with timings.span("goto"):
+            await page.goto(PROFILE_URL, wait_until="domcontentloaded")
+            await _until(page, "form", timeout_ms=8000)
+        await page.mouse.wheel(0, 600)
+        return await page.screenshot(full_page=True)
+    finally:
+        # goto/screenshot gagal → context tetap ditutup (slot browser tidak bocor)
+        await _close_context(context)
+
+
+@timings.flow("debug_fill")
+async def _debug_fill_snapshot(*, invoice_id: str, amount: int, method: str = "gopay") -> Optional[bytes]:
     if not PROFILE_URL:
         print("[debug_fill_snapshot] ERROR: SAWERIA_USERNAME belum di-set")
         return None
     context = await _new_context()
-    page = await context.new_page()
+    page = None
     try:
-        await page.goto(PROFILE_URL, wait_until="domcontentloaded")
-        await page.wait_for_timeout(700)
+        page = await context.new_page()
+        with timings.span("goto"):
+            await page.goto(PROFILE_URL, wait_until="domcontentloaded")
+            await _until(page, "form", timeout_ms=8000)
         await page.mouse.wheel(0, 480)
 
         await _fill_without_submit(page, amount, invoice_id, method or "gopay")
-        await page.wait_for_timeout(700)
 
         png = await page.screenshot(full_page=True)
         print(f"[debug_fill_snapshot] bytes={len(png)}")
-        await context.close()
         return png
     except Exception as e:
         print("[debug_fill_snapshot] error:", e)
         try:
             snap = await page.screenshot(full_page=True)
-            await context.close()
             return snap
         except Exception:
-            await context.close()
             return None
+    finally:
+        await _close_context(context)
+
+
+# ---------- entrypoints publik (lewat scheduler) ----------
+# Semua pemanggilan Chromium dari luar modul melewati scheduler supaya jumlah
+# context paralel dibatasi. SchedulerBusy / JobExpired diteruskan ke caller.
+async def _fetch_gopay_qr_hd_png_in_worker(*, invoice_id: str, amount: int) -> Optional[bytes]:
+    return await workers.run("_fetch_gopay_qr_hd_png", invoice_id=invoice_id, amount=amount)
+
+
+async def fetch_gopay_qr(
+    *, invoice_id: str, amount: int,
+    priority: int = PRIO_INTERACTIVE, deadline: Optional[float] = None,
+) -> Optional[Union[str, bytes]]:
+    """QR invoice: teks QRIS (str, backend HTTP dengan qr_string) atau bytes gambar hasil capture."""
+    if QR_BACKEND == "http":
+        # jalur HTTP tidak memakai Chromium → tidak perlu lewat scheduler
+        res = await saweria_http.fetch_gopay_qr_http(invoice_id=invoice_id, amount=amount)
+        if res:
+            return res
+        print("[scraper] HTTP backend failed; fallback to Playwright")
+    fn = _fetch_gopay_qr_hd_png_in_worker if workers.enabled() else _fetch_gopay_qr_hd_png
+    return await scheduler.run(
+        fn, invoice_id=invoice_id, amount=amount,
+        priority=priority, deadline=deadline,
+    )
+
+
+async def fetch_gopay_qr_hd_png(
+    *, invoice_id: str, amount: int,
+    priority: int = PRIO_INTERACTIVE, deadline: Optional[float] = None,
+) -> Optional[bytes]:
+    """Seperti fetch_gopay_qr, tapi selalu PNG (debug endpoint / bench)."""
+    res = await fetch_gopay_qr(invoice_id=invoice_id, amount=amount, priority=priority, deadline=deadline)
+    if isinstance(res, str):
+        return (await qr.render_async(res))[0]
+    return res
+
+
+async def fetch_qr_png(*, invoice_id: str, amount: int, method: Optional[str] = "gopay") -> Optional[bytes]:
+    return await scheduler.run(
+        _fetch_qr_png, invoice_id=invoice_id, amount=amount, method=method, priority=PRIO_DEBUG,
+    )
+
+
+async def fetch_gopay_checkout_png(*, invoice_id: str, amount: int) -> Optional[bytes]:
+    return await scheduler.run(
+        _fetch_gopay_checkout_png, invoice_id=invoice_id, amount=amount, priority=PRIO_DEBUG,
+    )
+
+
+async def debug_snapshot() -> Optional[bytes]:
+    return await scheduler.run(_debug_snapshot, priority=PRIO_DEBUG)
+
+
+async def debug_fill_snapshot(*, invoice_id: str, amount: int, method: str = "gopay") -> Optional[bytes]:
+    return await scheduler.run(
+        _debug_fill_snapshot, invoice_id=invoice_id, amount=amount, method=method, priority=PRIO_DEBUG,
+    )
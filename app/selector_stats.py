@@ -0,0 +1,187 @@
+# app/selector_stats.py
+# ------------------------------------------------------------
+# Registry selector adaptif untuk scraper:
+#  - catat hit/miss + waktu-sampai-match per (grup, selector)
+#  - urutkan kandidat: pemenang historis dicoba duluan
+#  - timeout mengikuti p95 waktu match (bukan angka hardcode)
+#  - statistik disimpan di SQLite (tabel selector_stats) agar awet restart;
+#    dimuat lewat astorage (load() di main.on_start, atau background task saat
+#    pertama dipakai) — tidak ada baca SQLite sinkron di event loop
+#
+# Grup = nama lookup di scraper, mis. "amount", "gopay", "donate", "qr".
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import astorage, storage
+
+SAMPLES_KEEP = 50         # sampel waktu match terakhir per selector
+MIN_SAMPLES = 5           # di bawah ini pakai timeout default
+TIMEOUT_FACTOR = 1.5      # p95 * faktor + margin
+TIMEOUT_MARGIN_MS = 250
+TIMEOUT_FLOOR_MS = 600
+FLUSH_INTERVAL = 30.0     # detik
+
+# (grup, selector) -> {"hits": int, "misses": int, "samples": [ms, ...]}
+_STATS: Dict[Tuple[str, str], dict] = {}
+_DIRTY: set = set()
+_LOADED = False  # isi DB sudah digabung; sebelum itu tidak flush (upsert menimpa total di DB)
+_LOAD_TASK: Optional[asyncio.Task] = None
+_LAST_FLUSH = 0.0
+
+
+def _merge(rows: List[dict]):
+    for row in rows:
+        key = (row["grp"], row["selector"])
+        ent = _STATS.get(key)
+        if ent is None:
+            _STATS[key] = {
+                "hits": row["hits"],
+                "misses": row["misses"],
+                "samples": row["samples"][-SAMPLES_KEEP:],
+            }
+        else:
+            # sudah tercatat sebelum load selesai: gabungkan (flush berikutnya menulis totalnya)
+            ent["hits"] += row["hits"]
+            ent["misses"] += row["misses"]
+            ent["samples"] = (row["samples"] + ent["samples"])[-SAMPLES_KEEP:]
+
+
+async def load():
+    """Muat statistik dari SQLite lewat astorage. Dipanggil dari main.on_start; cukup sekali."""
+    global _LOADED
+    if _LOADED:
+        return
+    try:
+        rows = await astorage.load_selector_stats()
+        if not _LOADED:  # load paralel (on_start + background) → gabung sekali
+            _merge(rows)
+    except Exception as e:
+        print("[selectors] load stats failed:", e)
+    _LOADED = True
+
+
+def _ensure_loaded():
+    """Belum di-load (proses worker / CLI): mulai load di background, pakai yang ada dulu."""
+    global _LOAD_TASK
+    if _LOADED or _LOAD_TASK is not None:
+        return
+    try:
+        _LOAD_TASK = asyncio.get_running_loop().create_task(load())
+    except RuntimeError:
+        pass  # tidak ada loop (mis. thread endpoint sync): coba lagi di panggilan berikutnya
+
+
+def _entry(group: str, selector: str) -> dict:
+    _ensure_loaded()
+    key = (group, selector)
+    ent = _STATS.get(key)
+    if ent is None:
+        ent = _STATS[key] = {"hits": 0, "misses": 0, "samples": []}
+    return ent
+
+
+def _p95(values: List[float]) -> float:
+    vals = sorted(values)
+    return vals[min(len(vals) - 1, int(round(0.95 * (len(vals) - 1))))]
+
+
+def ordered(group: str, candidates: List[str]) -> List[str]:
+    """Urutkan kandidat: hit-rate (Laplace) tertinggi dulu, lalu rata-rata waktu match tercepat."""
+    _ensure_loaded()
+
+    def score(item):
+        idx, sel = item
+        ent = _STATS.get((group, sel))
+        if not ent:
+            return (-0.5, float("inf"), idx)  # belum ada data: posisi netral, urutan asli
+        rate = (ent["hits"] + 1) / (ent["hits"] + ent["misses"] + 2)
+        avg = sum(ent["samples"]) / len(ent["samples"]) if ent["samples"] else float("inf")
+        return (-rate, avg, idx)
+
+    return [sel for _, sel in sorted(enumerate(candidates), key=score)]
+
+
+def timeout_ms(group: str, default_ms: int) -> int:
+    """Timeout adaptif untuk grup: p95 waktu match * faktor, dibatasi [floor, default]."""
+    _ensure_loaded()
+    samples: List[float] = []
+    for (grp, _sel), ent in _STATS.items():
+        if grp == group:
+            samples.extend(ent["samples"])
+    if len(samples) < MIN_SAMPLES:
+        return default_ms
+    t = _p95(samples) * TIMEOUT_FACTOR + TIMEOUT_MARGIN_MS
+    return int(max(TIMEOUT_FLOOR_MS, min(default_ms, t)))
+
+
+def record_hit(group: str, selector: str, elapsed_ms: float):
+    ent = _entry(group, selector)
+    ent["hits"] += 1
+    ent["samples"].append(round(elapsed_ms, 1))
+    del ent["samples"][:-SAMPLES_KEEP]
+    _DIRTY.add((group, selector))
+    maybe_flush()
+
+
+def record_miss(group: str, selector: str):
+    _entry(group, selector)["misses"] += 1
+    _DIRTY.add((group, selector))
+    maybe_flush()
+
+
+def _take_dirty():
+    global _LAST_FLUSH
+    _LAST_FLUSH = time.monotonic()
+    keys = list(_DIRTY)
+    _DIRTY.clear()
+    rows = [
+        {"grp": g, "selector": s, "hits": _STATS[(g, s)]["hits"],
+         "misses": _STATS[(g, s)]["misses"], "samples": list(_STATS[(g, s)]["samples"])}
+        for g, s in keys
+    ]
+    return keys, rows
+
+
+def maybe_flush():
+    """Flush berkala dari scraper: tulis lewat antrian writer, tidak memblok event loop."""
+    if not _LOADED or time.monotonic() - _LAST_FLUSH < FLUSH_INTERVAL:
+        return
+    keys, rows = _take_dirty()
+    if rows:
+        astorage.submit_write(storage.save_selector_stats, rows, on_error=lambda: _DIRTY.update(keys))
+
+
+def flush():
+    """Tulis entri yang berubah ke SQLite (sinkron; dipakai saat shutdown)."""
+    if not _LOADED:
+        return  # isi DB belum pernah digabung: jangan timpa total lama dengan hitungan parsial
+    keys, rows = _take_dirty()
+    if not rows:
+        return
+    try:
+        storage.save_selector_stats(rows)
+    except Exception as e:
+        _DIRTY.update(keys)
+        print("[selectors] flush stats failed:", e)
+
+
+def snapshot() -> Dict[str, list]:
+    """Ringkasan per grup (untuk debug endpoint)."""
+    _ensure_loaded()
+    out: Dict[str, list] = {}
+    for (grp, sel), ent in _STATS.items():
+        out.setdefault(grp, []).append({
+            "selector": sel,
+            "hits": ent["hits"],
+            "misses": ent["misses"],
+            "p95_ms": _p95(ent["samples"]) if ent["samples"] else None,
+        })
+    for grp, items in out.items():
+        order = ordered(grp, [i["selector"] for i in items])
+        items.sort(key=lambda i: order.index(i["selector"]))
+    return out
@@ -0,0 +1,299 @@
+# app/standin.py
+# ------------------------------------------------------------
+# Stand-in lokal untuk saweria.co (offline), dipakai benchmark & uji scraper:
+#   GET  /{username}            halaman profil + form donasi (selector sama
+#                               dengan yang dicari scraper.py)
+#   POST /api/donate            dipanggil tombol "Kirim Dukungan"
+#   GET  /checkout/{id}         halaman checkout GoPay/Midtrans-style
+#   GET  /qr/{id}.png           gambar QR (QRIS EMV dengan amount + CRC)
+#   GET  /users/{username}      \  meniru API backend untuk saweria_http.py
+#   POST /donations/{sid}       /  (SAWERIA_API_BASE=http://host:port)
+#   POST /donations/{id}/pay    tandai donasi dibayar (simulasi; tanpa webhook)
+#   GET  /donations             riwayat donasi dibayar, terbaru dulu
+#                               (?page=&page_size=; feed untuk reconcile.py)
+#
+# Perilaku bisa diatur lewat query di PROFILE_URL (diteruskan ke checkout)
+# atau ENV STANDIN_<NAMA> sebagai default:
+#   checkout   same_page | new_tab | iframe          (default same_page)
+#   qr         img | canvas | data_url               (default img)
+#   latency    ms delay tiap respons HTML/API        (default 0)
+#   total_ms   ms sampai "Total" terisi setelah GoPay (default 150)
+#   checkout_ms ms setelah klik donate sampai checkout muncul (default 300)
+#   qr_ms      ms delay respons gambar QR            (default 0)
+#   fail       none | no_gopay | qr_404 | donate_500 (default none)
+#   fail_rate  0..1 peluang mode `fail` aktif per request (default 1)
+#
+# Jalankan:  python -m app.standin --port 8099
+# lalu       SAWERIA_PROFILE_URL=http://127.0.0.1:8099/demo?checkout=iframe
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+
+from . import qr
+
+_DEFAULTS: Dict[str, Any] = {
+    "checkout": "same_page",
+    "qr": "img",
+    "latency": 0,
+    "total_ms": 150,
+    "checkout_ms": 300,
+    "qr_ms": 0,
+    "fail": "none",
+    "fail_rate": 1.0,
+}
+
+# id -> {"amount", "message", "created_at", "qris", "paid_at"}
+DONATIONS: Dict[str, Dict[str, Any]] = {}
+
+app = FastAPI(title="saweria stand-in")
+
+
+def _opts(request: Request) -> Dict[str, Any]:
+    out = {}
+    for key, default in _DEFAULTS.items():
+        raw = request.query_params.get(key, os.getenv(f"STANDIN_{key.upper()}"))
+        if raw is None:
+            out[key] = default
+        elif isinstance(default, (int, float)):
+            try:
+                out[key] = type(default)(raw)
+            except ValueError:
+                out[key] = default
+        else:
+            out[key] = raw
+    return out
+
+
+def _failing(opts: Dict[str, Any], mode: str) -> bool:
+    return opts["fail"] == mode and random.random() < float(opts["fail_rate"])
+
+
+async def _delay(ms) -> None:
+    if ms and float(ms) > 0:
+        await asyncio.sleep(float(ms) / 1000)
+
+
+# ---------- QRIS palsu tapi valid secara format (TLV + CRC16/CCITT dari qr.py) ----------
+def _tlv(tag: str, value: str) -> str:
+    return f"{tag}{len(value):02d}{value}"
+
+
+def build_qris(amount: int, ref: str) -> str:
+    body = (
+        _tlv("00", "01") + _tlv("01", "12")
+        + _tlv("26", _tlv("00", "ID.CO.GOPAY.WWW") + _tlv("01", "936009140000000000"))
+        + _tlv("52", "5812") + _tlv("53", "360") + _tlv("54", str(int(amount)))
+        + _tlv("58", "ID") + _tlv("59", "SAWERIA STANDIN") + _tlv("60", "JAKARTA")
+        + _tlv("62", _tlv("05", ref[:25]))
+        + "6304"
+    )
+    return body + qr.crc16(body)
+
+
+def _new_donation(amount: int, message: str) -> Dict[str, Any]:
+    did = str(uuid.uuid4())
+    don = {
+        "id": did,
+        "amount": int(amount),
+        "message": message,
+        "created_at": time.time(),
+        "qris": build_qris(amount, did.replace("-", "")),
+        "paid_at": None,
+    }
+    DONATIONS[did] = don
+    return don
+
+
+# ---------- halaman profil ----------
+_PROFILE_HTML = """<!doctype html>
+<html lang="id"><head><meta charset="utf-8"><title>__USER__ | Saweria</title>
+<style>
+ body{font-family:sans-serif;max-width:560px;margin:24px auto;padding:0 12px}
+ label{display:block;margin:10px 0 4px} input,textarea{width:100%;padding:8px}
+ .methods{margin:16px 0} .hero{height:420px;background:#fde68a}
+ button{padding:10px 14px;margin:4px 0}
+</style></head><body>
+<div class="hero">__USER__</div>
+<form id="f" onsubmit="return false">
+  <label>Nominal</label>
+  <input type="number" name="amount" placeholder="Ketik jumlah dukungan" aria-label="Nominal">
+  <label>Dari</label>
+  <input type="text" name="name" placeholder="Dari" required>
+  <label>Email</label>
+  <input type="email" name="email" placeholder="email@contoh.com">
+  <label>Pesan</label>
+  <input type="text" name="message" data-testid="message-input" placeholder="Selamat pagi!">
+  <label><input type="checkbox" id="c17"> Saya berusia 17 tahun atau lebih</label>
+  <label><input type="checkbox" id="ctos"> Saya menyetujui kebijakan privasi &amp; ketentuan</label>
+  <div class="methods">
+    <div>Moda pembayaran</div>
+    __GOPAY__
+  </div>
+  <div>Jumlah Dukungan: <span id="jml">Rp0</span></div>
+  <div>Total: <span id="tot">Rp0</span></div>
+  <button type="button" data-testid="donate-button" id="donate" disabled>Kirim Dukungan</button>
+</form>
+<div id="checkout-slot"></div>
+<script>
+const OPTS = __OPTS__;
+const $ = (s) => document.querySelector(s);
+const fmt = (n) => "Rp" + String(n).replace(/\\B(?=(\\d{3})+(?!\\d))/g, ".");
+let method = null;
+function amount() { return parseInt($('input[name="amount"]').value || "0", 10) || 0; }
+function validate() {
+  $("#jml").textContent = fmt(amount());
+  const ok = amount() > 0 && $('input[name="name"]').value && method &&
+             $("#c17").checked && $("#ctos").checked;
+  $("#donate").disabled = !ok;
+}
+document.querySelectorAll("input").forEach(el => {
+  el.addEventListener("input", validate); el.addEventListener("change", validate);
+});
+const gp = $('[data-testid="gopay-button"]');
+if (gp) gp.addEventListener("click", () => {
+  method = "gopay"; gp.setAttribute("aria-checked", "true");
+  setTimeout(() => { $("#tot").textContent = fmt(amount()); validate(); }, OPTS.total_ms);
+});
+$("#donate").addEventListener("click", async () => {
+  const body = { amount: amount(), message: $('input[name="message"]').value,
+                 email: $('input[name="email"]').value, name: $('input[name="name"]').value };
+  const r = await fetch("/api/donate" + location.search, {
+    method: "POST", headers: {"Content-Type": "application/json"}, body: JSON.stringify(body) });
+  if (!r.ok) { $("#donate").textContent = "Gagal, coba lagi"; return; }
+  const d = await r.json();
+  const url = "/checkout/" + d.id + location.search;
+  setTimeout(() => {
+    if (OPTS.checkout === "new_tab") window.open(url, "_blank");
+    else if (OPTS.checkout === "iframe") {
+      const f = document.createElement("iframe");
+      f.src = url; f.width = 420; f.height = 560;
+      $("#checkout-slot").appendChild(f);
+    } else location.href = url;
+  }, OPTS.checkout_ms);
+});
+</script></body></html>"""
+
+_GOPAY_BTN = '<button type="button" role="radio" data-testid="gopay-button">GoPay</button>'
+
+
+@app.get("/users/{username}")
+async def api_user(username: str, request: Request):
+    await _delay(_opts(request)["latency"])
+    return {"data": {"id": f"standin-{username}", "username": username}}
+
+
+@app.post("/donations/{streamer_id}")
+async def api_donation(streamer_id: str, request: Request):
+    opts = _opts(request)
+    await _delay(opts["latency"])
+    if _failing(opts, "donate_500"):
+        raise HTTPException(500, "stand-in: donate failure")
+    body = await request.json()
+    don = _new_donation(int(body.get("amount") or 0), str(body.get("message") or ""))
+    return {"data": {"id": don["id"], "amount": don["amount"], "qr_string": don["qris"]}}
+
+
+@app.post("/api/donate")
+async def donate(request: Request):
+    opts = _opts(request)
+    await _delay(opts["latency"])
+    if _failing(opts, "donate_500"):
+        return JSONResponse({"error": "stand-in: donate failure"}, status_code=500)
+    body = await request.json()
+    don = _new_donation(int(body.get("amount") or 0), str(body.get("message") or ""))
+    return {"id": don["id"]}
+
+
+@app.get("/checkout/{donation_id}", response_class=HTMLResponse)
+async def checkout(donation_id: str, request: Request):
+    opts = _opts(request)
+    await _delay(opts["latency"])
+    don = DONATIONS.get(donation_id)
+    if not don:
+        raise HTTPException(404, "donation not found")
+    qs = request.url.query
+    src = f"/qr/{donation_id}.png" + (f"?{qs}" if qs else "")
+    if opts["qr"] == "canvas":
+        qr_html = (
+            '<canvas id="qrc" width="300" height="300" data-testid="qrcode"></canvas>'
+            f'<script>const i=new Image();i.onload=()=>document.getElementById("qrc")'
+            f'.getContext("2d").drawImage(i,0,0,300,300);i.src={json.dumps(src)};</script>'
+        )
+    elif opts["qr"] == "data_url":
+        b64 = base64.b64encode(qr.render(don["qris"], "png", 300)[0]).decode()
+        qr_html = f'<img class="qr-image" alt="qr-code" src="data:image/png;base64,{b64}">'
+    else:
+        qr_html = f'<img class="qr-image" alt="qr-code" src="{src}" width="300" height="300">'
+    return f"""<!doctype html><html><head><meta charset="utf-8"><title>Checkout GoPay</title></head>
+<body><div data-testid="checkout-panel" class="checkout">
+<h3>Bayar dengan GoPay / QRIS</h3>{qr_html}
+<p>Total: Rp{don['amount']}</p><div>Cek status</div><div>Download QRIS</div>
+</div></body></html>"""
+
+
+@app.get("/qr/{donation_id}.png")
+async def qr_image(donation_id: str, request: Request):
+    opts = _opts(request)
+    await _delay(opts["qr_ms"])
+    don = DONATIONS.get(donation_id)
+    if not don or _failing(opts, "qr_404"):
+        return Response(b"not found", status_code=404)
+    return Response(qr.render(don["qris"], "png", 300)[0], media_type="image/png")
+
+
+@app.post("/donations/{donation_id}/pay")
+async def api_pay(donation_id: str):
+    don = DONATIONS.get(donation_id)
+    if not don:
+        raise HTTPException(404, "donation not found")
+    don["paid_at"] = don["paid_at"] or time.time()
+    return {"data": {"id": donation_id, "paid_at": don["paid_at"]}}
+
+
+@app.get("/donations")
+async def api_donations(request: Request, page: int = 1, page_size: int = 50):
+    await _delay(_opts(request)["latency"])
+    paid = sorted((d for d in DONATIONS.values() if d["paid_at"]), key=lambda d: (d["paid_at"], d["id"]), reverse=True)
+    start = max(0, page - 1) * page_size
+    items = [
+        {"id": d["id"], "amount": d["amount"], "message": d["message"], "created_at": d["paid_at"]}
+        for d in paid[start:start + page_size]
+    ]
+    return {"data": {"donations": items, "page": page, "total": len(paid)}}
+
+
+@app.get("/{username}", response_class=HTMLResponse)
+async def profile(username: str, request: Request):
+    opts = _opts(request)
+    await _delay(opts["latency"])
+    gopay = "" if _failing(opts, "no_gopay") else _GOPAY_BTN
+    return (_PROFILE_HTML
+            .replace("__USER__", username)
+            .replace("__GOPAY__", gopay)
+            .replace("__OPTS__", json.dumps(opts)))
+
+
+def main():
+    import uvicorn
+    ap = argparse.ArgumentParser(description="Stand-in lokal saweria.co")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    args = ap.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
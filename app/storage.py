@@ -2,8 +2,31 @@
 # ------------------------------------------------------------
 # Penyimpanan sederhana pakai SQLite.
 # Table:
-# - invoices(invoice_id, user_id, amount, groups_json, status, qris_payload, paid_at, created_at)
+# - invoices(invoice_id, user_id, amount, groups_json, groups_key, status, qris_payload, qr_hash, paid_at, created_at)
+#   groups_key = id grup terurut (dipakai mencari invoice PENDING yang bisa dipakai ulang)
+# - qr_blobs(hash, mime, data, created_at) -> gambar QR (bytes mentah), content-addressed sha256;
+#   invoices.qr_hash menunjuk ke sini, qris_payload hanya teks QRIS (~200 byte)
 # - invite_logs(id, invoice_id, group_id, invite_link, error, created_at)
+# - qr_jobs(invoice_id, owner, started_at)  -> lock generate QR lintas proses
+# - selector_stats(grp, selector, hits, misses, samples_json, updated_at)
+# - invite_outbox(id, invoice_id, group_id, user_id, state, attempts, next_at,
+#                 lease_owner, lease_until, last_error, created_at, updated_at)
+#   -> antrian kirim undangan per (invoice, grup); state pending|sending|sent|failed
+# - webhook_events(event_key, invoice_id, received_at) -> event webhook yang sudah diproses (dedupe)
+# - meta(key, value, updated_at) -> state kecil awet (mis. cursor reconcile.py)
+# - schema_version(version, name, applied_at) -> migrasi yang sudah jalan (MIGRATIONS)
+#
+# Status invoice: PENDING -> PAID, atau PENDING -> EXPIRED (retention.py).
+#
+# Koneksi: satu koneksi awet per thread (bukan connect/close tiap query),
+# WAL + pragma di bawah; statement cache sqlite3 jadi terpakai ulang.
+#
+# ENV:
+#   DB_PATH
+#   SQLITE_BUSY_TIMEOUT_MS  (default 5000)
+#   SQLITE_CACHE_KB         page cache per koneksi (default 16384)
+#   SQLITE_MMAP_MB          (default 128, 0=mati)
+#   SQLITE_SYNCHRONOUS      (default NORMAL; aman untuk WAL)
 # ------------------------------------------------------------
 
 from __future__ import annotations
@@ -11,31 +34,88 @@ from __future__ import annotations
 import os
 import sqlite3
 import json
+import base64
+import hashlib
+import threading
 import uuid
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 DB_PATH = os.getenv("DB_PATH", "/data/app.db")
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "128"))
+SYNCHRONOUS = (os.getenv("SQLITE_SYNCHRONOUS", "NORMAL") or "NORMAL").upper()
+
+# RETURNING butuh SQLite >= 3.35; di bawah itu pakai SELECT ulang
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
 
 # ---------- koneksi ----------
-def _get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+_LOCAL = threading.local()
+_ALL_CONNS: List[sqlite3.Connection] = []
+_ALL_LOCK = threading.Lock()
+
+
+def _open() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=256,
+    )
     conn.row_factory = sqlite3.Row
+    # harus sebelum journal_mode; hanya berlaku untuk file DB baru
+    # (DB lama: python -m app.retention --convert-vacuum)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_MB * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Koneksi awet milik thread ini (dibuka sekali; dibuka ulang setelah fork)."""
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is None or _LOCAL.pid != os.getpid():
+        conn = _open()
+        _LOCAL.conn, _LOCAL.pid = conn, os.getpid()
+        with _ALL_LOCK:
+            _ALL_CONNS.append(conn)
     return conn
 
-def _conn():
-    return sqlite3.connect(DB_PATH)
+_conn = _get_conn
+
+
+def close():
+    """Tutup semua koneksi (dipanggil saat shutdown)."""
+    with _ALL_LOCK:
+        conns = list(_ALL_CONNS)
+        _ALL_CONNS.clear()
+    for c in conns:
+        try:
+            c.close()
+        except Exception:
+            pass
+    _LOCAL.__dict__.clear()
 
 def _table_has_column(conn, table: str, col: str) -> bool:
     cur = conn.execute(f'PRAGMA table_info("{table}")')
     return any((r[1] == col) for r in cur.fetchall())
 
-def init_db():
-    conn = _conn()
-    cur = conn.cursor()
+def _add_column(conn, table: str, col: str, decl: str) -> None:
+    # hanya dipakai di migrasi (DB lama bisa sudah punya kolomnya)
+    if not _table_has_column(conn, table, col):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {col} {decl}')
 
-    # invoices (biarkan seperti yang sudah ada di projectmu)
-    cur.execute("""
+
+# ---------- migrasi skema ----------
+# Urutan tetap; tiap migrasi jalan sekali lalu dicatat di schema_version.
+# Tambah migrasi baru di akhir list — JANGAN ubah migrasi yang sudah rilis.
+def _m001_base(conn):
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS invoices (
       invoice_id TEXT PRIMARY KEY,
       user_id    INTEGER,
@@ -43,31 +123,169 @@ def init_db():
       status     TEXT,
       groups_json TEXT,
       qris_payload TEXT
-      -- jangan paksa created_at di sini kalau skema lama belum ada
     )
     """)
-
-    # invite_logs
-    cur.execute("""
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS invite_logs (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       invoice_id TEXT,
       group_id   TEXT,
       invite_link TEXT,
       error      TEXT
-      -- kolom created_at opsional
     )
     """)
+    # qr_jobs: penanda "QR invoice ini sedang di-scrape" (single-flight lintas proses)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS qr_jobs (
+      invoice_id TEXT PRIMARY KEY,
+      owner      TEXT,
+      started_at INTEGER
+    )
+    """)
+    # selector_stats: statistik hit/miss selector scraper (lihat selector_stats.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS selector_stats (
+      grp          TEXT,
+      selector     TEXT,
+      hits         INTEGER,
+      misses       INTEGER,
+      samples_json TEXT,
+      updated_at   INTEGER,
+      PRIMARY KEY (grp, selector)
+    )
+    """)
+
+def _m002_timestamps(conn):
+    _add_column(conn, "invoices", "created_at", "INTEGER")
+    _add_column(conn, "invoices", "paid_at", "INTEGER")
+    _add_column(conn, "invite_logs", "created_at", "INTEGER")
+
+def _m003_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invite_logs_invoice ON invite_logs(invoice_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_created ON invoices(created_at)")
+
+def _m004_qr_blobs(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS qr_blobs (
+      hash       TEXT PRIMARY KEY,
+      mime       TEXT,
+      data       BLOB,
+      created_at INTEGER
+    )
+    """)
+    _add_column(conn, "invoices", "qr_hash", "TEXT")
+    # data URL lama di qris_payload -> bytes di qr_blobs
+    rows = conn.execute(
+        "SELECT invoice_id, qris_payload FROM invoices WHERE qris_payload LIKE 'data:%'"
+    ).fetchall()
+    for r in rows:
+        head, _, b64 = (r["qris_payload"] or "").partition(";base64,")
+        try:
+            data = base64.b64decode(b64)
+        except Exception:
+            continue
+        h = _put_blob(conn, data, head[len("data:"):] or "image/png")
+        conn.execute("UPDATE invoices SET qr_hash=?, qris_payload=NULL WHERE invoice_id=?", (h, r["invoice_id"]))
+
+def _m005_retention_indexes(conn):
+    # dipakai retention.py (scan per status/umur) + hapus blob yatim
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_status_created ON invoices(status, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_qr_hash ON invoices(qr_hash)")
+
+def _m006_invite_outbox(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS invite_outbox (
+      id          INTEGER PRIMARY KEY AUTOINCREMENT,
+      invoice_id  TEXT NOT NULL,
+      group_id    TEXT NOT NULL,
+      user_id     INTEGER,
+      state       TEXT NOT NULL DEFAULT 'pending',
+      attempts    INTEGER NOT NULL DEFAULT 0,
+      next_at     INTEGER NOT NULL DEFAULT 0,
+      lease_owner TEXT,
+      lease_until INTEGER,
+      last_error  TEXT,
+      created_at  INTEGER,
+      updated_at  INTEGER,
+      UNIQUE (invoice_id, group_id)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invite_outbox_due ON invite_outbox(state, next_at)")
 
-    # 🔧 migrasi ringan: tambahkan created_at bila belum ada (opsional)
-    if not _table_has_column(conn, "invite_logs", "created_at"):
+def _m007_webhook_events(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS webhook_events (
+      event_key   TEXT PRIMARY KEY,
+      invoice_id  TEXT,
+      received_at INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_webhook_events_received ON webhook_events(received_at)")
+
+def _groups_key(groups: List[str]) -> str:
+    return ",".join(sorted({str(g) for g in groups}))
+
+def _m008_invoice_reuse(conn):
+    _add_column(conn, "invoices", "groups_key", "TEXT")
+    rows = conn.execute("SELECT invoice_id, groups_json FROM invoices WHERE status='PENDING'").fetchall()
+    for r in rows:
         try:
-            cur.execute('ALTER TABLE invite_logs ADD COLUMN created_at INTEGER')
+            groups = json.loads(r["groups_json"] or "[]")
         except Exception:
-            pass  # abaikan kalau SQLite lama tidak bisa; fungsi add_invite_log akan menyesuaikan
+            continue
+        conn.execute("UPDATE invoices SET groups_key=? WHERE invoice_id=?", (_groups_key(groups), r["invoice_id"]))
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_invoices_reuse ON invoices(user_id, groups_key, amount, status, created_at)"
+    )
+
+def _m009_meta(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS meta (
+      key        TEXT PRIMARY KEY,
+      value      TEXT,
+      updated_at INTEGER
+    )
+    """)
 
+MIGRATIONS = [
+    (1, "base tables", _m001_base),
+    (2, "created_at / paid_at columns", _m002_timestamps),
+    (3, "indexes invite_logs.invoice_id, invoices.created_at", _m003_indexes),
+    (4, "qr_blobs + invoices.qr_hash", _m004_qr_blobs),
+    (5, "indexes invoices(status, created_at), invoices.qr_hash", _m005_retention_indexes),
+    (6, "invite_outbox", _m006_invite_outbox),
+    (7, "webhook_events", _m007_webhook_events),
+    (8, "invoices.groups_key + reuse index", _m008_invoice_reuse),
+    (9, "meta", _m009_meta),
+]
+
+SCHEMA_VERSION = 0  # versi skema setelah init_db (diketahui di memori, tanpa introspeksi)
+
+
+def init_db():
+    """Terapkan migrasi yang belum jalan. Aman dipanggil paralel dari beberapa proses."""
+    global SCHEMA_VERSION
+    conn = _conn()
+    conn.commit()  # tutup transaksi implisit (kalau ada) sebelum DDL
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at INTEGER)")
     conn.commit()
-    conn.close()
+
+    for version, name, fn in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")  # kunci tulis: proses lain menunggu di sini
+        try:
+            done = conn.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone()
+            if not done:
+                fn(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, int(time.time())),
+                )
+                print(f"[storage] migrated schema to v{version}: {name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    SCHEMA_VERSION = MIGRATIONS[-1][0]
 
 
 # ---------- helpers ----------
@@ -79,103 +297,461 @@ def create_invoice(user_id: int, groups: List[str], amount: int) -> Dict[str, An
     invoice_id = str(uuid.uuid4())
     groups_json = json.dumps(groups, ensure_ascii=False)
     now = int(time.time())
+    sql = """
+        INSERT INTO invoices (invoice_id, user_id, amount, groups_json, groups_key, status, created_at)
+        VALUES (?, ?, ?, ?, ?, 'PENDING', ?)
+    """
+    args = (invoice_id, user_id, amount, groups_json, _groups_key(groups), now)
     conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO invoices (invoice_id, user_id, amount, groups_json, status, created_at)
-        VALUES (?, ?, ?, ?, 'PENDING', ?)
-    """, (invoice_id, user_id, amount, groups_json, now))
-    conn.commit()
-    cur.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,))
-    row = cur.fetchone()
-    conn.close()
+    with conn:
+        if _HAS_RETURNING:
+            row = conn.execute(sql + " RETURNING *", args).fetchone()
+        else:
+            conn.execute(sql, args)
+            row = conn.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,)).fetchone()
     return _row_to_dict(row)
 
+def find_reusable_invoice(user_id: int, groups: List[str], amount: int, created_after: int) -> Optional[Dict[str, Any]]:
+    """Invoice PENDING terbaru dengan user, set grup & amount sama (idx_invoices_reuse)."""
+    row = _get_conn().execute("""
+        SELECT * FROM invoices
+        WHERE user_id=? AND groups_key=? AND amount=? AND status='PENDING' AND created_at >= ?
+        ORDER BY created_at DESC LIMIT 1
+    """, (user_id, _groups_key(groups), amount, created_after)).fetchone()
+    return _row_to_dict(row) if row else None
+
 def get_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _get_conn().execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,)).fetchone()
     return _row_to_dict(row) if row else None
 
 def list_invoices(limit: int = 20) -> List[Dict[str, Any]]:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM invoices ORDER BY created_at DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
-    conn.close()
+    rows = _get_conn().execute("SELECT * FROM invoices ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
     return [_row_to_dict(r) for r in rows]
 
 def update_invoice_status(invoice_id: str, status: str) -> Optional[Dict[str, Any]]:
     status = status.upper()
     now = int(time.time()) if status == "PAID" else None
-    conn = _get_conn()
-    cur = conn.cursor()
     if status == "PAID":
-        cur.execute("UPDATE invoices SET status='PAID', paid_at=? WHERE invoice_id=?", (now, invoice_id))
+        # sudah PAID → tidak disentuh (paid_at pertama dipertahankan)
+        sql = "UPDATE invoices SET status='PAID', paid_at=? WHERE invoice_id=? AND status != 'PAID'"
+        args = (now, invoice_id)
     else:
-        cur.execute("UPDATE invoices SET status=? WHERE invoice_id=?", (status, invoice_id))
-    conn.commit()
-    cur.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,))
-    row = cur.fetchone()
-    conn.close()
+        sql, args = "UPDATE invoices SET status=? WHERE invoice_id=?", (status, invoice_id)
+    conn = _get_conn()
+    with conn:
+        row = conn.execute(sql + " RETURNING *", args).fetchone() if _HAS_RETURNING else None
+        if row is None:
+            if not _HAS_RETURNING:
+                conn.execute(sql, args)
+            row = conn.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,)).fetchone()
     return _row_to_dict(row) if row else None
 
 def mark_paid(invoice_id: str) -> Optional[Dict[str, Any]]:
     return update_invoice_status(invoice_id, "PAID")
 
-def update_qris_payload(invoice_id: str, data_url: str) -> None:
+def get_invoice_status(invoice_id: str) -> Optional[Dict[str, Any]]:
+    """Kolom sempit untuk polling status (tanpa payload/gambar QR)."""
+    row = _get_conn().execute(
+        """SELECT invoice_id, status, paid_at,
+                  (qr_hash IS NOT NULL OR qris_payload IS NOT NULL) AS has_qr
+           FROM invoices WHERE invoice_id = ?""",
+        (invoice_id,),
+    ).fetchone()
+    return _row_to_dict(row) if row else None
+
+def get_invoice_qr(invoice_id: str) -> Optional[Dict[str, Any]]:
+    """Referensi QR invoice: amount, qris_payload (teks QRIS), qr_hash (-> qr_blobs)."""
+    row = _get_conn().execute(
+        "SELECT invoice_id, amount, qris_payload, qr_hash FROM invoices WHERE invoice_id = ?",
+        (invoice_id,),
+    ).fetchone()
+    return _row_to_dict(row) if row else None
+
+# ---------- QR blobs ----------
+def _put_blob(conn, data: bytes, mime: str) -> str:
+    h = hashlib.sha256(data).hexdigest()
+    conn.execute(
+        "INSERT OR IGNORE INTO qr_blobs (hash, mime, data, created_at) VALUES (?, ?, ?, ?)",
+        (h, mime, sqlite3.Binary(data), int(time.time())),
+    )
+    return h
+
+def set_invoice_qr(invoice_id: str, data: bytes, mime: str, text: Optional[str] = None) -> str:
+    """
+    Simpan gambar QR (bytes mentah) + teks QRIS (kalau ada) untuk invoice
+    dalam satu transaksi. Return hash blob.
+    """
+    conn = _get_conn()
+    with conn:
+        h = _put_blob(conn, data, mime)
+        conn.execute(
+            "UPDATE invoices SET qr_hash=?, qris_payload=? WHERE invoice_id=?",
+            (h, text, invoice_id),
+        )
+    return h
+
+def get_qr_blob(blob_hash: str) -> Optional[Tuple[bytes, str]]:
+    row = _get_conn().execute("SELECT data, mime FROM qr_blobs WHERE hash = ?", (blob_hash,)).fetchone()
+    return (row["data"], row["mime"]) if row else None
+
+# ---------- webhook pembayaran (idempotent) ----------
+def _enqueue_invites(conn, invoice_id: str, user_id: int, group_ids: List[str], now: int) -> int:
+    """
+    Satu job outbox per (invoice, grup). Grup yang sudah punya invite_logs sukses
+    (error NULL; termasuk catatan lama sebelum ada outbox) tidak diantrikan lagi.
+    """
+    cur = conn.executemany("""
+        INSERT OR IGNORE INTO invite_outbox (invoice_id, group_id, user_id, state, next_at, created_at, updated_at)
+        SELECT ?, ?, ?, 'pending', ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM invite_logs
+                          WHERE invoice_id = ? AND group_id = ? AND error IS NULL)
+    """, [(invoice_id, str(g), user_id, now, now, now, invoice_id, str(g)) for g in group_ids])
+    return max(0, cur.rowcount)
+
+def _ingest_paid(conn, event_key: str, invoice_id: str, now: int) -> Optional[Dict[str, Any]]:
+    inv = conn.execute(
+        "SELECT invoice_id, user_id, groups_json, status, paid_at FROM invoices WHERE invoice_id = ?",
+        (invoice_id,),
+    ).fetchone()
+    if inv is None:
+        return None
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO webhook_events (event_key, invoice_id, received_at) VALUES (?, ?, ?)",
+        (event_key, invoice_id, now),
+    )
+    if cur.rowcount != 1:
+        return {"duplicate": True, "transitioned": False, "queued": 0, "invoice": _row_to_dict(inv)}
+    cur = conn.execute(
+        "UPDATE invoices SET status='PAID', paid_at=? WHERE invoice_id=? AND status IN ('PENDING', 'EXPIRED')",
+        (now, invoice_id),
+    )
+    transitioned = cur.rowcount == 1
+    try:
+        groups = json.loads(inv["groups_json"] or "[]")
+    except Exception:
+        groups = []
+    queued = _enqueue_invites(conn, invoice_id, inv["user_id"], groups, now)
+    out = _row_to_dict(inv)
+    if transitioned:
+        out.update(status="PAID", paid_at=now)
+    return {"duplicate": False, "transitioned": transitioned, "queued": max(0, queued), "invoice": out}
+
+def ingest_paid_event(event_key: str, invoice_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Satu transaksi: catat event_key, PENDING/EXPIRED -> PAID (UPDATE bersyarat,
+    paid_at tidak ditimpa), antrikan undangan semua grup invoice.
+    Return None kalau invoice tidak ada (event TIDAK dicatat, retry boleh
+    diproses ulang), selain itu {"duplicate", "transitioned", "queued", "invoice"}.
+    """
+    conn = _get_conn()
+    with conn:
+        return _ingest_paid(conn, event_key, invoice_id, int(time.time()))
+
+def ingest_paid_events(items: List[Tuple[str, str]]) -> List[Optional[Dict[str, Any]]]:
+    """Versi batch (event_key, invoice_id) dalam SATU transaksi (dipakai reconcile.py)."""
+    now = int(time.time())
+    conn = _get_conn()
+    with conn:
+        return [_ingest_paid(conn, key, invoice_id, now) for key, invoice_id in items]
+
+def prune_webhook_events(before: int, limit: int) -> int:
+    conn = _get_conn()
+    with conn:
+        cur = conn.execute("""
+            DELETE FROM webhook_events WHERE event_key IN (
+              SELECT event_key FROM webhook_events WHERE received_at < ? LIMIT ?)
+        """, (before, limit))
+        return cur.rowcount
+
+def list_open_invoices(created_after: int) -> Dict[str, int]:
+    """invoice_id -> amount untuk invoice PENDING/EXPIRED sejak created_after (idx_invoices_status_created)."""
+    rows = _get_conn().execute(
+        "SELECT invoice_id, amount FROM invoices WHERE status IN ('PENDING', 'EXPIRED') AND created_at >= ?",
+        (created_after,),
+    ).fetchall()
+    return {r[0]: r[1] or 0 for r in rows}
+
+# ---------- meta ----------
+def get_meta(key: str) -> Optional[str]:
+    row = _get_conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_meta(key: str, value: str) -> None:
+    conn = _get_conn()
+    with conn:
+        conn.execute("""
+            INSERT INTO meta (key, value, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+        """, (key, value, int(time.time())))
+
+# ---------- retention (batch kecil; lihat retention.py) ----------
+def expire_pending(created_before: int, limit: int) -> List[str]:
+    """PENDING yang dibuat sebelum created_before -> EXPIRED. Return invoice_id yang berubah."""
+    pick = """SELECT invoice_id FROM invoices
+              WHERE status='PENDING' AND created_at < ? LIMIT ?"""
+    conn = _get_conn()
+    with conn:
+        ids = [r[0] for r in conn.execute(pick, (created_before, limit)).fetchall()]
+        if ids:
+            conn.executemany(
+                "UPDATE invoices SET status='EXPIRED' WHERE invoice_id=? AND status='PENDING'",
+                [(i,) for i in ids],
+            )
+    return ids
+
+def drop_qr(before: int, limit: int) -> List[str]:
+    """Lepas QR (teks + referensi blob) invoice PAID/EXPIRED yang lebih tua dari before."""
+    pick = """SELECT invoice_id FROM invoices
+              WHERE status IN ('PAID', 'EXPIRED')
+                AND (qr_hash IS NOT NULL OR qris_payload IS NOT NULL)
+                AND COALESCE(paid_at, created_at) < ?
+              LIMIT ?"""
+    conn = _get_conn()
+    with conn:
+        ids = [r[0] for r in conn.execute(pick, (before, limit)).fetchall()]
+        if ids:
+            conn.executemany(
+                "UPDATE invoices SET qris_payload=NULL, qr_hash=NULL WHERE invoice_id=?",
+                [(i,) for i in ids],
+            )
+    return ids
+
+def delete_orphan_blobs(limit: int) -> int:
+    """Hapus qr_blobs yang tidak lagi dirujuk invoice mana pun."""
+    conn = _get_conn()
+    with conn:
+        cur = conn.execute("""
+            DELETE FROM qr_blobs WHERE hash IN (
+              SELECT b.hash FROM qr_blobs b
+              WHERE NOT EXISTS (SELECT 1 FROM invoices i WHERE i.qr_hash = b.hash)
+              LIMIT ?)
+        """, (limit,))
+        return cur.rowcount
+
+def select_archivable(created_before: int, limit: int) -> List[Dict[str, Any]]:
+    """
+    Invoice non-PENDING yang lebih tua dari created_before, lengkap dengan
+    invite_logs + invite_outbox-nya. Invoice yang undangannya masih antri /
+    sedang dikirim dilewati.
+    """
+    conn = _get_conn()
+    rows = conn.execute("""
+        SELECT invoice_id, user_id, amount, groups_json, status, qris_payload, paid_at, created_at
+        FROM invoices i WHERE status IN ('PAID', 'EXPIRED') AND created_at < ?
+          AND NOT EXISTS (SELECT 1 FROM invite_outbox o
+                          WHERE o.invoice_id = i.invoice_id AND o.state IN ('pending', 'sending'))
+        ORDER BY created_at LIMIT ?
+    """, (created_before, limit)).fetchall()
+    out = [_row_to_dict(r) for r in rows]
+    if not out:
+        return out
+    # anak-anaknya diambil per batch (satu query per tabel), bukan per invoice
+    ids = [inv["invoice_id"] for inv in out]
+    marks = ",".join("?" * len(ids))
+    logs: Dict[str, List[Dict[str, Any]]] = {}
+    for r in conn.execute(f"""
+        SELECT invoice_id, group_id, invite_link, error, created_at
+        FROM invite_logs WHERE invoice_id IN ({marks}) ORDER BY id
+    """, ids).fetchall():
+        logs.setdefault(r["invoice_id"], []).append(_row_to_dict(r))
+    outbox: Dict[str, List[Dict[str, Any]]] = {}
+    for r in conn.execute(f"""
+        SELECT invoice_id, group_id, state, attempts, last_error, created_at, updated_at
+        FROM invite_outbox WHERE invoice_id IN ({marks}) ORDER BY id
+    """, ids).fetchall():
+        outbox.setdefault(r["invoice_id"], []).append(_row_to_dict(r))
+    for inv in out:
+        inv["invite_logs"] = logs.get(inv["invoice_id"], [])
+        inv["invite_outbox"] = outbox.get(inv["invoice_id"], [])
+    return out
+
+def delete_invoices(invoice_ids: List[str]) -> int:
+    """Hapus invoice + invite_logs + invite_outbox-nya (setelah diarsipkan), satu transaksi."""
+    args = [(i,) for i in invoice_ids]
+    conn = _get_conn()
+    with conn:
+        conn.executemany("DELETE FROM invite_logs WHERE invoice_id=?", args)
+        conn.executemany("DELETE FROM invite_outbox WHERE invoice_id=?", args)
+        cur = conn.executemany("DELETE FROM invoices WHERE invoice_id=?", args)
+        return cur.rowcount
+
+def auto_vacuum_mode() -> int:
+    """0=NONE, 1=FULL, 2=INCREMENTAL."""
+    return _get_conn().execute("PRAGMA auto_vacuum").fetchone()[0]
+
+def incremental_vacuum(pages: int) -> int:
+    """Kembalikan maks. `pages` halaman kosong ke OS. Return sisa freelist."""
+    conn = _get_conn()
+    # execute() hanya men-step sekali (= 1 halaman); executescript jalan sampai selesai
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def convert_incremental_vacuum() -> None:
+    """DB lama (auto_vacuum=NONE) -> INCREMENTAL. Butuh VACUUM penuh: jalankan saat sepi."""
     conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE invoices SET qris_payload=? WHERE invoice_id=?", (data_url, invoice_id))
     conn.commit()
-    conn.close()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+
+# ---------- qr jobs (single-flight lintas proses) ----------
+def claim_qr_job(invoice_id: str, owner: str, stale_after: int = 120) -> bool:
+    """
+    Coba klaim hak generate QR untuk invoice. True kalau berhasil.
+    Klaim lama (> stale_after detik, mis. proses mati) dianggap basi dan diambil alih.
+    """
+    now = int(time.time())
+    conn = _get_conn()
+    with conn:
+        conn.execute("DELETE FROM qr_jobs WHERE invoice_id=? AND started_at < ?", (invoice_id, now - stale_after))
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO qr_jobs (invoice_id, owner, started_at) VALUES (?, ?, ?)",
+            (invoice_id, owner, now),
+        )
+        return cur.rowcount == 1
+
+def release_qr_job(invoice_id: str, owner: str) -> None:
+    conn = _get_conn()
+    with conn:
+        conn.execute("DELETE FROM qr_jobs WHERE invoice_id=? AND owner=?", (invoice_id, owner))
+
+def get_qr_job(invoice_id: str) -> Optional[Dict[str, Any]]:
+    row = _get_conn().execute("SELECT * FROM qr_jobs WHERE invoice_id = ?", (invoice_id,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+# ---------- selector stats ----------
+def load_selector_stats() -> List[Dict[str, Any]]:
+    rows = _get_conn().execute("SELECT grp, selector, hits, misses, samples_json FROM selector_stats").fetchall()
+    out = []
+    for r in rows:
+        try:
+            samples = json.loads(r["samples_json"] or "[]")
+        except Exception:
+            samples = []
+        out.append({"grp": r["grp"], "selector": r["selector"],
+                    "hits": r["hits"] or 0, "misses": r["misses"] or 0, "samples": samples})
+    return out
+
+def save_selector_stats(rows: List[Dict[str, Any]]) -> None:
+    now = int(time.time())
+    conn = _get_conn()
+    with conn:
+        conn.executemany("""
+            INSERT INTO selector_stats (grp, selector, hits, misses, samples_json, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(grp, selector) DO UPDATE SET
+              hits=excluded.hits, misses=excluded.misses,
+              samples_json=excluded.samples_json, updated_at=excluded.updated_at
+        """, [(r["grp"], r["selector"], r["hits"], r["misses"], json.dumps(r["samples"]), now) for r in rows])
+
+# ---------- invite outbox (lihat invites.py) ----------
+def enqueue_invites(invoice_id: str, user_id: int, group_ids: List[str]) -> int:
+    """
+    Satu job per (invoice, grup); yang sudah ada di outbox / sudah sukses di
+    invite_logs diabaikan. Return jumlah job baru.
+    """
+    conn = _get_conn()
+    with conn:
+        return _enqueue_invites(conn, invoice_id, user_id, group_ids, int(time.time()))
+
+def claim_invites(owner: str, lease_seconds: int, limit: int = 1) -> List[Dict[str, Any]]:
+    """
+    Ambil job yang jatuh tempo (pending & next_at lewat, atau sending dengan lease
+    kedaluwarsa = pemilik mati) dan pasang lease atas nama owner.
+    """
+    now = int(time.time())
+    sql = """
+        UPDATE invite_outbox
+        SET state='sending', lease_owner=?, lease_until=?, attempts=attempts+1, updated_at=?
+        WHERE id IN (
+          SELECT id FROM invite_outbox
+          WHERE (state='pending' AND next_at <= ?) OR (state='sending' AND lease_until < ?)
+          ORDER BY next_at LIMIT ?)
+    """
+    args = (owner, now + lease_seconds, now, now, now, limit)
+    conn = _get_conn()
+    with conn:
+        if _HAS_RETURNING:
+            rows = conn.execute(sql + " RETURNING *", args).fetchall()
+        else:
+            conn.execute(sql, args)
+            rows = conn.execute(
+                "SELECT * FROM invite_outbox WHERE state='sending' AND lease_owner=? AND updated_at=?",
+                (owner, now),
+            ).fetchall()
+    return [_row_to_dict(r) for r in rows]
+
+def complete_invite(job_id: int, owner: str, invoice_id: str, group_id: str, invite_link: Optional[str]) -> bool:
+    """Job terkirim: state sent + catat di invite_logs (satu transaksi). False kalau lease sudah lepas."""
+    now = int(time.time())
+    conn = _get_conn()
+    with conn:
+        cur = conn.execute("""
+            UPDATE invite_outbox SET state='sent', lease_owner=NULL, lease_until=NULL, last_error=NULL, updated_at=?
+            WHERE id=? AND lease_owner=?
+        """, (now, job_id, owner))
+        if cur.rowcount != 1:
+            return False
+        conn.execute("""
+            INSERT INTO invite_logs (invoice_id, group_id, invite_link, error, created_at) VALUES (?,?,?,?,?)
+        """, (invoice_id, group_id, invite_link or "(sent)", None, now))
+    return True
+
+def fail_invite(job_id: int, owner: str, invoice_id: str, group_id: str, error: str, retry_at: Optional[int]) -> None:
+    """Percobaan gagal: jadwalkan ulang (retry_at) atau tandai failed (retry_at=None)."""
+    now = int(time.time())
+    conn = _get_conn()
+    with conn:
+        cur = conn.execute("""
+            UPDATE invite_outbox
+            SET state=?, next_at=COALESCE(?, next_at), lease_owner=NULL, lease_until=NULL, last_error=?, updated_at=?
+            WHERE id=? AND lease_owner=?
+        """, ("pending" if retry_at is not None else "failed", retry_at, error, now, job_id, owner))
+        if cur.rowcount == 1:
+            conn.execute("""
+                INSERT INTO invite_logs (invoice_id, group_id, invite_link, error, created_at) VALUES (?,?,?,?,?)
+            """, (invoice_id, group_id, None, error, now))
+
+def requeue_failed_invites(invoice_id: str) -> int:
+    """Job failed milik invoice -> pending lagi (percobaan manual)."""
+    now = int(time.time())
+    conn = _get_conn()
+    with conn:
+        cur = conn.execute("""
+            UPDATE invite_outbox SET state='pending', attempts=0, next_at=?, updated_at=?
+            WHERE invoice_id=? AND state='failed'
+        """, (now, now, invoice_id))
+        return cur.rowcount
+
+def list_outbox(invoice_id: str) -> List[Dict[str, Any]]:
+    rows = _get_conn().execute(
+        "SELECT * FROM invite_outbox WHERE invoice_id=? ORDER BY id", (invoice_id,)
+    ).fetchall()
+    return [_row_to_dict(r) for r in rows]
+
+def outbox_counts() -> Dict[str, int]:
+    rows = _get_conn().execute("SELECT state, COUNT(*) FROM invite_outbox GROUP BY state").fetchall()
+    return {r[0]: r[1] for r in rows}
 
 # ---------- invite logs ----------
 def add_invite_log(invoice_id: str, group_id: str, invite_link: str | None, error: str | None):
     conn = _conn()
-    cur  = conn.cursor()
-    has_created = _table_has_column(conn, "invite_logs", "created_at")
-    now = int(time.time())
-
-    if has_created:
-        cur.execute("""
+    with conn:
+        conn.execute("""
             INSERT INTO invite_logs (invoice_id, group_id, invite_link, error, created_at)
             VALUES (?,?,?,?,?)
-        """, (invoice_id, str(group_id), invite_link, error, now))
-    else:
-        cur.execute("""
-            INSERT INTO invite_logs (invoice_id, group_id, invite_link, error)
-            VALUES (?,?,?,?)
-        """, (invoice_id, str(group_id), invite_link, error))
-    conn.commit()
-    conn.close()
+        """, (invoice_id, str(group_id), invite_link, error, int(time.time())))
 
 
 def list_invite_logs(invoice_id: str):
-    conn = _conn()
-    cur  = conn.cursor()
-    # pilih kolom secara defensif (created_at mungkin tidak ada)
-    has_created = _table_has_column(conn, "invite_logs", "created_at")
-    if has_created:
-        cur.execute("""SELECT invoice_id, group_id, invite_link, error, created_at
-                       FROM invite_logs WHERE invoice_id=? ORDER BY id ASC""", (invoice_id,))
-    else:
-        cur.execute("""SELECT invoice_id, group_id, invite_link, error
-                       FROM invite_logs WHERE invoice_id=? ORDER BY id ASC""", (invoice_id,))
-    rows = cur.fetchall()
-    conn.close()
-
-    items = []
-    for r in rows:
-        item = {
+    rows = _conn().execute("""SELECT invoice_id, group_id, invite_link, error, created_at
+                              FROM invite_logs WHERE invoice_id=? ORDER BY id ASC""", (invoice_id,)).fetchall()
+    return [
+        {
             "invoice_id": r[0],
             "group_id":   r[1],
             "invite_link": r[2],
             "error":       r[3],
+            "created_at":  r[4],
         }
-        if has_created:
-            item["created_at"] = r[4]
-        items.append(item)
-    return items
+        for r in rows
+    ]
@@ -0,0 +1,142 @@
+# app/timings.py
+# ------------------------------------------------------------
+# Instrumentasi waktu per fase untuk flow scraper:
+#   @timings.flow("qr_hd")               # satu eksekusi flow (atau: with timings.run(...))
+#       with timings.span("goto"): ...   # fase bertimer
+#       timings.branch("checkout", "new_tab")   # cabang/fallback yang diambil
+#
+# Semua data diagregasi in-memory (histogram bucket tetap + sampel terakhir
+# untuk p50/p95) per "<flow>.<fase>", dan bisa dilihat di /debug/timings
+# (reset: POST /debug/timings/reset; keduanya hanya di ENV != prod).
+# Run aktif disimpan di contextvar sehingga job paralel tidak tercampur.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import functools
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+SAMPLES_KEEP = 200
+
+_RUN: ContextVar[Optional[dict]] = ContextVar("scrape_run", default=None)
+
+# "<flow>.<fase>" -> {"count", "sum_ms", "max_ms", "buckets": [..], "samples": deque}
+_HIST: Dict[str, dict] = {}
+# "<flow>.<jenis>" -> {"<cabang>": n}
+_BRANCHES: Dict[str, Dict[str, int]] = {}
+# "<flow>" -> {"ok": n, "error": n}
+_RUNS: Dict[str, Dict[str, int]] = {}
+
+
+def _observe(key: str, ms: float):
+    h = _HIST.get(key)
+    if h is None:
+        h = _HIST[key] = {
+            "count": 0, "sum_ms": 0.0, "max_ms": 0.0,
+            "buckets": [0] * (len(BUCKETS_MS) + 1),
+            "samples": deque(maxlen=SAMPLES_KEEP),
+        }
+    h["count"] += 1
+    h["sum_ms"] += ms
+    h["max_ms"] = max(h["max_ms"], ms)
+    i = 0
+    while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+        i += 1
+    h["buckets"][i] += 1
+    h["samples"].append(ms)
+
+
+def _flow() -> str:
+    r = _RUN.get()
+    return r["flow"] if r else "adhoc"
+
+
+@contextmanager
+def run(flow: str):
+    """Satu eksekusi flow; total durasi dicatat sebagai '<flow>.total'."""
+    rec = {"flow": flow, "ok": False, "branches": {}}
+    token = _RUN.set(rec)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        _RUN.reset(token)
+        _observe(f"{flow}.total", (time.perf_counter() - t0) * 1000)
+        outcome = "ok" if rec["ok"] else "error"
+        _RUNS.setdefault(flow, {"ok": 0, "error": 0})[outcome] += 1
+
+
+def ok():
+    """Tandai run aktif sukses (hasil didapat)."""
+    r = _RUN.get()
+    if r is not None:
+        r["ok"] = True
+
+
+def flow(name: str):
+    """Decorator fungsi async: bungkus dengan run(name); hasil truthy = sukses."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with run(name):
+                result = await fn(*args, **kwargs)
+                if result:
+                    ok()
+                return result
+        return wrapper
+    return deco
+
+
+@contextmanager
+def span(phase: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe(f"{_flow()}.{phase}", (time.perf_counter() - t0) * 1000)
+
+
+def branch(kind: str, name: str):
+    """Catat cabang yang diambil, mis. branch("checkout", "iframe")."""
+    r = _RUN.get()
+    if r is not None:
+        r["branches"][kind] = name
+    counts = _BRANCHES.setdefault(f"{_flow()}.{kind}", {})
+    counts[name] = counts.get(name, 0) + 1
+
+
+def _pct(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    vals = sorted(values)
+    return round(vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))], 1)
+
+
+def snapshot() -> Dict[str, Any]:
+    phases = {}
+    for key in sorted(_HIST):
+        h = _HIST[key]
+        samples = list(h["samples"])
+        phases[key] = {
+            "count": h["count"],
+            "avg_ms": round(h["sum_ms"] / h["count"], 1),
+            "p50_ms": _pct(samples, 0.50),
+            "p95_ms": _pct(samples, 0.95),
+            "max_ms": round(h["max_ms"], 1),
+            "buckets": {
+                (f"le_{b}" if i < len(BUCKETS_MS) else "inf"): n
+                for i, (b, n) in enumerate(zip(BUCKETS_MS + (None,), h["buckets"]))
+            },
+        }
+    return {"runs": _RUNS, "phases": phases, "branches": _BRANCHES}
+
+
+def reset():
+    _HIST.clear()
+    _BRANCHES.clear()
+    _RUNS.clear()
@@ -342,21 +342,96 @@ async function onPay(){
   const qrPngUrl = `${window.location.origin}/api/qr/${inv.invoice_id}.png?amount=${amount}&t=${Date.now()}`;
   showQRModal(`
     <div><b>Pembayaran GoPay</b></div>
-    <div style="margin:8px 0 12px; opacity:.85">QRIS sedang dimuat…</div>
-    <img alt="QR" src="${qrPngUrl}">
+    <div id="qrHint" style="margin:8px 0 12px; opacity:.85">${inv.has_qr ? "Scan QRIS di bawah" : "QRIS sedang dimuat…"}</div>
+    <img alt="QR" id="qrImg" src="${qrPngUrl}">
     <button class="close" id="closeModal">Tutup</button>
   `);
   document.getElementById('closeModal')?.addEventListener('click', hideQRModal);
 
-  const statusUrl = `${window.location.origin}/api/invoice/${inv.invoice_id}/status`;
-  let t = setInterval(async ()=>{
+  // server sibuk (503 + Retry-After) → <img> gagal; coba lagi beberapa kali
+  const qrImg = document.getElementById('qrImg');
+  let qrRetries = 0;
+  qrImg?.addEventListener('error', () => {
+    if (qrRetries++ >= 5 || document.getElementById('qr')?.hidden) return;
+    setTimeout(() => {
+      qrImg.src = qrPngUrl.replace(/t=\d+/, `t=${Date.now()}`);
+    }, 3000 * qrRetries);
+  });
+
+  watchInvoice(inv.invoice_id);
+}
+
+// Status invoice: SSE (/events) bila didukung, polling /status sebagai fallback.
+// Invoice tidak ada lagi (404) → berhenti, tidak polling selamanya.
+let stopWatch = null;
+function watchInvoice(invoiceId){
+  stopWatch?.();
+  const base = `${window.location.origin}/api/invoice/${invoiceId}`;
+  let es = null, timer = null, done = false;
+
+  const stop = () => {
+    done = true;
+    es?.close(); es = null;
+    if (timer) clearInterval(timer);
+    timer = null;
+    if (stopWatch === stop) stopWatch = null;
+  };
+  const onStatus = (s) => {
+    if (done || document.getElementById('qr')?.hidden) return stop();
+    if (s.status === "PAID"){ stop(); hideQRModal(); tg?.close?.(); }
+    else if (s.status === "EXPIRED"){
+      stop();
+      showQRModal(`<div>Invoice kedaluwarsa. Silakan buat pembayaran baru.</div>
+        <button class="close" id="closeModal">Tutup</button>`);
+      document.getElementById('closeModal')?.addEventListener('click', hideQRModal);
+    }
+  };
+  // QR selesai dibuat di background → muat ulang <img> bila belum tampil
+  const onQrReady = () => {
+    if (done) return;
+    const hint = document.getElementById('qrHint');
+    if (hint) hint.textContent = "Scan QRIS di bawah";
+    const img = document.getElementById('qrImg');
+    if (img && !(img.complete && img.naturalWidth > 0)){
+      img.src = img.src.replace(/t=\d+/, `t=${Date.now()}`);
+    }
+  };
+  const checkStatus = async () => {
     try{
-      const r = await fetch(statusUrl);
-      if(!r.ok) return;
-      const s = await r.json();
-      if (s.status === "PAID"){ clearInterval(t); hideQRModal(); tg?.close?.(); }
+      const r = await fetch(`${base}/status`);
+      if (r.status === 404) return stop();
+      if (r.ok) onStatus(await r.json());
     }catch{}
-  }, 2000);
+  };
+  const poll = () => {
+    if (timer || done) return;
+    timer = setInterval(()=>{
+      if (document.getElementById('qr')?.hidden) return stop();
+      checkStatus();
+    }, 2000);
+  };
+
+  if (window.EventSource){
+    let opened = false;
+    es = new EventSource(`${base}/events`);
+    es.addEventListener('open', () => { opened = true; });
+    for (const ev of ["status", "paid", "expired"]){
+      es.addEventListener(ev, (e) => { try{ onStatus(JSON.parse(e.data)); }catch{} });
+    }
+    es.addEventListener('qr_ready', onQrReady);
+    // belum pernah terhubung (proxy/jaringan tidak mendukung) atau ditolak server
+    // (mis. 404: EventSource menyerah) → cek /status sekali: 404 berhenti, selain itu polling;
+    // putus biasa setelah terhubung → EventSource reconnect sendiri
+    es.addEventListener('error', async () => {
+      if (done || !es || (opened && es.readyState !== EventSource.CLOSED)) return;
+      es.close(); es = null;
+      await checkStatus();
+      poll();
+    });
+  } else {
+    poll();
+  }
+  stopWatch = stop;
 }
 
 function showQRModal(html){
@@ -365,6 +440,7 @@ function showQRModal(html){
   m.hidden = false;
 }
 function hideQRModal(){
+  stopWatch?.();
   const m = document.getElementById('qr');
   m.hidden = true;
   m.innerHTML = '';
@@ -0,0 +1,99 @@
+# app/workers.py
+# ------------------------------------------------------------
+# Worker proses untuk scraper (opsional):
+#  - N proses terpisah, masing-masing punya event loop + Chromium sendiri
+#    sehingga render/screenshot tidak berebut satu core dengan FastAPI
+#  - tiap proses = ProcessPoolExecutor(max_workers=1); loop anak jalan
+#    terus di thread sendiri dan warm pool anak dimulai di loop itu saat job
+#    pertama, jadi job berikutnya dapat halaman profil yang sudah terbuka
+#  - job dibagi ke proses dengan job inflight paling sedikit
+#
+# ENV:
+#   SCRAPER_PROCESS_WORKERS  jumlah proses (default 0 = scraper jalan in-process)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+PROCESS_WORKERS = max(0, int(os.getenv("SCRAPER_PROCESS_WORKERS", "0")))
+
+
+# ---------- sisi proses anak ----------
+_CHILD_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_IN_CHILD = False
+
+
+def _child_loop() -> asyncio.AbstractEventLoop:
+    global _CHILD_LOOP, _IN_CHILD
+    if _CHILD_LOOP is None:
+        from . import scraper
+        _IN_CHILD = True  # di anak scraper jalan in-process (warm pool aktif, tidak dispatch lagi)
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="scraper-loop", daemon=True).start()
+        _CHILD_LOOP = loop
+        asyncio.run_coroutine_threadsafe(scraper.warm_pool_start(), loop)
+    return _CHILD_LOOP
+
+
+def _child_run(fn_name: str, kwargs: Dict[str, Any]):
+    """Dieksekusi di proses anak: jalankan scraper.<fn_name>(**kwargs) di loop persisten."""
+    from . import scraper  # import di anak (spawn), bukan di parent
+    fn = getattr(scraper, fn_name)
+    fut = asyncio.run_coroutine_threadsafe(fn(**kwargs), _child_loop())
+    return fut.result()
+
+
+# ---------- sisi parent ----------
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.inflight = 0
+        self.jobs = 0
+        self.pool = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        )
+
+
+_WORKERS: List[_Worker] = []
+
+
+def enabled() -> bool:
+    return PROCESS_WORKERS > 0 and not _IN_CHILD
+
+
+def _pick() -> _Worker:
+    if not _WORKERS:
+        _WORKERS.extend(_Worker(i) for i in range(PROCESS_WORKERS))
+    return min(_WORKERS, key=lambda w: (w.inflight, w.index))
+
+
+async def run(fn_name: str, **kwargs: Any):
+    """Jalankan fungsi scraper di proses worker yang paling sepi."""
+    w = _pick()
+    w.inflight += 1
+    w.jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(w.pool, _child_run, fn_name, kwargs)
+    finally:
+        w.inflight -= 1
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "process_workers": PROCESS_WORKERS,
+        "workers": [{"index": w.index, "inflight": w.inflight, "jobs": w.jobs} for w in _WORKERS],
+    }
+
+
+def shutdown():
+    """Hentikan semua proses worker (Chromium di anak ikut mati bersama prosesnya)."""
+    for w in _WORKERS:
+        w.pool.shutdown(wait=False, cancel_futures=True)
+    _WORKERS.clear()
@@ -0,0 +1,42 @@
+# Cache invoice payments: baca yang masih menunggu DB tidak boleh menimpa
+# hasil invalidate dari ingest_paid_event / mark_paid yang selesai duluan.
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "test.db"))
+
+from app import astorage, payments, storage  # noqa: E402
+
+storage.init_db()
+
+
+def test_concurrent_read_and_ingest_does_not_cache_stale_status(monkeypatch):
+    inv = storage.create_invoice(1, ["-100"], 1000)
+    invoice_id = inv["invoice_id"]
+    real_read = astorage.get_invoice_status
+
+    async def scenario():
+        read_done, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_read(iid):
+            row = await real_read(iid)  # baris lama (PENDING)
+            read_done.set()
+            await release.wait()        # tertahan sampai ingest selesai
+            return row
+
+        monkeypatch.setattr(astorage, "get_invoice_status", slow_read)
+        reader = asyncio.create_task(payments.get_status(invoice_id))
+        await read_done.wait()
+        res = await payments.ingest_paid_event("id:test-race", invoice_id)
+        assert res["transitioned"]
+        release.set()
+        stale = await reader
+        assert stale["status"] == "PENDING"  # baca itu sendiri memang lama
+
+        monkeypatch.setattr(astorage, "get_invoice_status", real_read)
+        fresh = await payments.get_status(invoice_id)
+        await astorage.shutdown()
+        return fresh
+
+    assert asyncio.run(scenario())["status"] == "PAID"
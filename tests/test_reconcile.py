@@ -0,0 +1,49 @@
+# Rekonsiliasi: backlog yang lebih panjang dari MAX_PAGES halaman tidak boleh
+# dilompati — cursor baru maju setelah scan sampai ke cursor lama.
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "test.db"))
+
+from app import astorage, reconcile, saweria_http, storage  # noqa: E402
+
+storage.init_db()
+
+
+def test_cursor_waits_until_backlog_is_scanned(monkeypatch):
+    inv = storage.create_invoice(7, ["-100"], 1000)
+    invoice_id = inv["invoice_id"]
+    storage.create_invoice(8, ["-100"], 1000)  # tetap terbuka: putaran tidak berhenti lebih awal
+    storage.set_meta(reconcile.CURSOR_KEY, "100")
+    storage.set_meta(reconcile.RESUME_KEY, "")
+
+    # terbaru dulu: 10 donasi baru (201..210) lalu yang sudah lama (<= cursor);
+    # donasi untuk invoice kita ada di halaman 4 (PAGE_SIZE=2)
+    history = [
+        {"id": f"d{t}", "amount": 1000, "created_at": t,
+         "message": f"INV:{invoice_id}" if t == 203 else "halo"}
+        for t in range(210, 200, -1)
+    ] + [{"id": f"old{t}", "amount": 1000, "created_at": t, "message": "lama"} for t in (100, 90, 80)]
+
+    async def fetch_donations(page, size):
+        return history[(page - 1) * size: page * size]
+
+    monkeypatch.setattr(saweria_http, "fetch_donations", fetch_donations)
+    monkeypatch.setattr(reconcile, "PAGE_SIZE", 2)
+    monkeypatch.setattr(reconcile, "MAX_PAGES", 2)
+    monkeypatch.setattr(reconcile, "LAG_SEC", 0)
+
+    async def scenario():
+        first = await reconcile.run_once()   # halaman 1-2: belum sampai cursor
+        second = await reconcile.run_once()  # halaman 3-4: invoice ketemu
+        third = await reconcile.run_once()   # halaman 5-6: sampai cursor lama
+        await astorage.shutdown()
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first["cursor"] == 100 and first["resume_page"] == 3
+    assert storage.get_meta(reconcile.CURSOR_KEY) == "210" and third["cursor"] == 210
+    assert second["marked_paid"] == 1
+    assert storage.get_invoice(invoice_id)["status"] == "PAID"
+    assert "resume_page" not in third